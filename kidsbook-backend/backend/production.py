@@ -101,6 +101,14 @@ DATABASES = {
     }
 }
 
+# Cache shared by the server processes, for the revoked tokens, the cached users and the groups of the users
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.environ.get('KIDSBOOK_CACHE_LOCATION', '127.0.0.1:11211'),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
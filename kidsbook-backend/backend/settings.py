@@ -26,6 +26,33 @@ SECRET_KEY = 'a5)t3&0wu-u*8ti(ru_b72vmz8d3pliuuqh8b7i_t^e(aci-1l'
 NOTIFICATION_SECRET_KEY = '1234567890'
 NOTIFICATION_ENDPOINT = 'https://notify.kidsbook.ml/notify'
 
+# Notifications are delivered by background workers ('ASYNC': False delivers them on the request's thread)
+NOTIFICATION_DISPATCHER = {
+    'ASYNC': True,
+    'NUM_WORKERS': 4,
+    'MAX_RETRIES': 3,
+    'RETRY_DELAY': 0.5,
+}
+
+# Set 'BATCH_FORMAT' to 'batch' once the notification server accepts many notifications per request
+NOTIFICATION_PUSH_CLIENT = {
+    'BATCH_FORMAT': 'single',
+    'BATCH_SIZE': 50,
+    'MAX_CONCURRENCY': 4,
+    'POOL_SIZE': 10,
+    'TIMEOUT': 2,
+}
+
+# The users of SLS are cached for 'USER_CACHE_TIMEOUT' seconds, so the logins at the start of a class query SLS once
+SLS_CLIENT = {
+    'POOL_SIZE': 10,
+    'TIMEOUT': 5,
+    'USER_CACHE_TIMEOUT': 30,
+    'MAX_CACHED_USERS': 1000,
+    'FAILURE_THRESHOLD': 5,
+    'RECOVERY_TIMEOUT': 30,
+}
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
@@ -112,6 +139,50 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+# The revoked tokens, the cached users and the groups of the users are shared through the cache.
+# With several server processes, set KIDSBOOK_CACHE_LOCATION to a memcached server ('host:port') shared by all of them,
+# otherwise a process keeps accepting the tokens revoked and the users deactivated by the others
+# (`python manage.py check --deploy` fails on a per-process cache).
+
+CACHE_LOCATION = os.environ.get('KIDSBOOK_CACHE_LOCATION')
+if CACHE_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': CACHE_LOCATION,
+        }
+    }
+else:
+    # A single development server
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+TOKEN_REVOCATION_CACHE = 'default'
+
+# Seconds the IDs of the groups of a user are cached for the access checks
+GROUP_IDS_CACHE_TIMEOUT = 60
+
+# Seconds the authenticated users are cached for (the cache is expired when the user is saved)
+USER_CACHE_TIMEOUT = 60
+
+# Seconds the compiled scenes of a game are cached for (the cache is expired when a scene is saved or deleted)
+GAME_GRAPH_CACHE_TIMEOUT = 3600
+
+# Largest game file accepted, in bytes
+GAME_FILE_MAX_SIZE = 5 * 1024 * 1024
+
+# Set 'BUFFERED' to write the screen time of the heartbeats in batches, every 'FLUSH_INTERVAL' seconds
+SCREEN_TIME_INGESTION = {
+    'BUFFERED': False,
+    'FLUSH_INTERVAL': 10,
+    'MAX_PENDING': 1000,
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -164,7 +235,7 @@ AUTH_USER_MODEL = 'kidsbook.User'
 
 REST_FRAMEWORK = {
   'DEFAULT_AUTHENTICATION_CLASSES': (
-    'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
+    'kidsbook.authentication.CachedJSONWebTokenAuthentication',
   ),
 #   'DEFAULT_PERMISSION_CLASSES': (
 #     'rest_framework.permissions.AllowAny'
@@ -181,6 +252,12 @@ JWT_AUTH = {
 
 CORS_ORIGIN_ALLOW_ALL = True
 
+# Batches of passwords of at least 'MIN_POOL_BATCH_SIZE' are hashed across 'WORKERS' processes (the number of CPUs by default)
+PASSWORD_HASHING = {
+    'WORKERS': None,
+    'MIN_POOL_BATCH_SIZE': 8,
+}
+
 PASSWORD_HASHERS = (
     'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
     'django.contrib.auth.hashers.BCryptPasswordHasher',
@@ -189,4 +266,6 @@ PASSWORD_HASHERS = (
     'django.contrib.auth.hashers.SHA1PasswordHasher',
     'django.contrib.auth.hashers.MD5PasswordHasher',
     'django.contrib.auth.hashers.CryptPasswordHasher',
+    # Default passwords of the accounts created without one, upgraded on the first login
+    'kidsbook.hashing.PlaceholderPasswordHasher',
 )
@@ -2,4 +2,6 @@
 
 # from django.contrib.auth import get_user_model
 
-# User = get_user_model()
\ No newline at end of file
+# User = get_user_model()
+
+default_app_config = 'kidsbook.apps.KidsbookConfig'
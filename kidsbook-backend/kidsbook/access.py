@@ -0,0 +1,75 @@
+from uuid import UUID
+
+from django.conf import settings
+from django.core.cache import cache
+
+from kidsbook.models import Comment, Group, GroupMember, Post, get_group_ids_cache_key
+
+
+def normalize_id(object_id):
+    """Return the ID as a `UUID`, or None if it is not one."""
+    try:
+        return object_id if isinstance(object_id, UUID) else UUID(str(object_id))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+class AccessResolver:
+    """
+    Resolve the access of a user to groups, posts and comments.
+
+    The IDs of the user's groups are loaded once, and kept in the cache for
+    `GROUP_IDS_CACHE_TIMEOUT` seconds (the cache is cleared when the user's memberships change).
+    The groups, posts and comments are fetched once per request, and shared by the permissions and the view.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._group_ids = None
+        self._groups = {}
+        self._posts = {}
+        self._comments = {}
+
+    @property
+    def group_ids(self):
+        if self._group_ids is None:
+            cache_key = get_group_ids_cache_key(self.user.id)
+            group_ids = cache.get(cache_key)
+            if group_ids is None:
+                group_ids = set(GroupMember.objects.filter(user_id=self.user.id).values_list('group_id', flat=True))
+                cache.set(cache_key, group_ids, getattr(settings, 'GROUP_IDS_CACHE_TIMEOUT', 60))
+            self._group_ids = group_ids
+        return self._group_ids
+
+    def is_member(self, group_id):
+        group_id = normalize_id(group_id)
+        return group_id is not None and group_id in self.group_ids
+
+    def get_group(self, group_id):
+        group_id = normalize_id(group_id)
+        if group_id not in self._groups:
+            self._groups[group_id] = Group.objects.get(id=group_id)
+        return self._groups[group_id]
+
+    def get_post(self, post_id):
+        post_id = normalize_id(post_id)
+        if post_id not in self._posts:
+            self._posts[post_id] = Post.objects.select_related('group').get(id=post_id)
+        return self._posts[post_id]
+
+    def get_comment(self, comment_id):
+        comment_id = normalize_id(comment_id)
+        if comment_id not in self._comments:
+            comment = Comment.objects.select_related('post__group').get(id=comment_id)
+            self._comments[comment_id] = comment
+            self._posts.setdefault(comment.post_id, comment.post)
+        return self._comments[comment_id]
+
+
+def get_access_resolver(request):
+    """Return the access resolver of the request, shared by its permissions and its view."""
+    resolver = getattr(request, '_access_resolver', None)
+    if resolver is None or resolver.user != request.user:
+        resolver = AccessResolver(request.user)
+        request._access_resolver = resolver
+    return resolver
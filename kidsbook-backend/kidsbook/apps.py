@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def create_roles(sender, **kwargs):
+    from django.contrib.auth import get_user_model
+    get_user_model().objects.create_roles()
 
 
 class KidsbookConfig(AppConfig):
     name = 'kidsbook'
+
+    def ready(self):
+        # Seed the static roles once, instead of on every user creation
+        post_migrate.connect(create_roles, sender=self)
+
+        # Register the system checks
+        from kidsbook import checks  # noqa: F401
@@ -0,0 +1,65 @@
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.translation import ugettext as _
+from rest_framework import exceptions
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.settings import api_settings
+
+from kidsbook.models import get_user_cache_version_key
+
+
+jwt_get_username_from_payload = api_settings.JWT_PAYLOAD_GET_USERNAME_HANDLER
+
+
+def get_user_cache_key(user_id, version):
+    return 'kidsbook:user:{}:{}'.format(user_id, version)
+
+
+def get_user_cache_version(user_id):
+    """Return the version of the cached user, starting a new one if it was expired."""
+    version_key = get_user_cache_version_key(user_id)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(version_key)
+    return version
+
+
+class CachedJSONWebTokenAuthentication(JSONWebTokenAuthentication):
+    """
+    Load the user of the token (with the role and the teacher) from the cache,
+    for `USER_CACHE_TIMEOUT` seconds.
+
+    The cache key holds a version of the user, which is expired whenever the user is saved or deleted
+    (or written by `forget_users`), so an updated user is never served from the cache.
+    The password hash is deferred, to stay out of the shared cache.
+    The groups of the user are cached apart, by `AccessResolver`.
+    """
+
+    def authenticate_credentials(self, payload):
+        user_id = payload.get('user_id', None)
+        username = jwt_get_username_from_payload(payload)
+        if not user_id or not username:
+            return super().authenticate_credentials(payload)
+
+        version = get_user_cache_version(user_id)
+        cache_key = get_user_cache_key(user_id, version)
+        user = cache.get(cache_key)
+        if user is None or user.get_username() != username:
+            user = self.load_user(username)
+            if version is not None:
+                cache.set(cache_key, user, getattr(settings, 'USER_CACHE_TIMEOUT', 60))
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User account is disabled.'))
+        return user
+
+    def load_user(self, username):
+        User = get_user_model()
+        try:
+            return User.objects.select_related('teacher').defer('password', 'teacher__password').get(**{User.USERNAME_FIELD: username})
+        except User.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid signature.'))
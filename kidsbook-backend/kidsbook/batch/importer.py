@@ -0,0 +1,206 @@
+import threading
+from csv import reader
+from itertools import chain
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connection, transaction
+from django.utils.dateparse import parse_date
+
+from kidsbook.hashing import hash_passwords
+from kidsbook.models import NotificationUser, UserImportJob, UserSetting
+
+
+User = get_user_model()
+
+IMPORT_CHUNK_SIZE = 500
+HEADER_COLUMNS = ('username', 'password', 'email_address')
+USER_COLUMNS = ('username', 'email_address', 'password', 'realname', 'gender', 'is_superuser', 'role',
+                'description', 'sls_id', 'date_of_birth')
+
+
+def iter_csv_rows(file_obj):
+    """
+    Stream the rows of the CSV file, starting from the header:
+    the first line with the columns 'username', 'password' and 'email_address'.
+    Yield the headers, then (line number from the header, values) for every row.
+    The rows after the last one with as many columns as the header are left out
+    (e.g. the end of the wrapper of the request).
+    """
+    lines = (line.decode('utf-8') if isinstance(line, bytes) else line for line in file_obj)
+    for line in lines:
+        if all(column in line for column in HEADER_COLUMNS):
+            break
+    else:
+        raise ValueError('The file has no header with the columns: {}.'.format(', '.join(HEADER_COLUMNS)))
+
+    csv_reader = reader(chain([line], lines))
+    headers = [header.strip() for header in next(csv_reader)]
+    unknown_columns = [header for header in headers if header and header not in USER_COLUMNS]
+    if unknown_columns:
+        raise ValueError('Unknown columns: {}.'.format(', '.join(unknown_columns)))
+
+    yield headers
+    trailing_rows = []
+    for values in csv_reader:
+        if not any(value.strip() for value in values):
+            continue
+        trailing_rows.append((csv_reader.line_num, values))
+        if len(values) == len(headers):
+            yield from trailing_rows
+            trailing_rows = []
+
+
+def parse_user_row(headers, values):
+    """Return the fields of the user of a row, or raise a `ValueError` explaining why the row is invalid."""
+    if len(values) != len(headers):
+        raise ValueError('The row has {} columns instead of {}.'.format(len(values), len(headers)))
+
+    user = {header: value.strip() for header, value in zip(headers, values) if header and value.strip() != ''}
+
+    if user.pop('is_superuser', '0') != '0':
+        raise ValueError('Only Admin-level users can create superusers.')
+    role = user.pop('role', '2')
+    if not role.isdigit() or int(role) <= 1:
+        raise ValueError('Only Admin-level users can create superusers.')
+    if int(role) != 2:
+        raise ValueError('Only students can be imported.')
+
+    if 'username' not in user:
+        raise ValueError('The username is missing.')
+    if 'email_address' not in user:
+        raise ValueError('The email address is missing.')
+    try:
+        validate_email(user['email_address'])
+    except ValidationError:
+        raise ValueError('Invalid email address: {}.'.format(user['email_address']))
+    user['email_address'] = User.objects.normalize_email(user['email_address'])
+
+    try:
+        user['gender'] = int(user.get('gender', 0)) > 0
+    except ValueError:
+        raise ValueError('Invalid gender: {}.'.format(user['gender']))
+    if 'date_of_birth' in user:
+        try:
+            user['date_of_birth'] = parse_date(user['date_of_birth'])
+        except ValueError:
+            user['date_of_birth'] = None
+        if user['date_of_birth'] is None:
+            raise ValueError('Invalid date of birth.')
+    return user
+
+
+def validate_user_rows(file_obj):
+    """
+    Read and validate the users of the CSV file, before creating any of them.
+    Return the valid users, and the errors of the invalid rows ([{'line': ..., 'error': ...}]).
+    """
+    rows = iter_csv_rows(file_obj)
+    headers = next(rows)
+
+    users = []
+    errors = []
+    lines_by_username = {}
+    lines_by_email = {}
+    for line, values in rows:
+        try:
+            user = parse_user_row(headers, values)
+        except ValueError as exc:
+            errors.append({'line': line, 'error': str(exc)})
+            continue
+
+        if user['username'] in lines_by_username:
+            errors.append({'line': line, 'error': 'The display name is already used on line {}.'.format(lines_by_username[user['username']])})
+            continue
+        if user['email_address'] in lines_by_email:
+            errors.append({'line': line, 'error': 'The username is already used on line {}.'.format(lines_by_email[user['email_address']])})
+            continue
+        lines_by_username[user['username']] = line
+        lines_by_email[user['email_address']] = line
+        users.append((line, user))
+
+    # The existing users, with one query per chunk
+    for index in range(0, len(users), IMPORT_CHUNK_SIZE):
+        chunk = users[index:index + IMPORT_CHUNK_SIZE]
+        existing_usernames = set(User.objects.filter(
+            username__in=[user['username'] for _, user in chunk]
+        ).values_list('username', flat=True))
+        existing_emails = set(User.objects.filter(
+            email_address__in=[user['email_address'] for _, user in chunk]
+        ).values_list('email_address', flat=True))
+        for line, user in chunk:
+            if user['username'] in existing_usernames:
+                errors.append({'line': line, 'error': 'The display name is already in used.'})
+            elif user['email_address'] in existing_emails:
+                errors.append({'line': line, 'error': 'The username is already in used.'})
+
+    errors.sort(key=lambda error: error['line'])
+    invalid_lines = set(error['line'] for error in errors)
+    return [user for line, user in users if line not in invalid_lines], errors
+
+
+def create_import_job(creator, file_obj):
+    """
+    Validate the users of the CSV file, and return the import job with the users to create.
+    The job fails right away if any row is invalid.
+    """
+    users, errors = validate_user_rows(file_obj)
+    job = UserImportJob(creator=creator, num_rows=len(users) + len(errors), errors=errors)
+    if errors:
+        job.status = UserImportJob.FAILED
+    job.save()
+    return job, users
+
+
+def run_import_job(job, users):
+    """
+    Create the users of the job: the passwords are hashed by chunks across processes
+    (with the cheap placeholder hasher for the users without a password),
+    then the users, their settings and their notification rows are inserted with `bulk_create`,
+    in a single short transaction.
+    """
+    job.status = UserImportJob.RUNNING
+    job.save(update_fields=['status', 'updated_at'])
+
+    try:
+        created_users = []
+        for index in range(0, len(users), IMPORT_CHUNK_SIZE):
+            chunk = users[index:index + IMPORT_CHUNK_SIZE]
+            passwords = hash_passwords(user.pop('password', None) for user in chunk)
+            created_users.extend(
+                User(password=password, role_id=2, is_staff=False, is_superuser=False, **user)
+                for user, password in zip(chunk, passwords)
+            )
+            job.num_processed += len(chunk)
+            job.save(update_fields=['num_processed', 'updated_at'])
+
+        with transaction.atomic():
+            User.objects.bulk_create(created_users, batch_size=IMPORT_CHUNK_SIZE)
+            UserSetting.objects.bulk_create(
+                [UserSetting(user=user) for user in created_users], batch_size=IMPORT_CHUNK_SIZE
+            )
+            NotificationUser.objects.bulk_create(
+                [NotificationUser(user=user) for user in created_users], batch_size=IMPORT_CHUNK_SIZE
+            )
+    except Exception as exc:
+        job.status = UserImportJob.FAILED
+        job.errors = [{'line': None, 'error': str(exc)}]
+    else:
+        job.status = UserImportJob.SUCCEEDED
+        job.created_users = [user.id for user in created_users]
+    job.save()
+    return job
+
+
+def start_import_job(job, users):
+    """Run the import job in a background thread."""
+    def run():
+        try:
+            run_import_job(job, users)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=run, name='user-import-{}'.format(job.id), daemon=True)
+    thread.start()
+    return thread
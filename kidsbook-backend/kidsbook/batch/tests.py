@@ -1,5 +1,9 @@
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password
+from django.test import override_settings
 from rest_framework.test import APITestCase
+from kidsbook.hashing import get_hashing_pool, hash_passwords
+from kidsbook.models import NotificationUser, UserImportJob, UserSetting
 from kidsbook.user.views import generate_token
 
 
@@ -143,3 +147,60 @@ class TestBatch(APITestCase):
 
         cur_count_users = User.objects.count()
         self.assertEqual(cur_count_users, prev_count_users + len(response_first.data.get('data', {}).get('created_users', [])))
+
+    def test_batch_create_reports_invalid_rows(self):
+        data = {
+            'file': (
+                'test_dataset.csv',
+                """username,email_address,password,realname,gender,is_superuser
+                chris,,password_for_kris,Christiana Messi,0,
+                james,james@email.com,password_for_kris,Christiana Messi,1,1
+                ama,ama@email.com,ama_pwd,Ama Johnson,1,0
+                ama,ama2@email.com,ama_pwd,Ama Johnson,1,0"""
+            )
+        }
+
+        response = self.client.post(self.url + 'create/user/test_dataset.csv/', data=data, HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(400, response.status_code)
+        self.assertEqual([2, 3, 5], [error['line'] for error in response.data['errors']])
+        self.assertEqual(UserImportJob.FAILED, UserImportJob.objects.get(id=response.data['job_id']).status)
+
+    def test_batch_create_job(self):
+        data = {
+            'file': (
+                'test_dataset.csv',
+                """username,email_address,password,realname,gender
+                chris,chris@email.com,password_for_kris,Christiana Messi,0
+                ama,ama@email.com,,Ama Johnson,1"""
+            )
+        }
+
+        response = self.client.post(self.url + 'create/user/test_dataset.csv/', data=data, HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(202, response.status_code)
+
+        chris = User.objects.get(username='chris')
+        self.assertTrue(chris.check_password('password_for_kris'))
+        self.assertTrue(User.objects.get(username='ama').check_password('12345'))
+        self.assertEqual(2, chris.role_id)
+        self.assertTrue(UserSetting.objects.filter(user=chris).exists())
+        self.assertTrue(NotificationUser.objects.filter(user=chris).exists())
+
+        response = self.client.get('{}jobs/{}/'.format(self.url, response.data['data']['job_id']), HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(200, response.status_code)
+        job = response.data['data']
+        self.assertEqual(UserImportJob.SUCCEEDED, job['status'])
+        self.assertEqual((2, 2, 2), (job['num_rows'], job['num_processed'], len(job['created_users'])))
+
+    @override_settings(PASSWORD_HASHING={'WORKERS': 2, 'MIN_POOL_BATCH_SIZE': 2})
+    def test_hash_passwords_in_processes(self):
+        passwords = ['password_{}'.format(index) for index in range(4)]
+        hashes = hash_passwords(passwords)
+        self.assertTrue(all(check_password(password, hash) for password, hash in zip(passwords, hashes)))
+
+    @override_settings(PASSWORD_HASHING={'WORKERS': 2, 'MIN_POOL_BATCH_SIZE': 2})
+    def test_reuse_the_hashing_pool(self):
+        hash_passwords(['first', 'batch'])
+        pool = get_hashing_pool(2)
+        hashes = hash_passwords(['second', 'batch'])
+        self.assertIs(pool, get_hashing_pool(2))
+        self.assertTrue(check_password('second', hashes[0]))
@@ -2,5 +2,6 @@ from django.urls import path
 from kidsbook.batch import views
 
 urlpatterns = [
-    path('create/user/<filename>/', views.batch_create)
+    path('create/user/<filename>/', views.batch_create),
+    path('jobs/<uuid:pk>/', views.get_import_job),
 ]
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+# The cache backends private to every process
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The revoked tokens, the cached users and the groups of the users are shared through the cache,
+    so the server processes must all use the same cache (`python manage.py check --deploy`).
+    """
+    errors = []
+    for alias in sorted({'default', getattr(settings, 'TOKEN_REVOCATION_CACHE', 'default')}):
+        backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+        if backend in PROCESS_LOCAL_CACHES:
+            errors.append(Error(
+                "The cache '{}' ({}) is private to every server process.".format(alias, backend),
+                hint="Set KIDSBOOK_CACHE_LOCATION to a memcached server shared by the server processes.",
+                id='kidsbook.E001',
+            ))
+    return errors
@@ -0,0 +1,68 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef, Q
+
+from kidsbook.models import GroupMember
+
+
+User = get_user_model()
+
+USERS_DEFAULT_PAGE_SIZE = 50
+USERS_MAX_PAGE_SIZE = 500
+
+
+def get_users_not_in_any_groups():
+    """Return the users who are not in any groups, with a `NOT EXISTS` subquery."""
+    return User.objects.annotate(
+        is_in_group=Exists(GroupMember.objects.filter(user_id=OuterRef('pk')))
+    ).filter(is_in_group=False)
+
+
+def get_discoverable_users(user):
+    """
+    Return the users `user` can discover, in a single query:
+    all superusers, all users in the same groups or in no groups, and the users created by `user`.
+    """
+    group_ids = GroupMember.objects.filter(user_id=user.id).values('group_id')
+    users = User.objects.annotate(
+        is_in_group=Exists(GroupMember.objects.filter(user_id=OuterRef('pk'))),
+        is_in_same_group=Exists(GroupMember.objects.filter(user_id=OuterRef('pk'), group_id__in=group_ids))
+    )
+    return users.filter(
+        Q(is_in_group=False)
+        | Q(teacher_id=user.id)
+        | ((Q(role_id=1) | Q(is_in_same_group=True)) & ~Q(id=user.id))
+    )
+
+
+def filter_users(users, role=None, name_prefix=None):
+    """Keep the users of the role `role`, whose username or real name starts with `name_prefix`."""
+    if role is not None and str(role).strip() != '':
+        if not str(role).strip().isdigit():
+            raise ValueError("Param 'role' must be a role ID.")
+        users = users.filter(role_id=int(role))
+    if name_prefix:
+        users = users.filter(Q(username__istartswith=name_prefix) | Q(realname__istartswith=name_prefix))
+    return users
+
+
+def get_users_page(users, limit=None, offset=None):
+    """
+    Return a page of the users, newest first, and the offset of the next page (None on the last page).
+    The users are sorted and sliced by the database.
+    """
+    if limit is None or str(limit).strip() == '':
+        limit = USERS_DEFAULT_PAGE_SIZE
+    elif not str(limit).isdigit() or int(limit) <= 0:
+        raise ValueError("Param 'limit' must be a positive integer.")
+    if offset is None or str(offset).strip() == '':
+        offset = 0
+    elif not str(offset).isdigit():
+        raise ValueError("Param 'offset' must be a non-negative integer.")
+    limit = min(int(limit), USERS_MAX_PAGE_SIZE)
+    offset = int(offset)
+
+    # Fetch one extra user to know whether there is a next page
+    page = list(users.order_by('-created_at', '-id')[offset:offset + limit + 1])
+    if len(page) > limit:
+        return page[:limit], offset + limit
+    return page, None
@@ -0,0 +1,195 @@
+import codecs
+from collections import deque
+from csv import reader
+
+from django.conf import settings
+
+
+# Largest game file accepted, in bytes
+DEFAULT_GAME_FILE_MAX_SIZE = 5 * 1024 * 1024
+
+KEYWORDS = ('Scene', 'character', 'choice', 'END', 'Display text')
+END_SCENE = 'END'
+NUM_COLUMNS = 5
+
+
+class CompiledGame:
+    """
+    The scenes of a game file, checked and sorted, for the game to be created or updated from:
+    - `scenes`: the choices and the dialogue of every scene, by the name of the scene in the file,
+    - `order`: the names of the scenes in topological order, starting from the first scene
+      (every scene comes before the scenes its choices lead to),
+    - `lines`: the line of the file every scene starts at.
+    """
+
+    def __init__(self, scenes, order, lines):
+        self.scenes = scenes
+        self.order = order
+        self.lines = lines
+
+    @property
+    def first_scene(self):
+        return self.order[0]
+
+
+def iter_decoded_lines(file_obj, max_size):
+    """
+    Decode the lines of the file as they are read, removing the BOM.
+    Raise a `ValueError` as soon as more than `max_size` bytes are read.
+    """
+    if (getattr(file_obj, 'size', None) or 0) > max_size:
+        raise ValueError("The file must not be larger than {} bytes.".format(max_size))
+
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    size = 0
+    for chunk in file_obj:
+        if isinstance(chunk, str):
+            yield chunk
+            continue
+        size += len(chunk)
+        if size > max_size:
+            raise ValueError("The file must not be larger than {} bytes.".format(max_size))
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+def iter_game_file_rows(file_obj, max_size=None):
+    """
+    Stream the rows of an uploaded game file, without reading the whole file in memory.
+    Yield (line number, values) for every row, to be compiled by `compile_game`.
+    """
+    if max_size is None:
+        max_size = getattr(settings, 'GAME_FILE_MAX_SIZE', DEFAULT_GAME_FILE_MAX_SIZE)
+    csv_reader = reader(iter_decoded_lines(file_obj, max_size))
+    for row in csv_reader:
+        yield csv_reader.line_num, row
+
+
+def parse_scenes(rows):
+    """
+    Parse the scenes of the rows of a game file ((line number, values) pairs).
+    Return the details of the scenes and the line of every scene, by name,
+    and the lines of the choices, by (scene name, choice index).
+
+    Scene's format:
+    {
+        choices: [
+            {
+                - text(str)
+                - tag(str)
+                - pathway (str): The name of the next scene.
+            }
+        ],
+        dialogue: [
+            {
+            - name (str): The name of the person who speaks this dialogue. Only applicable if field is_end of its scene is False.
+            - speech (str): The name's speech in the dialogue.
+            - tag (str): To store the user's answers and his pathway. Only applicable if field is_end of its scene is True.
+            }
+        ]
+    }
+    """
+    scenes = {}
+    lines = {}
+    choice_lines = {}
+    scene_id = None
+
+    for line, row in rows:
+        row = [text.strip() for text in row] + [''] * (NUM_COLUMNS - len(row))
+
+        # Ignore the empty rows, and the rows whose first character is '#'
+        keyword = row[0]
+        if all(text == '' for text in row) or keyword.startswith('#'):
+            continue
+
+        if keyword not in KEYWORDS:
+            raise ValueError("Invalid keyword at line {}. The keyword must be one of {}".format(line, list(KEYWORDS)))
+
+        if keyword in ('Scene', END_SCENE):
+            scene_id = END_SCENE if keyword == END_SCENE else row[1]
+            if scene_id == '':
+                raise ValueError("Scene ID at line {} must not be empty.".format(line))
+            if scene_id in scenes:
+                raise ValueError("Duplicated scene ID of {} at line {}, first defined at line {}.".format(
+                    repr(scene_id), line, lines[scene_id]
+                ))
+            scenes[scene_id] = {}
+            lines[scene_id] = line
+            continue
+
+        if scene_id is None:
+            raise ValueError("The {} at line {} must be in a scene.".format(repr(keyword), line))
+        scene = scenes[scene_id]
+
+        if keyword == 'character':
+            scene.setdefault('dialogue', []).append({'name': row[1], 'speech': row[2], 'tag': row[3]})
+
+        elif keyword == 'choice':
+            choices = scene.setdefault('choices', [])
+            choice_lines[(scene_id, len(choices))] = line
+            choices.append({'text': row[2], 'tag': row[3], 'pathway': row[4]})
+
+        elif keyword == 'Display text':
+            scene.setdefault('dialogue', []).append({'speech': row[2], 'tag': row[3]})
+
+    return scenes, lines, choice_lines
+
+
+def format_scenes(scene_ids, lines):
+    return ', '.join('{} (line {})'.format(repr(scene_id), lines[scene_id]) for scene_id in sorted(scene_ids, key=lines.get))
+
+
+def compile_game(rows):
+    """
+    Parse the rows of a game file ((line number, values) pairs), check the graph of its scenes
+    and sort them, in O(scenes + choices).
+    Raise a `ValueError` with the lines at fault for a dangling pathway, a scene which cannot be reached
+    from the first scene, or a cycle of scenes.
+    """
+    scenes, lines, choice_lines = parse_scenes(rows)
+    if not scenes:
+        raise ValueError("The file has no scenes.")
+    if END_SCENE not in scenes:
+        raise ValueError("The file has no {} scene.".format(repr(END_SCENE)))
+
+    # The pathways of every scene, which must all be scenes of the file
+    pathways = {}
+    for scene_id, scene in scenes.items():
+        for index, choice in enumerate(scene.get('choices', [])):
+            if choice['pathway'] not in scenes:
+                raise ValueError("The pathway {} of the choice at line {} is not a scene of the game.".format(
+                    repr(choice['pathway']), choice_lines[(scene_id, index)]
+                ))
+        pathways[scene_id] = list(dict.fromkeys(choice['pathway'] for choice in scene.get('choices', [])))
+
+    # Every scene must be reachable from the first one
+    first_scene = next(iter(scenes))
+    reachable = {first_scene}
+    queue = deque([first_scene])
+    while queue:
+        for next_scene in pathways[queue.popleft()]:
+            if next_scene not in reachable:
+                reachable.add(next_scene)
+                queue.append(next_scene)
+    if len(reachable) < len(scenes):
+        raise ValueError("Scenes {} are unused.".format(format_scenes(set(scenes) - reachable, lines)))
+
+    # Sort the scenes topologically (Kahn's algorithm), the scenes left out are in or after a cycle
+    in_degrees = dict.fromkeys(scenes, 0)
+    for scene_pathways in pathways.values():
+        for next_scene in scene_pathways:
+            in_degrees[next_scene] += 1
+    order = []
+    queue = deque(scene_id for scene_id in scenes if in_degrees[scene_id] == 0)
+    while queue:
+        scene_id = queue.popleft()
+        order.append(scene_id)
+        for next_scene in pathways[scene_id]:
+            in_degrees[next_scene] -= 1
+            if in_degrees[next_scene] == 0:
+                queue.append(next_scene)
+    if len(order) < len(scenes):
+        in_cycle = [scene_id for scene_id in scenes if in_degrees[scene_id] > 0]
+        raise ValueError("Scenes {} are in or after a cycle of scenes.".format(format_scenes(in_cycle, lines)))
+
+    return CompiledGame(scenes, order, lines)
@@ -1,6 +1,10 @@
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase
 import os.path
+from io import StringIO
 from pprint import pprint
 
 from kidsbook.models import Game, GameScene, GameAnswer, Group
@@ -158,6 +162,16 @@ class TestGame(APITestCase):
         self.assertEqual(202, response.status_code)
         self.assertTrue(self.changes_have_been_applied(new_details, response.data['data']))
 
+    def test_update_game_without_writing_stats(self):
+        # The stats are left to the answers submitted meanwhile
+        url = "{}{}/".format(self.url, self.game['id'])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {'title': 'du hast mich'}, HTTP_AUTHORIZATION=self.superuser_token)
+        self.assertEqual(202, response.status_code)
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE "kidsbook_game"')]
+        self.assertEqual(1, len(updates))
+        self.assertNotIn('"stats"', updates[0])
+
     def test_update_game_by_non_superuser(self):
         url = "{}{}/".format(self.url, self.game['id'])
         new_details = {
@@ -465,6 +479,35 @@ class TestGame(APITestCase):
                 count += 1
         self.assertEqual(len(stats['answers'].keys())-1, count)
 
+    def test_ending_stats_after_updating_and_deleting_answers(self):
+        url = "{}{}/user/{}/".format(self.url, self.game['id'], self.user.id)
+        another_url = "{}{}/user/{}/".format(self.url, self.game['id'], self.another_user.id)
+        self.client.post(url, {'answers': [0, 2, 2]}, HTTP_AUTHORIZATION=self.user_token)
+        self.client.post(another_url, {'answers': [0, 1, 0]}, HTTP_AUTHORIZATION=self.another_token)
+
+        # Move the answer of the user from 'Upstanding' to '<equal>', then delete the other answer
+        response = self.client.post(url, {'answers': [0, 1, 0]}, HTTP_AUTHORIZATION=self.user_token)
+        self.assertEqual('<equal>', response.data['data']['ending'])
+        response = self.client.delete(another_url, HTTP_AUTHORIZATION=self.another_token)
+        self.assertEqual(202, response.status_code)
+
+        game = Game.objects.get(id=self.game['id'])
+        expected_end_stats = {
+            '<equal>': 1,
+            'Bullying': 0,
+            'Ignoring': 0,
+            'Upstanding': 0
+        }
+        self.assertEqual(expected_end_stats, game.stats['answers'][self.game['last_scene']])
+        self.assertEqual(1, game.stats['num_of_responses'])
+
+        # The stats are recomputed from the answers
+        expected_stats = game.stats
+        game.stats = {'num_of_responses': 0, 'answers': {}}
+        game.save()
+        call_command('reconcile_game_stats', str(game.id), stdout=StringIO())
+        self.assertEqual(expected_stats, Game.objects.get(id=game.id).stats)
+
     def test_get_all_answers(self):
         # Create 3 answers for 3 users
         url = "{}{}/user/{}/".format(self.url, self.game['id'], self.user.id)
@@ -1,10 +1,15 @@
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase
 import os.path
+from io import BytesIO
 from uuid import UUID
 from pprint import pprint
 
 from kidsbook.models import Game, GameScene, GameAnswer, Group
+from kidsbook.game.compiler import compile_game, iter_game_file_rows
 from kidsbook.user.views import generate_token
 from kidsbook.serializers import GameSceneSerializer,GameSuperuserSerializer
 
@@ -248,3 +253,93 @@ class TestGameParser(APITestCase):
         }
 
         self.assertTrue(self.changes_no_difference_in_response(expected_response, response.data.get('data', {})))
+
+    def test_create_a_game_with_one_insert_of_scenes(self):
+        csv_file = "Game_Module_Template_2.csv"
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), csv_file), 'rb') as upload_file:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    self.url, {"group_id": str(self.group.id), "file": upload_file},
+                    HTTP_AUTHORIZATION=self.superuser_token
+                )
+        self.assertEqual(202, response.status_code)
+        self.assertEqual(15, GameScene.objects.filter(game_id=response.data['data']['id']).count())
+
+        game_table = connection.ops.quote_name(Game._meta.db_table)
+        scene_table = connection.ops.quote_name(GameScene._meta.db_table)
+        writes = [query['sql'] for query in queries.captured_queries if query['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual(1, len([sql for sql in writes if sql.startswith('INSERT INTO {}'.format(scene_table))]))
+        self.assertEqual(1, len([sql for sql in writes if game_table + ' ' in sql]))
+
+    def test_update_the_scenes_of_a_game(self):
+        csv_file = "Game_Module_Template.csv"
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), csv_file), 'rb') as upload_file:
+            response = self.client.post(
+                self.url, {"group_id": str(self.group.id), "file": upload_file},
+                HTTP_AUTHORIZATION=self.superuser_token
+            )
+        game_id = response.data['data']['id']
+
+        csv_file = "Game_Module_Template_2.csv"
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), csv_file), 'rb') as upload_file:
+            response = self.client.post(
+                "{}{}/".format(self.url, game_id), {"file": upload_file},
+                HTTP_AUTHORIZATION=self.superuser_token
+            )
+        self.assertEqual(202, response.status_code)
+
+        # The old scenes are replaced, and the stats match the new scenes
+        game = Game.objects.get(id=game_id)
+        scene_ids = set(str(scene_id) for scene_id in GameScene.objects.filter(game_id=game_id).values_list('id', flat=True))
+        self.assertEqual(15, len(scene_ids))
+        self.assertIn(game.first_scene, scene_ids)
+        self.assertEqual(scene_ids, set(game.stats['answers'].keys()))
+
+    def test_compile_game_errors(self):
+        def compile_rows(*rows):
+            return compile_game(enumerate([row.split(',') for row in rows], 1))
+
+        # Dangling pathway
+        with self.assertRaisesRegex(ValueError, "pathway '3' of the choice at line 3"):
+            compile_rows('Scene,1,,,', 'choice,<player>,Yes,Upstanding,END', 'choice,<player>,No,Ignoring,3', 'END,,,,', 'Display text,,Bye,Upstanding,')
+
+        # Unreachable scene
+        with self.assertRaisesRegex(ValueError, r"Scenes '2' \(line 3\) are unused"):
+            compile_rows('Scene,1,,,', 'choice,<player>,Yes,Upstanding,END', 'Scene,2,,,', 'choice,<player>,No,Ignoring,END', 'END,,,,')
+
+        # Cycle
+        with self.assertRaisesRegex(ValueError, r"'1' \(line 1\), '2' \(line 3\), 'END' \(line 6\) are in or after a cycle"):
+            compile_rows('Scene,1,,,', 'choice,<player>,Yes,Upstanding,2', 'Scene,2,,,', 'choice,<player>,No,Ignoring,1', 'choice,<player>,Yes,Upstanding,END', 'END,,,,')
+
+        # Duplicated scene
+        with self.assertRaisesRegex(ValueError, "at line 3, first defined at line 1"):
+            compile_rows('Scene,1,,,', 'choice,<player>,Yes,Upstanding,END', 'Scene,1,,,', 'END,,,,')
+
+        # The scenes are sorted, from the first scene
+        compiled_game = compile_rows(
+            'Scene,1,,,', 'choice,<player>,A,Upstanding,3', 'choice,<player>,B,Ignoring,2',
+            'Scene,3,,,', 'choice,<player>,C,Upstanding,END',
+            'Scene,2,,,', 'choice,<player>,D,Upstanding,3',
+            'END,,,,'
+        )
+        self.assertEqual(['1', '2', '3', 'END'], compiled_game.order)
+
+    def test_create_game_larger_than_max_size(self):
+        csv_file = "Game_Module_Template.csv"
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), csv_file), 'rb') as upload_file:
+            with override_settings(GAME_FILE_MAX_SIZE=1024):
+                response = self.client.post(
+                    self.url, {"group_id": str(self.group.id), "file": upload_file},
+                    HTTP_AUTHORIZATION=self.superuser_token
+                )
+        self.assertEqual(400, response.status_code)
+        self.assertIn('larger than 1024 bytes', response.data['error'])
+        self.assertFalse(Game.objects.exists())
+
+    def test_stream_game_file_rows(self):
+        # The BOM is removed, and the line numbers follow the quoted line breaks
+        file_obj = BytesIO('\ufeffScene,1,,,\r\ncharacter,Curt,"Hi,\r\nguys",,\r\nchoice,<player>,Ok,Upstanding,END\r\n'.encode('utf-8'))
+        rows = list(iter_game_file_rows(file_obj))
+        self.assertEqual((1, ['Scene', '1', '', '', '']), rows[0])
+        self.assertEqual((3, ['character', 'Curt', 'Hi,\r\nguys', '', '']), rows[1])
+        self.assertEqual(4, rows[2][0])
@@ -0,0 +1,99 @@
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from kidsbook.models import GameScene, get_game_graph_version_key
+from kidsbook.serializers import GameSceneSerializer
+
+
+def get_game_graph_cache_key(game_id, version):
+    return 'kidsbook:game_graph:{}:{}'.format(game_id, version)
+
+
+def get_game_graph_version(game_id):
+    """Return the version of the compiled graph of the game, starting a new one if it was expired."""
+    version_key = get_game_graph_version_key(game_id)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(version_key)
+    return version
+
+
+class GameGraph:
+    """
+    The scenes of a game, compiled once: the scenes serialized by `GameSceneSerializer`, keyed by ID,
+    and the IDs of the scenes reached by the choices of every scene.
+
+    The graph is shared by the requests, so neither it nor its scenes must be modified.
+    """
+
+    def __init__(self, game_id, scenes):
+        self.game_id = str(game_id)
+        self.scenes = {str(scene['id']): scene for scene in scenes}
+        self.pathways = {
+            scene_id: tuple(str(choice['pathway']) for choice in scene['choices'] or [])
+            for scene_id, scene in self.scenes.items()
+        }
+
+    @classmethod
+    def build(cls, game_id):
+        """Compile the graph of the game, with a single query."""
+        scenes = GameSceneSerializer(GameScene.objects.filter(game_id=game_id), many=True).data
+        return cls(game_id, [dict(scene) for scene in scenes])
+
+    def get_scene(self, scene_id):
+        return self.scenes.get(str(scene_id))
+
+    def next_scene_id(self, scene_id, answer):
+        """Return the ID of the scene reached by the choice `answer` of the scene, or None if there is no such choice."""
+        pathways = self.pathways.get(str(scene_id), ())
+        if self.scenes[str(scene_id)]['is_end'] or not 0 <= answer < len(pathways):
+            return None
+        return pathways[answer]
+
+    def walk(self, first_scene_id, answers):
+        """
+        Return the scenes in the path of the answers, from the scene `first_scene_id`:
+        every answered scene, then the scene the answers end at.
+        The walk stops at an end scene, or at the first invalid answer.
+        """
+        scene_id = str(first_scene_id)
+        if scene_id not in self.scenes:
+            raise KeyError('Unable to find the scene {} of game {}.'.format(scene_id, self.game_id))
+
+        path = [self.scenes[scene_id]]
+        for answer in answers:
+            try:
+                scene_id = self.next_scene_id(scene_id, int(answer))
+            except (TypeError, ValueError):
+                break
+            if scene_id is None or scene_id not in self.scenes:
+                break
+            path.append(self.scenes[scene_id])
+        return path
+
+
+_game_graph_lock = threading.Lock()
+
+def get_game_graph(game_id):
+    """
+    Return the compiled graph of the game, from the cache.
+    The graph is compiled again whenever a scene of the game is saved or deleted,
+    at most once at a time in a process.
+    """
+    version = get_game_graph_version(game_id)
+    cache_key = get_game_graph_cache_key(game_id, version)
+    graph = cache.get(cache_key)
+    if graph is not None:
+        return graph
+
+    with _game_graph_lock:
+        graph = cache.get(cache_key)
+        if graph is None:
+            graph = GameGraph.build(game_id)
+            if version is not None:
+                cache.set(cache_key, graph, getattr(settings, 'GAME_GRAPH_CACHE_TIMEOUT', 3600))
+    return graph
@@ -1,4 +1,6 @@
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase
 import os.path
 from pprint import pprint
@@ -151,3 +153,26 @@ class TestGameScene(APITestCase):
         expected_scene = self.traverse_to_get_scene(answers, self.game)
         self.assertEqual(str(response.data['data']['scene']['id']), expected_scene['id'])
         self.assertTrue(expected_scene['is_end'])
+
+    def test_get_the_next_scene_from_compiled_scenes(self):
+        # Create an unfinished answer
+        url = "{}/game/{}/user/{}/".format(url_prefix, self.game['id'], self.user.id)
+        answers = [2, 1]
+        self.client.post(url, {'answers': answers}, HTTP_AUTHORIZATION=self.user_token)
+        expected_scene = self.traverse_to_get_scene(answers, self.game)
+
+        # The scenes are not read from the DB again
+        url = "{}?game_id={}".format(self.url, self.game['id'])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_AUTHORIZATION=self.user_token)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(str(response.data['data']['scene']['id']), expected_scene['id'])
+        self.assertFalse(any(GameScene._meta.db_table in query['sql'] for query in queries.captured_queries))
+
+        # Until a scene is updated
+        scene = GameScene.objects.get(id=expected_scene['id'])
+        scene.dialogue = [{'name': 'Narrator', 'speech': 'Updated', 'tag': ''}]
+        scene.save()
+        response = self.client.get(url, HTTP_AUTHORIZATION=self.user_token)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(scene.dialogue, response.data['data']['scene']['dialogue'])
@@ -10,6 +10,7 @@ from kidsbook.serializers import *
 from kidsbook.models import *
 from kidsbook.permissions import *
 from kidsbook.utils import *
+from kidsbook.game_graph import get_game_graph
 
 
 User = get_user_model()
@@ -57,13 +58,6 @@ def scene_get(request, **kargs):
 
 ## SCENE WITH CONDITIONS
 
-def populate_scenes_to_dict(scenes):
-    res = {}
-    for _scene in iter(scenes):
-        res[str(_scene['id'])] = _scene
-    return res
-
-
 def get_scene_with_conditions(request):
     request_queries = request.query_params
     if 'game_id' not in request_queries:
@@ -86,30 +80,16 @@ def get_scene_with_conditions(request):
         serializer = GameSceneSerializer(scene)
         return Response({'data': {'scene': serializer.data, 'answers': []}})
 
-    # Populate the scenes and get the first scene
+    # Traverse through the compiled scenes to get the last scene the user is at, from his answers
     user_answer = user_answer.answers
-    all_scenes = GameSceneSerializer(GameScene.objects.filter(game=game), many=True).data
-    all_scenes = populate_scenes_to_dict(all_scenes)
-    if str(game.first_scene) not in all_scenes:
+    try:
+        cur_scene = get_game_graph(game.id).walk(game.first_scene, user_answer)[-1]
+    except KeyError:
         return Response(
             {'error': 'Unable to find the first scene of game {}.'.format(game.id)},
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    # Traverse through the scenes to get the last scene the user is at, from his answers
-    cur_scene = all_scenes[str(game.first_scene)]
-    for ans in iter(user_answer):
-        if cur_scene['is_end']:
-            break
-
-        if 0 <= ans < len(cur_scene['choices']):
-            next_scene_id = cur_scene['choices'][ans]['pathway']
-            cur_scene = all_scenes[next_scene_id]
-            continue
-
-        # If invalid scene, return the last available scene
-        break
-
     return Response({'data': {'scene': cur_scene, 'answers': user_answer}})
 
 
@@ -0,0 +1,88 @@
+from operator import itemgetter
+
+from django.db.models import Count
+
+from kidsbook.game_graph import get_game_graph
+from kidsbook.models import Game, GameAnswer
+
+
+def update_game_stats(answers, game, scenes, value=1):
+    game_stats = game.stats
+    cur_scene = scenes[game.first_scene]
+    answer_stats = {}
+    cur_tag = ''
+
+    # Update game's stats
+    for ans in iter(answers):
+        if cur_scene['is_end']:
+            break
+
+        try:
+            cur_tag = cur_scene['choices'][int(ans)]['tag']
+            if cur_tag not in answer_stats:
+                answer_stats[cur_tag] = 1
+            else:
+                answer_stats[cur_tag] += 1
+            game_stats['answers'][str(cur_scene['id'])][int(ans)] += value
+            cur_scene = scenes[cur_scene['choices'][int(ans)]['pathway']]
+            continue
+        except Exception:
+            raise ValueError('Invalid answer of {} for scene {}'.format(repr(ans), cur_scene['id']))
+
+        raise ValueError('The answer must be an integer, but got {}'.format(repr(ans)))
+
+    if cur_scene['is_end']:
+        # Create / Update an answer
+        if value > 0:
+            sorted_answer_stats = sorted(answer_stats.items(), key=itemgetter(1), reverse=True)
+            if len(sorted_answer_stats) > 1 and sorted_answer_stats[0][1] == sorted_answer_stats[1][1]:
+                return '<equal>'
+            if sorted_answer_stats[0][1] >= game.threshold:
+                return sorted_answer_stats[0][0]
+            return '<equal>'
+    """
+    Stats' Format:
+        num_of_responses: Int (default: 0),
+        answers: {
+            '0': [Int, Int, ...],    # Question 1
+            '1': [Int, Int, ...],    # Question 2
+            ...
+        }
+    """
+    # If no `ending`
+    return None
+
+def update_ending_stats(game, old_ending='', new_ending=''):
+    """
+    Move a response of the game from the ending `old_ending` to `new_ending` ('' for no ending),
+    in the stats of the last scene.
+    """
+    ending_stats = game.stats['answers'].setdefault(str(game.last_scene), {})
+    if old_ending:
+        ending_stats[old_ending] = ending_stats.get(old_ending, 0) - 1
+    if new_ending:
+        ending_stats[new_ending] = ending_stats.get(new_ending, 0) + 1
+
+def lock_game(game_id):
+    """Return the game, locked until the end of the transaction, so that the answers to the game are applied one at a time."""
+    return Game.objects.select_for_update().get(id=game_id)
+
+def rebuild_game_stats(game):
+    """Recompute the stats of the game from all its answers, with the endings counted by the DB."""
+    scenes = get_game_graph(game.id).scenes
+    answers = GameAnswer.objects.filter(game=game)
+
+    stats_answers = {
+        scene_id: [0 for _ in scene['choices'] or []]
+        for scene_id, scene in scenes.items() if scene_id != str(game.last_scene)
+    }
+    game.stats = {'num_of_responses': 0, 'answers': stats_answers}
+    for answer in answers.only('answers'):
+        update_game_stats(answer.answers, game, scenes)
+        game.stats['num_of_responses'] += 1
+
+    ending_stats = {dialogue['tag']: 0 for dialogue in scenes[str(game.last_scene)]['dialogue']}
+    ending_counts = answers.exclude(ending='').order_by().values_list('ending').annotate(count=Count('pk'))
+    ending_stats.update(ending_counts)
+    stats_answers[str(game.last_scene)] = ending_stats
+    return game.stats
@@ -1,6 +1,6 @@
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
-from kidsbook.models import Group
+from kidsbook.models import Group, Post
 from kidsbook.user.views import generate_token
 
 User = get_user_model()
@@ -268,6 +268,26 @@ class TestGroupMember(APITestCase):
             )
         )
 
+    def test_view_all_members_without_posts(self):
+        self.test_add_new_group_member()
+        Post.objects.create_post(content="testing content", creator=self.member, group=Group.objects.get(id=self.group_id))
+        response = self.client.get("{}users/".format(self.url), HTTP_AUTHORIZATION=self.creator_token)
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(all('user_posts' not in user for user in response.data['data']))
+        self.assertTrue(all(len(user['user_groups']) == 1 for user in response.data['data']))
+
+        response = self.client.get("{}users/".format(self.url), HTTP_AUTHORIZATION=self.member_token)
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(all('user_posts' not in user and 'user_groups' in user for user in response.data['data']))
+
+        response = self.client.get("{}users/".format(self.url), {'fields': 'id,username'}, HTTP_AUTHORIZATION=self.creator_token)
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(all(set(user) == {'id', 'username'} for user in response.data['data']))
+
+        # The ID is always kept
+        response = self.client.get("{}users/".format(self.url), {'fields': 'username'}, HTTP_AUTHORIZATION=self.creator_token)
+        self.assertTrue(all(set(user) == {'id', 'username'} for user in response.data['data']))
+
     def test_view_all_members_without_token(self):
         response = self.client.get("{}users/".format(self.url))
         self.assertEqual(401, response.status_code)
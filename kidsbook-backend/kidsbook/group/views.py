@@ -8,6 +8,8 @@ from kidsbook.serializers import *
 from kidsbook.models import *
 from kidsbook.permissions import *
 from kidsbook.utils import *
+from kidsbook.notification.dispatcher import dispatch_notification
+from kidsbook.access import get_access_resolver
 
 User = get_user_model()
 
@@ -80,20 +82,8 @@ def group(request):
 def add_member_to_group(user, group):
     group.add_member(user)
 
-    payload = {
-        'user': user,
-        'group': group,
-        'content': 'You have been added to group {}'.format(group.name)
-    }
-    noti = Notification.objects.create(**payload)
-    noti_user = NotificationUser.objects.get(user_id=user.id)
-    noti_user.number_of_unseen += 1
-    noti_user.save()
-
-    # Push the notification the newly added user
-    if UserSetting.objects.get(user_id=user.id).receive_notifications:
-        noti_serializer = NotificationSerializer(noti).data
-        push_notification(noti_serializer)
+    # Notify the newly added user
+    dispatch_notification([user.id], 'You have been added to group {}'.format(group.name), group)
 
 def delete_member_from_group(user, group):
     # Remove the link between the user and group
@@ -102,20 +92,8 @@ def delete_member_from_group(user, group):
 
     GroupMember.objects.get(user_id=user.id, group_id=group.id).delete()
 
-    payload = {
-        'user': user,
-        'group': group,
-        'content': 'You have been removed from group {}'.format(group.name)
-    }
-    noti = Notification.objects.create(**payload)
-    noti_user = NotificationUser.objects.get(user_id=user.id)
-    noti_user.number_of_unseen += 1
-    noti_user.save()
-
-    # Push the notification to the deleted user
-    if UserSetting.objects.get(user_id=user.id).receive_notifications:
-        noti_serializer = NotificationSerializer(noti).data
-        push_notification(noti_serializer)
+    # Notify the deleted user
+    dispatch_notification([user.id], 'You have been removed from group {}'.format(group.name), group)
 
 @api_view(['POST', 'DELETE'])
 @permission_classes((IsAuthenticated, IsTokenValid, IsSuperUser))
@@ -147,15 +125,17 @@ def group_member(request, **kargs):
 @permission_classes((IsAuthenticated, IsTokenValid, IsInGroup))
 def get_all_members_in_group(request, **kargs):
     try:
-        users = Group.objects.get(id=kargs.get('pk', '')).users
+        users = get_access_resolver(request).get_group(kargs.get('pk', '')).users.all()
         # Define different Serializer depends on the requester
         if request.user.is_superuser:
-            serializer = UserSerializer(users, many=True)
+            serializer_class = UserSummarySerializer
         else:
-            serializer = UserPublicSerializer(users, many=True)
+            serializer_class = UserPublicSummarySerializer
+        users = serializer_class.setup_eager_loading(users)
+        serializer = serializer_class(users, many=True, context={'fields': get_fields_param(request)})
         return Response({'data': serializer.data})
     except Exception as exc:
-        Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
     return Response({'error': 'Bad request.'}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -216,7 +196,8 @@ def delete_group(request, **kargs):
         group_id = kargs.get('pk', None)
 
         if group_id:
-            target_group = Group.objects.get(id=group_id)
+            # The group was fetched by the permission `IsGroupCreator`
+            target_group = get_access_resolver(request).get_group(group_id)
 
             # The relations in GroupMember table are also auto-removed
             target_group.delete()
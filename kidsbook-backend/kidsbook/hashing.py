@@ -0,0 +1,116 @@
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher, make_password
+
+
+DEFAULT_PASSWORD_HASHING_SETTINGS = {
+    'WORKERS': None,            # processes hashing the passwords, the number of CPUs by default
+    'MIN_POOL_BATCH_SIZE': 8,   # smaller batches are hashed in the current process
+}
+
+# The password of the accounts created without one (batch imports, SLS and virtual users)
+DEFAULT_PASSWORD = '12345'
+
+
+class PlaceholderPasswordHasher(PBKDF2PasswordHasher):
+    """
+    A cheap PBKDF2 for the default password of the accounts created without one.
+
+    It is never the preferred hasher (the first of `PASSWORD_HASHERS`),
+    so the password is hashed again with the preferred hasher on the first login.
+    """
+    algorithm = 'pbkdf2_placeholder'
+    iterations = 1000
+
+
+def make_placeholder_password(password=DEFAULT_PASSWORD):
+    return make_password(password, hasher=PlaceholderPasswordHasher.algorithm)
+
+
+def get_hashing_settings():
+    return dict(DEFAULT_PASSWORD_HASHING_SETTINGS, **getattr(settings, 'PASSWORD_HASHING', {}))
+
+
+def _setup_worker():
+    # The workers are spawned, they set up Django from `DJANGO_SETTINGS_MODULE`
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+_pool = None
+_pool_size = None
+_pool_lock = threading.Lock()
+
+def get_hashing_pool(num_workers):
+    """
+    Return the pool of processes hashing the passwords, created on first use and kept for the life of the process.
+    The workers are spawned rather than forked, as the requests' threads may hold DB connections and locks.
+    """
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is not None and _pool_size != num_workers:
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=num_workers,
+                mp_context=get_context('spawn'),
+                initializer=_setup_worker
+            )
+            _pool_size = num_workers
+        return _pool
+
+@atexit.register
+def shutdown_hashing_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+def _make_password(args):
+    password, hasher = args
+    return make_password(password, hasher=hasher)
+
+
+def hash_passwords(passwords, hasher='default'):
+    """
+    Hash the passwords with `hasher`, and return the hashes in the same order.
+    The `None` passwords get the placeholder hash of `DEFAULT_PASSWORD`.
+    Large batches are hashed across a pool of processes, as the password hashers are CPU-bound.
+    """
+    passwords = list(passwords)
+    hashes = [make_placeholder_password() if password is None else None for password in passwords]
+    indexes = [index for index, password in enumerate(passwords) if password is not None]
+
+    options = get_hashing_settings()
+    pool_size = options['WORKERS'] or os.cpu_count() or 1
+    num_workers = min(pool_size, len(indexes))
+    if num_workers <= 1 or len(indexes) < options['MIN_POOL_BATCH_SIZE']:
+        for index in indexes:
+            hashes[index] = make_password(passwords[index], hasher=hasher)
+        return hashes
+
+    # The workers read the settings of the project, so they are given the hasher itself rather than 'default'
+    algorithm = get_hasher(hasher).algorithm
+    chunk_size = max(1, len(indexes) // (num_workers * 4))
+    try:
+        pooled_hashes = get_hashing_pool(pool_size).map(
+            _make_password, [(passwords[index], algorithm) for index in indexes], chunksize=chunk_size
+        )
+        for index, password_hash in zip(indexes, pooled_hashes):
+            hashes[index] = password_hash
+    except BrokenProcessPool:
+        # A worker died: create a new pool for the next batches
+        shutdown_hashing_pool()
+        raise
+    return hashes
@@ -8,11 +8,6 @@ SLS_GET_TOKEN_HEADERS = {
     "Content-Type": "application/json"
 }
 
-SLS_GRAPHQL_HEADERS = {
-    "Content-Type": "application/json",
-    'Authorization': "Bearer {token}"
-}
-
 SLS_GRAPHQL_USER_QUERY = """
 {
     user(uuid: \"%s\"){
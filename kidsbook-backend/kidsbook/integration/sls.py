@@ -1,71 +1,279 @@
-from time import sleep
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 
 import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 
 from kidsbook.integration.constants import (
     SLS_GET_TOKEN_HEADERS,
     SLS_GET_TOKEN_JSON_BODY,
-    SLS_GRAPHQL_HEADERS,
     SLS_GRAPHQL_URL,
     SLS_GRAPHQL_USER_QUERY,
     SLS_TOKEN_URL,
 )
 
-SLS_TOKEN = None
 
+DEFAULT_SLS_CLIENT_SETTINGS = {
+    'TOKEN_URL': SLS_TOKEN_URL,
+    'GRAPHQL_URL': SLS_GRAPHQL_URL,
+    'TIMEOUT': 5,               # seconds
+    'POOL_SIZE': 10,            # kept-alive connections
+    'TOKEN_TTL': 3600,          # seconds a token is used for, when SLS does not tell its expiry
+    'REFRESH_MARGIN': 60,       # seconds before its expiry a token is refreshed
+    'USER_CACHE_TIMEOUT': 30,   # seconds the users are cached for
+    'MAX_CACHED_USERS': 1000,   # the least recently used users are dropped first
+    'FAILURE_THRESHOLD': 5,     # consecutive failures opening the circuit
+    'RECOVERY_TIMEOUT': 30,     # seconds the circuit stays open
+}
 
-def __get_sls_token():
-    """Get a SLS authorization token."""
-    response = requests.post(
-        SLS_TOKEN_URL, headers=SLS_GET_TOKEN_HEADERS, json=SLS_GET_TOKEN_JSON_BODY
-    )
-    if response.status_code != 200:
-        return None
 
-    response_data = response.json()
-    if "data" not in response_data:
-        return None
+class SLSUnavailable(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
 
-    return response_data.get("data", {}).get("token")
 
+class CircuitBreaker:
+    """
+    Stop calling a failing service: after `failure_threshold` consecutive failures,
+    the calls are refused for `recovery_timeout` seconds, then a single call is let through to try again.
+    """
 
-def get_sls_token(*, retries=5):
-    """A wrapper for __get_sls_token to perform exponential backoff."""
-    sleep_time = 0.2
-    for _ in range(retries):
-        token = __get_sls_token()
-        if not token:
-            sleep(sleep_time)
-            sleep_time *= 2
-            continue
-        return token
+    def __init__(self, failure_threshold=5, recovery_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
 
-    return None
+    def allow_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.recovery_timeout:
+                # Half-open: let this call through, and wait for its result again
+                self._opened_at = time.monotonic()
+                return True
+            return False
 
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
 
-def refresh_sls_token():
-    global SLS_TOKEN
-    if SLS_TOKEN is None:
-        SLS_TOKEN = get_sls_token()
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
 
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
 
-def get_sls_user_data(user_id):
-    global SLS_TOKEN
-    if not SLS_TOKEN:
-        refresh_sls_token()
 
-    headers = SLS_GRAPHQL_HEADERS
-    headers["Authorization"] = headers["Authorization"].format(token=SLS_TOKEN)
-    response = requests.post(
-        SLS_GRAPHQL_URL,
-        json={"query": SLS_GRAPHQL_USER_QUERY % user_id},
-        headers=headers,
-    )
+def get_token_expiry(token_data, default_ttl):
+    """Return the time (`time.monotonic()`) the token expires at: from `expiresIn`, or the `exp` claim of a JWT."""
+    now = time.monotonic()
+    expires_in = token_data.get('expiresIn', token_data.get('expires_in'))
+    if isinstance(expires_in, (int, float)):
+        return now + expires_in
+
+    try:
+        payload = token_data['token'].split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)).decode('utf-8'))
+        return now + (float(claims['exp']) - time.time())
+    except Exception:
+        return now + default_ttl
+
+
+class SLSClient:
+    """
+    Query the users of SLS over kept-alive connections.
+
+    The token is shared by the threads and refreshed by one of them only,
+    `refresh_margin` seconds before it expires (or once SLS rejects it).
+    The users are cached for `user_cache_timeout` seconds (at most `max_cached_users`, least recently used first out),
+    and concurrent queries of the same user wait for a single upstream call.
+    While SLS keeps failing, the calls are refused by a circuit breaker instead of piling up.
+    """
+
+    def __init__(self, token_url=SLS_TOKEN_URL, graphql_url=SLS_GRAPHQL_URL, timeout=5, pool_size=10,
+            token_ttl=3600, refresh_margin=60, user_cache_timeout=30, max_cached_users=1000,
+            failure_threshold=5, recovery_timeout=30):
+        self.token_url = token_url
+        self.graphql_url = graphql_url
+        self.timeout = timeout
+        self.token_ttl = token_ttl
+        self.refresh_margin = refresh_margin
+        self.user_cache_timeout = user_cache_timeout
+        self.max_cached_users = max_cached_users
+        self.circuit_breaker = CircuitBreaker(failure_threshold, recovery_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._token = None
+        self._token_expiry = 0
+        self._token_lock = threading.Lock()
+        self._users = OrderedDict()
+        # The locks of the users being queried, with their number of waiting threads
+        self._user_locks = {}
+        self._users_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        config = dict(DEFAULT_SLS_CLIENT_SETTINGS)
+        config.update(getattr(settings, 'SLS_CLIENT', {}))
+        return cls(
+            token_url=config['TOKEN_URL'],
+            graphql_url=config['GRAPHQL_URL'],
+            timeout=config['TIMEOUT'],
+            pool_size=config['POOL_SIZE'],
+            token_ttl=config['TOKEN_TTL'],
+            refresh_margin=config['REFRESH_MARGIN'],
+            user_cache_timeout=config['USER_CACHE_TIMEOUT'],
+            max_cached_users=config['MAX_CACHED_USERS'],
+            failure_threshold=config['FAILURE_THRESHOLD'],
+            recovery_timeout=config['RECOVERY_TIMEOUT']
+        )
+
+    def get_token(self, force_refresh=False):
+        """Return a valid token, refreshing it if it expires soon."""
+        with self._token_lock:
+            if force_refresh or self._token is None or time.monotonic() >= self._token_expiry - self.refresh_margin:
+                token_data = self._post(self.token_url, SLS_GET_TOKEN_JSON_BODY, SLS_GET_TOKEN_HEADERS).get('data') or {}
+                if not token_data.get('token'):
+                    raise SLSUnavailable('SLS did not return a token.')
+                self._token = token_data['token']
+                self._token_expiry = get_token_expiry(token_data, self.token_ttl)
+            return self._token
+
+    def get_user_data(self, user_id):
+        """Return the response of SLS for the user ({'data': {'user': ...}}), or None if SLS failed."""
+        cached = self._get_cached_user(user_id)
+        if cached is not None:
+            return cached
+
+        with self._user_lock(user_id):
+            cached = self._get_cached_user(user_id)
+            if cached is not None:
+                return cached
+
+            try:
+                user_data = self._query_user(user_id)
+            except SLSUnavailable:
+                return None
+
+            if 'data' not in user_data:
+                return None
+            if 'errors' not in user_data:
+                self._cache_user(user_id, user_data)
+            return user_data
+
+    def close(self):
+        self.session.close()
 
-    if 200 <= response.status_code < 300 and "data" in response.json():
-        return response.json()
+    def _query_user(self, user_id):
+        payload = {'query': SLS_GRAPHQL_USER_QUERY % user_id}
+        try:
+            return self._post(self.graphql_url, payload, self._get_graphql_headers())
+        except SLSUnavailable as exc:
+            # The token may have been revoked before its expiry: try once more with a new one
+            if exc.status_code != 401:
+                raise
+            return self._post(self.graphql_url, payload, self._get_graphql_headers(force_refresh=True))
 
-    return None
+    def _get_graphql_headers(self, force_refresh=False):
+        return {
+            'Content-Type': 'application/json',
+            'Authorization': 'Bearer {}'.format(self.get_token(force_refresh=force_refresh)),
+        }
+
+    def _get_cached_user(self, user_id):
+        with self._users_lock:
+            expiry, user_data = self._users.get(user_id, (0, None))
+            if expiry <= time.monotonic():
+                self._users.pop(user_id, None)
+                return None
+            self._users.move_to_end(user_id)
+            return user_data
+
+    def _cache_user(self, user_id, user_data):
+        with self._users_lock:
+            self._users[user_id] = (time.monotonic() + self.user_cache_timeout, user_data)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_cached_users:
+                self._users.popitem(last=False)
+
+    @contextmanager
+    def _user_lock(self, user_id):
+        """Hold the lock of the user, dropped once no thread waits for it."""
+        with self._users_lock:
+            lock_and_count = self._user_locks.setdefault(user_id, [threading.Lock(), 0])
+            lock_and_count[1] += 1
+        try:
+            with lock_and_count[0]:
+                yield
+        finally:
+            with self._users_lock:
+                lock_and_count[1] -= 1
+                if lock_and_count[1] == 0:
+                    del self._user_locks[user_id]
+
+    def _post(self, url, payload, headers):
+        if not self.circuit_breaker.allow_request():
+            raise SLSUnavailable('SLS is unavailable.')
+
+        try:
+            response = self.session.post(url, json=payload, headers=headers, timeout=self.timeout)
+            response_data = response.json() if 200 <= response.status_code < 300 else None
+        except (requests.RequestException, ValueError):
+            response = None
+            response_data = None
+
+        if response_data is None:
+            status_code = getattr(response, 'status_code', None)
+            # A rejected token is refreshed, it does not mean that SLS is failing
+            if status_code != 401:
+                self.circuit_breaker.record_failure()
+            raise SLSUnavailable('SLS failed to respond.', status_code=status_code)
+
+        self.circuit_breaker.record_success()
+        return response_data
+
+
+_sls_client = None
+_sls_client_lock = threading.Lock()
+
+def get_sls_client():
+    global _sls_client
+    with _sls_client_lock:
+        if _sls_client is None:
+            _sls_client = SLSClient.from_settings()
+    return _sls_client
+
+def reset_sls_client():
+    """Drop the SLS client, to be created again from the settings."""
+    global _sls_client
+    with _sls_client_lock:
+        if _sls_client is not None:
+            _sls_client.close()
+        _sls_client = None
+
+
+def get_sls_user_data(user_id):
+    return get_sls_client().get_user_data(user_id)
 
 
 def convert_sls_user_to_classbuzz(sls_user):
@@ -93,3 +301,9 @@ def convert_sls_user_to_classbuzz(sls_user):
         "groups": sls_user.get("groups", []),
     }
     return user_data
+
+
+@receiver(setting_changed)
+def reset_sls_client_on_setting_changed(setting, **kwargs):
+    if setting == 'SLS_CLIENT':
+        reset_sls_client()
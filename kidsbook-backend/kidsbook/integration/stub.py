@@ -0,0 +1,148 @@
+import json
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+GROUPS = [
+    {'name': 'SE1-MATHS-1 MATHEMATICS', 'code': 'SE1-MATHS-1', 'subject': 'MATHEMATICS'},
+    {'name': 'SE1-SCI-1 SCIENCE', 'code': 'SE1-SCI-1', 'subject': 'SCIENCE'},
+    {'name': 'SE1-CH(SS,HE)-1 COMBINED HUMANITIES (S,H)', 'code': 'SE1-CH(SS,HE)-1', 'subject': 'COMBINED HUMANITIES (S,H)'},
+    {'name': 'SE1-LIT(E)-1 LITERATURE(E)', 'code': 'SE1-LIT(E)-1', 'subject': 'LITERATURE(E)'},
+]
+
+# The test users of the staging SLS
+USERS = {
+    '04dd6d77-1121-4a74-9499-f22fa924f3ce': {
+        'uuid': '04dd6d77-1121-4a74-9499-f22fa924f3ce',
+        'name': 'TESTER 107',
+        'role': 'student',
+        'email': '',
+        'groups': GROUPS,
+    },
+    'e37a72e6-bfcc-4d7f-9a41-e556ccf67348': {
+        'uuid': 'e37a72e6-bfcc-4d7f-9a41-e556ccf67348',
+        'name': 'TESTER 118',
+        'role': 'teacher',
+        'email': '',
+        'groups': GROUPS,
+    },
+}
+
+USER_UUID_PATTERN = re.compile(r'user\(uuid:\s*"([^"]*)"\)')
+
+
+class FakeSLSHandler(BaseHTTPRequestHandler):
+    """Issue tokens on /token, and answer the user queries of the tokens' bearers on /graphql."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.record_connection()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.record_request()
+        if self.server.failing:
+            self.send_json(500, {'errors': [{'message': 'Internal error'}]})
+            return
+        try:
+            payload = json.loads(body.decode('utf-8'))
+        except ValueError:
+            self.send_json(400, {'errors': [{'message': 'Invalid JSON'}]})
+            return
+
+        if self.path.endswith('/token'):
+            self.send_json(200, {'data': {'token': self.server.issue_token(), 'expiresIn': self.server.token_ttl}})
+            return
+
+        authorization = self.headers.get('Authorization', '')
+        if not self.server.is_valid_token(authorization[len('Bearer '):]):
+            self.send_json(401, {'errors': [{'message': 'Unauthorized'}]})
+            return
+
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        self.server.record_query()
+        match = USER_UUID_PATTERN.search(payload.get('query', ''))
+        user = USERS.get(match.group(1)) if match else None
+        if user is None:
+            self.send_json(200, {'data': {'user': None}, 'errors': [{'message': 'User not found'}]})
+        else:
+            self.send_json(200, {'data': {'user': user}})
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSLSServer(socketserver.ThreadingMixIn, HTTPServer):
+    """A local SLS GraphQL server, to test the SLS client and the SLS login."""
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), token_ttl=3600, delay=0):
+        super().__init__(address, FakeSLSHandler)
+        self.token_ttl = token_ttl
+        self.delay = delay
+        self.failing = False
+        self.num_connections = 0
+        self.num_requests = 0
+        self.num_tokens = 0
+        self.num_queries = 0
+        self._tokens = set()
+        self._lock = threading.Lock()
+
+    @property
+    def token_url(self):
+        return 'http://{}:{}/apis/v1/token'.format(*self.server_address[:2])
+
+    @property
+    def graphql_url(self):
+        return 'http://{}:{}/apis/v1/graphql'.format(*self.server_address[:2])
+
+    def issue_token(self):
+        with self._lock:
+            self.num_tokens += 1
+            token = 'token-{}'.format(self.num_tokens)
+            self._tokens.add(token)
+            return token
+
+    def is_valid_token(self, token):
+        with self._lock:
+            return token in self._tokens
+
+    def revoke_tokens(self):
+        with self._lock:
+            self._tokens.clear()
+
+    def record_connection(self):
+        with self._lock:
+            self.num_connections += 1
+
+    def record_request(self):
+        with self._lock:
+            self.num_requests += 1
+
+    def record_query(self):
+        with self._lock:
+            self.num_queries += 1
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,46 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+from django.core.management.base import BaseCommand
+
+from kidsbook.models import Comment, Post, UserGroupStats, UserLikeComment, UserLikePost
+
+
+def count_by(queryset, user_field, group_field):
+    """Return the number of rows of `queryset` by (user, group)."""
+    rows = queryset.order_by().values_list(user_field, group_field).annotate(count=Count('pk'))
+    return {(user_id, group_id): count for user_id, group_id, count in rows}
+
+
+class Command(BaseCommand):
+    help = 'Recompute the engagement stats of every user in every group.'
+
+    def handle(self, *args, **options):
+        counts = {
+            'num_posts': [count_by(Post.objects.all(), 'creator_id', 'group_id')],
+            'num_comments': [count_by(Comment.objects.all(), 'creator_id', 'post__group_id')],
+            'num_likes_given': [
+                count_by(UserLikePost.objects.all(), 'user_id', 'post__group_id'),
+                count_by(UserLikeComment.objects.all(), 'user_id', 'comment__post__group_id'),
+            ],
+            'num_likes_received': [
+                count_by(UserLikePost.objects.all(), 'post__creator_id', 'post__group_id'),
+                count_by(UserLikeComment.objects.all(), 'comment__creator_id', 'comment__post__group_id'),
+            ],
+        }
+
+        stats = defaultdict(dict)
+        for field, field_counts in counts.items():
+            for count_by_key in field_counts:
+                for key, count in count_by_key.items():
+                    stats[key][field] = stats[key].get(field, 0) + count
+
+        with transaction.atomic():
+            UserGroupStats.objects.all().delete()
+            UserGroupStats.objects.bulk_create([
+                UserGroupStats(user_id=user_id, group_id=group_id, **fields)
+                for (user_id, group_id), fields in stats.items()
+            ], batch_size=1000)
+
+        self.stdout.write('Recomputed the stats of {} users in groups.'.format(len(stats)))
@@ -0,0 +1,40 @@
+import time
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from kidsbook.hashing import hash_passwords, make_placeholder_password
+
+
+class Command(BaseCommand):
+    help = 'Print the logins/sec and imports/sec of the password hashers, serial and across processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=32, help='Number of passwords to hash')
+        parser.add_argument('--workers', type=int, default=None, help='Processes hashing the passwords')
+
+    def rate(self, count, function):
+        start = time.perf_counter()
+        function()
+        return count / (time.perf_counter() - start)
+
+    def handle(self, *args, **options):
+        count = options['count']
+        passwords = ['password_{}'.format(index) for index in range(count)]
+
+        serial = self.rate(count, lambda: [make_password(password) for password in passwords])
+        with override_settings(PASSWORD_HASHING={'WORKERS': options['workers'], 'MIN_POOL_BATCH_SIZE': 2}):
+            pooled = self.rate(count, lambda: hash_passwords(passwords))
+        placeholder = self.rate(count, lambda: hash_passwords([None] * count))
+        self.stdout.write('Imports/sec: {:.1f} serial, {:.1f} across processes, {:.1f} with the placeholder hasher'.format(
+            serial, pooled, placeholder
+        ))
+
+        encoded = make_password(passwords[0])
+        logins = self.rate(count, lambda: [check_password(passwords[0], encoded) for _ in range(count)])
+        encoded = make_placeholder_password(passwords[0])
+        placeholder_logins = self.rate(count, lambda: [check_password(passwords[0], encoded) for _ in range(count)])
+        self.stdout.write('Logins/sec: {:.1f} with the preferred hasher, {:.1f} with the placeholder hasher'.format(
+            logins, placeholder_logins
+        ))
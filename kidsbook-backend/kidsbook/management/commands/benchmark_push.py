@@ -0,0 +1,55 @@
+import time
+from uuid import uuid4
+
+from django.core.management.base import BaseCommand
+
+from kidsbook.notification.push import PushClient
+from kidsbook.notification.stub import StubPushServer
+
+
+class Command(BaseCommand):
+    help = 'Push fake notifications to a local stub server and print the latencies.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000, help='Number of notifications to push')
+        parser.add_argument('--batch-format', default='single', choices=PushClient.BATCH_FORMATS)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--delay', type=float, default=0, help='Seconds the stub server waits per request')
+        parser.add_argument('--endpoint', help='Push to this URL instead of a local stub server')
+
+    def handle(self, *args, **options):
+        server = None
+        endpoint = options['endpoint']
+        if endpoint is None:
+            server = StubPushServer(delay=options['delay'])
+            server.start()
+            endpoint = server.url
+
+        client = PushClient(
+            endpoint,
+            secret_key='benchmark',
+            batch_format=options['batch_format'],
+            batch_size=options['batch_size'],
+            max_concurrency=options['concurrency']
+        )
+        notifications = [
+            {'id': uuid4(), 'user_id': uuid4(), 'content': 'Benchmark notification {}'.format(index)}
+            for index in range(options['count'])
+        ]
+
+        start = time.perf_counter()
+        client.push_many(notifications)
+        elapsed = time.perf_counter() - start
+        client.close()
+
+        metrics = client.metrics()
+        self.stdout.write('Pushed {} notifications in {} requests: {:.3f}s ({} failed)'.format(
+            metrics['notifications'], metrics['requests'], elapsed, metrics['failed_requests']
+        ))
+        if server is not None:
+            self.stdout.write('Stub server connections: {}'.format(server.num_connections))
+            server.stop()
+
+        for bucket, count in metrics['latency']['buckets'].items():
+            self.stdout.write('  {:>8} {}'.format(bucket, count))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from kidsbook.models import ScreenTime
+
+
+class Command(BaseCommand):
+    help = (
+        'Merge the screen times of the same user and date into one row, adding up their times. '
+        'Run it before migrating a database created before screen times were unique by (user, date).'
+    )
+
+    def handle(self, *args, **options):
+        duplicates = ScreenTime.objects.values('user_id', 'date').annotate(
+            num_rows=Count('id'), total=Sum('total_time')
+        ).filter(num_rows__gt=1)
+
+        num_merged = 0
+        with transaction.atomic():
+            for duplicate in list(duplicates):
+                screen_times = ScreenTime.objects.filter(user_id=duplicate['user_id'], date=duplicate['date']).order_by('id')
+                kept_id = screen_times.values_list('id', flat=True).first()
+                ScreenTime.objects.filter(id=kept_id).update(total_time=duplicate['total'])
+                num_merged += screen_times.exclude(id=kept_id).delete()[0]
+
+        self.stdout.write('Merged {} duplicated screen times.'.format(num_merged))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from kidsbook.models import BlackListedToken
+from kidsbook.revocation import get_token_expiration
+
+
+class Command(BaseCommand):
+    help = 'Delete the blacklisted tokens which have expired.'
+
+    def handle(self, *args, **options):
+        # The tokens blacklisted before `expires_at` existed
+        for blacklisted_token in BlackListedToken.objects.filter(expires_at__isnull=True).iterator():
+            expires_at = get_token_expiration(blacklisted_token.token)
+            if expires_at is not None:
+                BlackListedToken.objects.filter(id=blacklisted_token.id).update(expires_at=expires_at)
+
+        num_deleted, _ = BlackListedToken.objects.filter(expires_at__lt=timezone.now()).delete()
+        self.stdout.write('Deleted {} expired blacklisted tokens.'.format(num_deleted))
@@ -0,0 +1,25 @@
+from django.db import transaction
+from django.core.management.base import BaseCommand
+
+from kidsbook.game_stats import lock_game, rebuild_game_stats
+from kidsbook.models import Game
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stats of the games (the choices and the endings) from the answers of the users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('game_ids', nargs='*', help='IDs of the games, all the games by default')
+
+    def handle(self, *args, **options):
+        game_ids = options['game_ids'] or Game.objects.values_list('id', flat=True)
+
+        num_games = 0
+        for game_id in game_ids:
+            with transaction.atomic():
+                game = lock_game(game_id)
+                rebuild_game_stats(game)
+                game.save(update_fields=['stats'])
+            num_games += 1
+
+        self.stdout.write('Recomputed the stats of {} games.'.format(num_games))
@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.core.management.base import BaseCommand
+
+from kidsbook.models import Comment, Post, UserFlagPost, UserLikeComment, UserLikePost, UserSharePost
+
+
+def count_of(queryset, field):
+    """A subquery counting the rows of `queryset` whose `field` is the outer row."""
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+class Command(BaseCommand):
+    help = 'Recompute the like, dislike, comment, share and flag counters of every post and comment.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            num_posts = Post.objects.update(
+                like_count=count_of(UserLikePost.objects.filter(like_or_dislike=True), 'post'),
+                dislike_count=count_of(UserLikePost.objects.filter(like_or_dislike=False), 'post'),
+                comment_count=count_of(Comment.objects.filter(is_deleted=False), 'post'),
+                share_count=count_of(UserSharePost.objects.all(), 'post'),
+                flag_count=count_of(UserFlagPost.objects.all(), 'post')
+            )
+            num_comments = Comment.objects.update(
+                like_count=count_of(UserLikeComment.objects.filter(like_or_dislike=True), 'comment'),
+                dislike_count=count_of(UserLikeComment.objects.filter(like_or_dislike=False), 'comment'),
+                flag_count=count_of(UserFlagPost.objects.all(), 'comment')
+            )
+
+        self.stdout.write('Refreshed the counters of {} posts and {} comments.'.format(num_posts, num_comments))
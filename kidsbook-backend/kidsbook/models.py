@@ -8,51 +8,91 @@ from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import (AbstractBaseUser, BaseUserManager,
                                         PermissionsMixin, User)
 from django.contrib.postgres.fields import ArrayField, JSONField
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
+from kidsbook.hashing import make_placeholder_password
+
 
 def format_value(value):
     if isinstance(value, list) and len(value) == 1:
         return value[0]
     return value
 
+# The roles are static: they are saved after every `migrate`, and never read from the DB
+ROLES = {
+    1: 'teacher',
+    2: 'student',
+    3: 'Virtual student',
+}
+
+class RoleManager(models.Manager):
+    _roles = {}
+
+    def get_cached(self, role_id):
+        """Return the role from the registry of `ROLES`, without any query (None for an unknown role)."""
+        if role_id not in self._roles and role_id in ROLES:
+            role = self.model(id=role_id, name=ROLES[role_id])
+            role._state.adding = False
+            role._state.db = self.db
+            self._roles[role_id] = role
+        return self._roles.get(role_id, None)
+
 class Role(models.Model):
     id = models.PositiveSmallIntegerField(primary_key=True)
     name = models.CharField(max_length=100)
 
+    objects = RoleManager()
+
+class CachedRoleDescriptor(ForwardManyToOneDescriptor):
+    """Resolve `user.role` from the registry of roles, without any query."""
+
+    def get_object(self, instance):
+        role = Role.objects.get_cached(getattr(instance, self.field.attname))
+        if role is None:
+            return super().get_object(instance)
+        return role
+
+class RoleForeignKey(models.ForeignKey):
+    forward_related_accessor_class = CachedRoleDescriptor
+
 # Create your models here.
 class UserManager(BaseUserManager):
     # use_in_migrations = True
 
     def create_roles(self):
-        role1 = Role(id=1, name='teacher')
-        role2 = Role(id=2, name='student')
-        role3 = Role(id=3, name='Virtual student')
-        role1.save()
-        role2.save()
-        role3.save()
+        for role_id, name in ROLES.items():
+            Role(id=role_id, name=name).save()
 
     #def _create_user(self, username, email_address, password, role, **extra_fields):
     def _create_user(self, **kargs):
         """
         Creates and saves a User with the given username, email and password.
         """
-        self.create_roles()
         if 'username' not in kargs:
             raise ValueError('The given username must be set')
 
         role = kargs.pop('role', 2)
-        password = kargs.pop('password', '12345')
+        password = kargs.pop('password', None)
 
         #email_address = self.normalize_email(kargs['email_address'])
         kargs['email_address'] = self.normalize_email(kargs['email_address'])
         user = self.model(**kargs)
 
-        user.role = Role(id=role)
-        user.set_password(password)
+        user.role = Role.objects.get_cached(role) or Role(id=role)
+        if password is None:
+            # Hashed again with the preferred hasher on the first login
+            user.password = make_placeholder_password()
+        else:
+            user.set_password(password)
 
         # if(kargs['teacher_id']):
         #     teacher = User.objects.get(id=kargs['teacher_id'])
@@ -119,7 +159,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     last_active_time = models.PositiveIntegerField(default=0)
     # role_id = models.ForeignKey(Role, related_name='post_owner', on_delete=models.CASCADE, default=0)
-    role = models.ForeignKey(Role, related_name='group_owner', on_delete=models.CASCADE)
+    role = RoleForeignKey(Role, related_name='group_owner', on_delete=models.CASCADE)
 
     is_staff = models.BooleanField(
         _('staff status'),
@@ -133,6 +173,24 @@ class User(AbstractBaseUser, PermissionsMixin):
     REQUIRED_FIELDS = ["password", "is_active", "realname"]
     objects = UserManager()
 
+def get_user_cache_version_key(user_id):
+    return 'kidsbook:user_version:{}'.format(user_id)
+
+def forget_users(user_ids):
+    """
+    Expire the cached users of the authentication, now and once the change is committed.
+    To be called wherever the users are written without `save()` (`update()`, raw SQL).
+    """
+    version_keys = [get_user_cache_version_key(user_id) for user_id in user_ids]
+    if not version_keys:
+        return
+    cache.delete_many(version_keys)
+    transaction.on_commit(lambda: cache.delete_many(version_keys))
+
+@receiver([post_save, post_delete], sender=User)
+def forget_user(sender, instance, **kwargs):
+    forget_users([instance.id])
+
 class UserSetting(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -146,14 +204,38 @@ class ScreenTime(models.Model):
     date = models.DateField(_("Date"), default=datetime.date.today)
     total_time = models.FloatField(default=0)
 
+    class Meta:
+        unique_together = ('user', 'date')
+
 class BlackListedToken(models.Model):
     token = models.CharField(max_length=500)
     user = models.ForeignKey(User, related_name="token_user", on_delete=models.CASCADE)
     timestamp = models.DateTimeField(auto_now=True)
+    # The `exp` of the token: the row can be deleted after it
+    expires_at = models.DateTimeField(null=True, db_index=True)
 
     class Meta:
         unique_together = ("token", "user")
 
+class UserImportJob(models.Model):
+    """The progress and the result of an import of users from a CSV file."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUSES = ((PENDING, 'Pending'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed'))
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    creator = models.ForeignKey(User, related_name='user_import_jobs', on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=STATUSES, default=PENDING)
+    num_rows = models.PositiveIntegerField(default=0)
+    num_processed = models.PositiveIntegerField(default=0)
+    created_users = ArrayField(models.UUIDField(), default=list, blank=True)
+    # [{'line': <line in the file>, 'error': <message>}]
+    errors = JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
 class GroupManager(models.Manager):
     #def create_group(self, name, creator):
     def create_group(self, **kargs):
@@ -198,6 +280,16 @@ class GroupMember(models.Model):
     class Meta:
         unique_together = ('user', 'group')
 
+def get_group_ids_cache_key(user_id):
+    return 'kidsbook:group_ids:{}'.format(user_id)
+
+@receiver([post_save, post_delete], sender=GroupMember)
+def forget_group_ids(sender, instance, **kwargs):
+    """Clear the cached group IDs of the user, now and once the change is committed."""
+    cache_key = get_group_ids_cache_key(instance.user_id)
+    cache.delete(cache_key)
+    transaction.on_commit(lambda: cache.delete(cache_key))
+
 class GroupSettings(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     group = models.OneToOneField(Group, on_delete=models.CASCADE)
@@ -208,13 +300,136 @@ class GroupSettings(models.Model):
     enable_reflection = models.BooleanField(default=False)
 
 
+class UserGroupStats(models.Model):
+    """The engagement of a user in a group, kept up to date by `CountedModel`."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, related_name='group_stats', on_delete=models.CASCADE)
+    group = models.ForeignKey(Group, related_name='user_stats', on_delete=models.CASCADE)
+    num_posts = models.PositiveIntegerField(default=0)
+    num_comments = models.PositiveIntegerField(default=0)
+    num_likes_given = models.PositiveIntegerField(default=0)
+    num_likes_received = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'group')
+
+    @classmethod
+    def increase_counter(cls, key, field, value):
+        user_id, group_id = key
+        if value > 0:
+            cls.objects.get_or_create(user_id=user_id, group_id=group_id)
+            cls.objects.filter(user_id=user_id, group_id=group_id).update(**{field: F(field) + value})
+        else:
+            # Never create a row here: the group or the user may be being deleted
+            cls.objects.filter(user_id=user_id, group_id=group_id).update(**{field: Greatest(F(field) + value, 0)})
+
+class CountedModel(models.Model):
+    """
+    A row counted by the denormalized counters of posts, comments and `UserGroupStats`.
+
+    The counters are updated in the same transaction as the row is saved or deleted.
+    """
+
+    class Meta:
+        abstract = True
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Connected for the counted models only: a receiver of every model would slow down all their saves,
+        # and disable the fast deletes of the cascades
+        pre_save.connect(load_deferred_values, sender=cls)
+        post_save.connect(update_counters_on_save, sender=cls)
+        post_delete.connect(update_counters_on_delete, sender=cls)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Keep the loaded values, to find the counters to update when the row is saved
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def get_counters(self, values):
+        """
+        Return the counters, as (model, key, field), which include a row with these `values`.
+        `key` is the primary key of the row of `model`, unless `model` has its own `increase_counter`.
+        """
+        return []
+
+    def get_current_values(self):
+        return {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+def increase_counter(model, key, field, value):
+    if hasattr(model, 'increase_counter'):
+        model.increase_counter(key, field, value)
+    elif value > 0:
+        model.objects.filter(pk=key).update(**{field: F(field) + value})
+    else:
+        model.objects.filter(pk=key).update(**{field: Greatest(F(field) + value, 0)})
+
+def update_counters(old_counters, new_counters):
+    for model, key, field in set(old_counters) - set(new_counters):
+        increase_counter(model, key, field, -1)
+    for model, key, field in set(new_counters) - set(old_counters):
+        increase_counter(model, key, field, 1)
+
+def load_deferred_values(sender, instance, **kwargs):
+    """Load the old values of the deferred fields (`only()`, `defer()`), to find the counters of the row before it is saved."""
+    if instance._state.adding:
+        return
+
+    loaded_values = getattr(instance, '_loaded_values', None)
+    if not loaded_values:
+        return
+    deferred = [field.attname for field in instance._meta.concrete_fields if field.attname not in loaded_values]
+    if deferred:
+        loaded_values.update(type(instance)._base_manager.filter(pk=instance.pk).values(*deferred).first() or {})
+
+def update_counters_on_save(sender, instance, created, **kwargs):
+    current_values = instance.get_current_values()
+    loaded_values = getattr(instance, '_loaded_values', None)
+    old_counters = []
+    if not created and loaded_values:
+        # The fields of a row deleted since it was loaded are taken as unchanged
+        old_counters = instance.get_counters(dict(current_values, **loaded_values))
+    update_counters(old_counters, instance.get_counters(current_values))
+    instance._loaded_values = current_values
+
+def update_counters_on_delete(sender, instance, **kwargs):
+    update_counters(instance.get_counters(instance.get_current_values()), [])
+
+def get_post_stats_keys(post_id):
+    """Return the group of the post and its creator, or None if the post no longer exists."""
+    return Post.objects.filter(id=post_id).values_list('group_id', 'creator_id').first()
+
+def get_comment_stats_keys(comment_id):
+    """Return the group of the comment and its creator, or None if the comment no longer exists."""
+    return Comment.objects.filter(id=comment_id).values_list('post__group_id', 'creator_id').first()
+
+def get_like_stats_counters(user_id, keys):
+    """The stats counters of a like given by the user to the post or comment whose (group, creator) are `keys`."""
+    if keys is None:
+        return []
+    group_id, creator_id = keys
+    return [
+        (UserGroupStats, (user_id, group_id), 'num_likes_given'),
+        (UserGroupStats, (creator_id, group_id), 'num_likes_received'),
+    ]
+
 class PostManager(models.Manager):
     def create_post(self, **kargs):
         post = self.model(**kargs)
         post.save(using=self._db)
         return post
 
-class Post(models.Model):
+class Post(CountedModel):
     # use_in_migrations = True
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -233,13 +448,23 @@ class Post(models.Model):
     is_random = models.BooleanField(default=False)
     is_announcement = models.BooleanField(default=False)
 
+    # Denormalized counters, see `CountedModel`
+    like_count = models.PositiveIntegerField(default=0)
+    dislike_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    share_count = models.PositiveIntegerField(default=0)
+    flag_count = models.PositiveIntegerField(default=0)
+
     REQUIRED_FIELDS = ["content"]
 
     objects = PostManager()
     class Meta:
         ordering = ('created_at',)
 
-class UserLikePost(models.Model):
+    def get_counters(self, values):
+        return [(UserGroupStats, (values['creator_id'], values['group_id']), 'num_posts')]
+
+class UserLikePost(CountedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
@@ -247,12 +472,20 @@ class UserLikePost(models.Model):
     class Meta:
         unique_together = ["user", "post"]
 
-class UserSharePost(models.Model):
+    def get_counters(self, values):
+        counters = [(Post, values['post_id'], 'like_count' if values['like_or_dislike'] else 'dislike_count')]
+        # Likes and dislikes are both counted in the stats
+        return counters + get_like_stats_counters(values['user_id'], get_post_stats_keys(values['post_id']))
+
+class UserSharePost(CountedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
     class Meta:
         unique_together = ["user", "post"]
+
+    def get_counters(self, values):
+        return [(Post, values['post_id'], 'share_count')]
 # class CommentManager(models.Manager):
 #     def create_comment(self, **kargs):
 #         comment = self.model(**kargs)
@@ -265,7 +498,7 @@ class CommentManager(models.Manager):
         comment.save(using=self._db)
         return comment
 
-class Comment(models.Model):
+class Comment(CountedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     content = models.CharField(max_length=2000)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -275,12 +508,28 @@ class Comment(models.Model):
     likes = models.ManyToManyField(User, related_name='comment_likers', through='UserLikeComment')
     is_deleted = models.BooleanField(default=False)
 
+    # Denormalized counters, see `CountedModel`
+    like_count = models.PositiveIntegerField(default=0)
+    dislike_count = models.PositiveIntegerField(default=0)
+    flag_count = models.PositiveIntegerField(default=0)
+
     REQUIRED_FIELDS = ['post', 'creator', 'content']
 
     # use_in_migrations = True
     objects = CommentManager()
 
-class UserLikeComment(models.Model):
+    def get_counters(self, values):
+        counters = []
+        keys = get_post_stats_keys(values['post_id'])
+        if keys is not None:
+            counters.append((UserGroupStats, (values['creator_id'], keys[0]), 'num_comments'))
+
+        # The deleted comments are hidden, so they are not counted by the post
+        if not values['is_deleted']:
+            counters.append((Post, values['post_id'], 'comment_count'))
+        return counters
+
+class UserLikeComment(CountedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     comment = models.ForeignKey(Comment, on_delete=models.CASCADE)
@@ -288,7 +537,11 @@ class UserLikeComment(models.Model):
     class Meta:
         unique_together = ["user", "comment"]
 
-class UserFlagPost(models.Model):
+    def get_counters(self, values):
+        counters = [(Comment, values['comment_id'], 'like_count' if values['like_or_dislike'] else 'dislike_count')]
+        return counters + get_like_stats_counters(values['user_id'], get_comment_stats_keys(values['comment_id']))
+
+class UserFlagPost(CountedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
@@ -299,6 +552,13 @@ class UserFlagPost(models.Model):
     class Meta:
         unique_together = ["user", "comment", "post"]
 
+    def get_counters(self, values):
+        # Like `Post.flags`, the flags of a post include the flags of its comments
+        counters = [(Post, values['post_id'], 'flag_count')]
+        if values['comment_id'] is not None:
+            counters.append((Comment, values['comment_id'], 'flag_count'))
+        return counters
+
 class Notification(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, related_name='user_notification', on_delete=models.CASCADE, default=uuid.uuid4)
@@ -356,6 +616,7 @@ class SurveyAnswer(models.Model):
     user = models.ForeignKey(User, related_name='survey_user', on_delete=models.CASCADE, default=uuid.uuid4)
     survey = models.ForeignKey(Survey, related_name='user_survey', on_delete=models.CASCADE)
     answers = ArrayField(models.CharField(max_length=2000))
+    created_at = models.DateTimeField(default=timezone.now)
 
     REQUIRED_FIELDS = ["user", "survey", "answers"]
 
@@ -413,3 +674,13 @@ class GameScene(models.Model):
     - speech (str): The name's speech in the dialogue.
     - tag (str): To store the user's answers and his pathway. Only applicable if field is_end of its scene is True.
     '''
+
+def get_game_graph_version_key(game_id):
+    return 'kidsbook:game_graph_version:{}'.format(game_id)
+
+@receiver([post_save, post_delete], sender=GameScene)
+def forget_game_graph(sender, instance, **kwargs):
+    """Expire the compiled graph of the game of the scene, now and once the change is committed."""
+    version_key = get_game_graph_version_key(instance.game_id)
+    cache.delete(version_key)
+    transaction.on_commit(lambda: cache.delete(version_key))
@@ -0,0 +1,280 @@
+import queue
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections, transaction
+from django.dispatch import receiver
+
+from kidsbook.notification.push import PushFailed, get_push_client
+from kidsbook.notification.service import create_notifications, get_notifications_to_push
+from kidsbook.serializers import NotificationSerializer
+
+
+DEFAULT_DISPATCHER_SETTINGS = {
+    'ASYNC': True,
+    'NUM_WORKERS': 4,
+    'MAX_RETRIES': 3,
+    'RETRY_DELAY': 0.5,         # seconds, doubled after every failed attempt
+    'DEAD_LETTER_SIZE': 1000,
+}
+
+
+class FanOutEvent:
+    """
+    A notification with the same content, sent to many recipients.
+    Once its notifications are created, `pending_pushes` holds the serialized notifications left to push,
+    so a retry only pushes them again.
+    """
+
+    def __init__(self, recipient_ids, content, group_id, post_id=None, comment_id=None, action_user_id=None):
+        self.recipient_ids = list(recipient_ids)
+        self.content = content
+        self.group_id = group_id
+        self.post_id = post_id
+        self.comment_id = comment_id
+        self.action_user_id = action_user_id
+        self.attempts = 0
+        self.pending_pushes = None
+
+    def __repr__(self):
+        return '<FanOutEvent {} recipients: {}>'.format(len(self.recipient_ids), repr(self.content))
+
+
+def deliver_fan_out_event(event, push_client=None):
+    """
+    Create the notifications of the event and update the unseen counts, once,
+    then push them. Raise a `PushFailed` if some could not be pushed, to be retried.
+    """
+    notifications = None
+    if event.pending_pushes is None:
+        notifications = create_notifications(
+            event.recipient_ids,
+            event.content,
+            event.group_id,
+            post_id=event.post_id,
+            comment_id=event.comment_id,
+            action_user_id=event.action_user_id
+        )
+
+        # Push the notifications, except to the user who triggered them
+        notifications_to_push = get_notifications_to_push(notifications, exclude_user_id=event.action_user_id)
+        event.pending_pushes = list(NotificationSerializer(notifications_to_push, many=True).data)
+
+    try:
+        (push_client or get_push_client()).push_many(event.pending_pushes, raise_on_failure=True)
+    except PushFailed as exc:
+        event.pending_pushes = exc.notifications
+        raise
+    event.pending_pushes = []
+
+    return notifications
+
+
+class LocalQueueBackend:
+    """An in-process FIFO queue shared by the workers of one dispatcher."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put(self, event):
+        self._queue.put(event)
+
+    def get(self, timeout=None):
+        """Return the next event, or None if there is none before `timeout`."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def task_done(self):
+        self._queue.task_done()
+
+    def join(self):
+        self._queue.join()
+
+    def qsize(self):
+        return self._queue.qsize()
+
+
+class NotificationDispatcher:
+    """
+    Deliver fan-out events on a pool of background threads.
+
+    A failed delivery is retried `max_retries` times with an exponential delay,
+    then moved to the dead-letter queue.
+    With `is_async=False`, events are delivered on the caller's thread.
+    """
+
+    def __init__(self, backend=None, is_async=True, num_workers=4, max_retries=3, retry_delay=0.5,
+            dead_letter_size=1000, deliver=deliver_fan_out_event):
+        self.backend = backend if backend is not None else LocalQueueBackend()
+        self.is_async = is_async
+        self.num_workers = num_workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.deliver = deliver
+        self.dead_letters = deque(maxlen=dead_letter_size)
+
+        self._workers = []
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._num_pending_retries = 0
+        self._counters = {
+            'enqueued': 0,
+            'delivered': 0,
+            'retried': 0,
+            'dead_lettered': 0,
+        }
+
+    @classmethod
+    def from_settings(cls):
+        config = dict(DEFAULT_DISPATCHER_SETTINGS)
+        config.update(getattr(settings, 'NOTIFICATION_DISPATCHER', {}))
+        return cls(
+            is_async=config['ASYNC'],
+            num_workers=config['NUM_WORKERS'],
+            max_retries=config['MAX_RETRIES'],
+            retry_delay=config['RETRY_DELAY'],
+            dead_letter_size=config['DEAD_LETTER_SIZE']
+        )
+
+    def start(self):
+        with self._lock:
+            if self._workers:
+                return
+            self._stopping.clear()
+            for index in range(self.num_workers):
+                worker = threading.Thread(
+                    target=self._run_worker,
+                    name='notification-worker-{}'.format(index),
+                    daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def join(self):
+        """Block until every enqueued event is either delivered or dead-lettered."""
+        self.backend.join()
+        while self._num_pending_retries:
+            time.sleep(0.01)
+            self.backend.join()
+
+    def enqueue(self, event):
+        if not self.is_async:
+            self._increase('enqueued')
+            self._deliver_now(event)
+            return
+
+        self.start()
+        # Only hand the event to the workers (and count it) once the request's writes are visible:
+        # the events of a rolled back request are never enqueued
+        transaction.on_commit(lambda: self._put(event))
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._counters)
+            metrics['pending_retries'] = self._num_pending_retries
+        metrics['queue_depth'] = self.backend.qsize()
+        metrics['dead_letter_depth'] = len(self.dead_letters)
+        metrics['num_workers'] = len(self._workers)
+        return metrics
+
+    def _put(self, event):
+        self._increase('enqueued')
+        self.backend.put(event)
+
+    def _increase(self, counter, value=1):
+        with self._lock:
+            self._counters[counter] += value
+
+    def _deliver_now(self, event):
+        while True:
+            try:
+                self.deliver(event)
+                self._increase('delivered')
+                return
+            except Exception as exc:
+                if not self._should_retry(event, exc):
+                    return
+
+    def _should_retry(self, event, exc):
+        event.attempts += 1
+        if event.attempts > self.max_retries:
+            self.dead_letters.append((event, str(exc)))
+            self._increase('dead_lettered')
+            return False
+
+        self._increase('retried')
+        return True
+
+    def _retry_later(self, event):
+        # Count the retry as pending until it is back in the queue, for `join()` to wait for it
+        self.backend.put(event)
+        with self._lock:
+            self._num_pending_retries -= 1
+
+    def _run_worker(self):
+        while not self._stopping.is_set():
+            event = self.backend.get(timeout=0.5)
+            if event is None:
+                continue
+
+            try:
+                self.deliver(event)
+                self._increase('delivered')
+            except Exception as exc:
+                if self._should_retry(event, exc):
+                    with self._lock:
+                        self._num_pending_retries += 1
+                    delay = self.retry_delay * (2 ** (event.attempts - 1))
+                    timer = threading.Timer(delay, self._retry_later, [event])
+                    timer.daemon = True
+                    timer.start()
+            finally:
+                # Do not keep the worker's DB connection across events
+                close_old_connections()
+                self.backend.task_done()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = NotificationDispatcher.from_settings()
+    return _dispatcher
+
+@receiver(setting_changed)
+def reset_dispatcher(setting, **kwargs):
+    """Drop the dispatcher when its settings change, to be created again from them."""
+    global _dispatcher
+    if setting != 'NOTIFICATION_DISPATCHER':
+        return
+    with _dispatcher_lock:
+        if _dispatcher is not None:
+            _dispatcher.stop()
+        _dispatcher = None
+
+def dispatch_notification(recipient_ids, content, group, post=None, comment=None, action_user=None):
+    """Enqueue one notification for every recipient."""
+    event = FanOutEvent(
+        recipient_ids,
+        content,
+        group_id=group.id,
+        post_id=post.id if post is not None else None,
+        comment_id=comment.id if comment is not None else None,
+        action_user_id=action_user.id if action_user is not None else None
+    )
+    get_dispatcher().enqueue(event)
+    return event
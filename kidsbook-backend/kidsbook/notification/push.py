@@ -0,0 +1,200 @@
+import bisect
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from kidsbook.utils import UUIDEncoder
+
+
+DEFAULT_PUSH_CLIENT_SETTINGS = {
+    'BATCH_FORMAT': 'single',   # 'single': one notification per request, 'batch': `BATCH_SIZE` per request
+    'BATCH_SIZE': 50,
+    'MAX_CONCURRENCY': 4,       # requests in flight at the same time
+    'POOL_SIZE': 10,            # kept-alive connections
+    'TIMEOUT': 2,               # seconds
+}
+
+# Upper bounds, in seconds, of the latency buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+
+class PushFailed(Exception):
+    """Some notifications could not be pushed; they are kept in `notifications` to be pushed again."""
+
+    def __init__(self, notifications):
+        super().__init__('Failed to push {} notifications.'.format(len(notifications)))
+        self.notifications = notifications
+
+
+class LatencyHistogram:
+    """Count the observed latencies in cumulative buckets."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += seconds
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            buckets['<={}'.format(bound) if bound != '+Inf' else bound] = cumulative
+        return {'buckets': buckets, 'count': cumulative, 'sum': total}
+
+
+class PushClient:
+    """
+    Send notifications to the notification server over kept-alive connections.
+
+    With the 'batch' format, the notifications are sent `batch_size` per request
+    as {'secretKey': ..., 'notifications': [...]}.
+    At most `max_concurrency` requests are in flight at the same time.
+    A failed request is counted, and only raised (as `PushFailed`) when asked to.
+    """
+
+    BATCH_FORMATS = ('single', 'batch')
+
+    def __init__(self, endpoint, secret_key=None, batch_format='single', batch_size=50,
+            max_concurrency=4, pool_size=10, timeout=2):
+        if batch_format not in self.BATCH_FORMATS:
+            raise ValueError('Unknown batch format: {}.'.format(batch_format))
+
+        self.endpoint = endpoint
+        self.secret_key = secret_key
+        self.batch_format = batch_format
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.latency = LatencyHistogram()
+
+        self.session = requests.Session()
+        self.session.headers.update({'Content-type': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, self.max_concurrency))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix='push-client'
+        )
+        self._lock = threading.Lock()
+        self._counters = {
+            'notifications': 0,
+            'requests': 0,
+            'failed_requests': 0,
+        }
+
+    @classmethod
+    def from_settings(cls):
+        config = dict(DEFAULT_PUSH_CLIENT_SETTINGS)
+        config.update(getattr(settings, 'NOTIFICATION_PUSH_CLIENT', {}))
+        return cls(
+            getattr(settings, 'NOTIFICATION_ENDPOINT', None),
+            secret_key=getattr(settings, 'NOTIFICATION_SECRET_KEY', None),
+            batch_format=config['BATCH_FORMAT'],
+            batch_size=config['BATCH_SIZE'],
+            max_concurrency=config['MAX_CONCURRENCY'],
+            pool_size=config['POOL_SIZE'],
+            timeout=config['TIMEOUT']
+        )
+
+    def push(self, send_data):
+        return self.push_many([send_data])
+
+    def push_many(self, notifications, raise_on_failure=False):
+        """
+        Send the notifications and return the number of successful requests.
+        With `raise_on_failure`, raise a `PushFailed` with the notifications of the failed requests.
+        """
+        batches = self.build_batches(notifications)
+        if not batches:
+            return 0
+
+        with self._lock:
+            self._counters['notifications'] += len(notifications)
+
+        payloads = [self.build_payload(batch) for batch in batches]
+        if len(payloads) == 1:
+            results = [self._post(payloads[0])]
+        else:
+            results = list(self._executor.map(self._post, payloads))
+
+        if raise_on_failure and not all(results):
+            raise PushFailed([
+                send_data
+                for batch, is_successful in zip(batches, results) if not is_successful
+                for send_data in batch
+            ])
+        return sum(results)
+
+    def build_batches(self, notifications):
+        """Split the notifications into the lists sent by every request."""
+        size = 1 if self.batch_format == 'single' else self.batch_size
+        return [list(notifications[start:start + size]) for start in range(0, len(notifications), size)]
+
+    def build_payload(self, batch):
+        if self.batch_format == 'single':
+            return dict(batch[0], secretKey=self.secret_key)
+        return {'secretKey': self.secret_key, 'notifications': batch}
+
+    def build_payloads(self, notifications):
+        return [self.build_payload(batch) for batch in self.build_batches(notifications)]
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._counters)
+        metrics['latency'] = self.latency.snapshot()
+        return metrics
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    def _post(self, payload):
+        start = time.perf_counter()
+        is_successful = False
+        try:
+            response = self.session.post(
+                self.endpoint,
+                data=json.dumps(payload, cls=UUIDEncoder),
+                timeout=self.timeout
+            )
+            is_successful = response.ok
+        except Exception:
+            pass
+        finally:
+            self.latency.observe(time.perf_counter() - start)
+
+        with self._lock:
+            self._counters['requests'] += 1
+            if not is_successful:
+                self._counters['failed_requests'] += 1
+        return is_successful
+
+
+_push_client = None
+_push_client_lock = threading.Lock()
+
+def get_push_client():
+    global _push_client
+    with _push_client_lock:
+        if _push_client is None:
+            _push_client = PushClient.from_settings()
+    return _push_client
@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models import F
+
+from kidsbook.models import Notification, NotificationUser, UserSetting
+
+
+def unique_ids(ids):
+    """Remove the duplicated IDs, keeping their order."""
+    return list(dict.fromkeys(ids))
+
+def create_notifications(recipient_ids, content, group_id, post_id=None, comment_id=None, action_user_id=None):
+    """
+    Create a notification for every recipient with a single INSERT,
+    and increase their counts of unseen notifications with a single UPDATE.
+    """
+    recipient_ids = unique_ids(recipient_ids)
+    if not recipient_ids:
+        return []
+
+    with transaction.atomic():
+        notifications = Notification.objects.bulk_create([
+            Notification(
+                user_id=recipient_id,
+                group_id=group_id,
+                post_id=post_id,
+                comment_id=comment_id,
+                action_user_id=action_user_id,
+                content=content
+            )
+            for recipient_id in recipient_ids
+        ])
+        increase_unseen_counts(recipient_ids)
+
+    return notifications
+
+def increase_unseen_counts(user_ids, value=1):
+    """Atomically increase the counts of unseen notifications of the users."""
+    return NotificationUser.objects.filter(user_id__in=user_ids).update(
+        number_of_unseen=F('number_of_unseen') + value
+    )
+
+def get_users_receiving_notifications(user_ids):
+    """Return the IDs of the users, among `user_ids`, who turn on their notifications."""
+    return set(
+        UserSetting.objects.filter(user_id__in=user_ids, receive_notifications=True).values_list('user_id', flat=True)
+    )
+
+def get_notifications_to_push(notifications, exclude_user_id=None):
+    """Return the notifications whose user receives notifications, with their users loaded."""
+    receiving_user_ids = get_users_receiving_notifications([noti.user_id for noti in notifications])
+    receiving_user_ids.discard(exclude_user_id)
+    if not receiving_user_ids:
+        return []
+
+    return list(
+        Notification.objects.filter(
+            id__in=[noti.id for noti in notifications],
+            user_id__in=receiving_user_ids
+        ).select_related('user', 'action_user')
+    )
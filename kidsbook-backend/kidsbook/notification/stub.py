@@ -0,0 +1,72 @@
+import json
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+class StubPushHandler(BaseHTTPRequestHandler):
+    """Accept every notification, keeping the connection alive."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.record_connection()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            payload = json.loads(body.decode('utf-8'))
+        except ValueError:
+            self.send_response(400)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        self.server.record_payload(payload)
+
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubPushServer(socketserver.ThreadingMixIn, HTTPServer):
+    """A local notification server, to test and benchmark the push client."""
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), delay=0):
+        super().__init__(address, StubPushHandler)
+        self.delay = delay
+        self.num_connections = 0
+        self.num_requests = 0
+        self.num_notifications = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://{}:{}/notify'.format(*self.server_address[:2])
+
+    def record_connection(self):
+        with self._lock:
+            self.num_connections += 1
+
+    def record_payload(self, payload):
+        with self._lock:
+            self.num_requests += 1
+            self.num_notifications += len(payload.get('notifications', [payload]))
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.test import override_settings
 from rest_framework.test import APITestCase
 from kidsbook.models import *
 from kidsbook.serializers import *
@@ -16,6 +17,8 @@ class UUIDEncoder(json.JSONEncoder):
             return obj.hex
         return json.JSONEncoder.default(self, obj)
 
+# Deliver the notifications on the request's thread, for the tests to see them
+@override_settings(NOTIFICATION_DISPATCHER={'ASYNC': False})
 class TestGroup(APITestCase):
     def setUp(self):
         self.url = url_prefix + '/notifications/'
@@ -0,0 +1,203 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TransactionTestCase
+from rest_framework.test import APITestCase
+from kidsbook.models import *
+from kidsbook.notification.dispatcher import FanOutEvent, LocalQueueBackend, NotificationDispatcher, deliver_fan_out_event
+from kidsbook.notification.push import PushFailed
+from kidsbook.notification.service import create_notifications, get_notifications_to_push
+from kidsbook.user.views import generate_token
+
+User = get_user_model()
+url_prefix = '/api/v1'
+
+
+class FlakyPushClient:
+    """Fail the first `num_failures` pushes."""
+
+    def __init__(self, num_failures):
+        self.num_failures = num_failures
+        self.pushes = []
+
+    def push_many(self, notifications, raise_on_failure=False):
+        self.pushes.append(list(notifications))
+        if self.num_failures:
+            self.num_failures -= 1
+            raise PushFailed(notifications)
+        return len(notifications)
+
+
+class TestDispatcherWorkers(TransactionTestCase):
+    def create_dispatcher(self, deliver, **kargs):
+        dispatcher = NotificationDispatcher(num_workers=2, retry_delay=0.01, deliver=deliver, **kargs)
+        self.addCleanup(dispatcher.stop)
+        return dispatcher
+
+    def create_event(self):
+        return FanOutEvent(['recipient'], 'content', group_id='group')
+
+    def test_deliver_in_background(self):
+        delivered = []
+        dispatcher = self.create_dispatcher(delivered.append)
+        events = [self.create_event() for _ in range(5)]
+        for event in events:
+            dispatcher.enqueue(event)
+        dispatcher.join()
+
+        self.assertEqual(5, len(delivered))
+        self.assertEqual(5, dispatcher.metrics()['delivered'])
+        self.assertEqual(0, dispatcher.metrics()['queue_depth'])
+
+    def test_retry_failed_delivery(self):
+        delivered = []
+        def flaky_deliver(event):
+            if event.attempts < 2:
+                raise ConnectionError('Push server is down')
+            delivered.append(event)
+
+        dispatcher = self.create_dispatcher(flaky_deliver, max_retries=3)
+        dispatcher.enqueue(self.create_event())
+        dispatcher.join()
+
+        metrics = dispatcher.metrics()
+        self.assertEqual(1, len(delivered))
+        self.assertEqual(2, metrics['retried'])
+        self.assertEqual(0, metrics['dead_lettered'])
+
+    def test_dead_letter_after_max_retries(self):
+        def broken_deliver(event):
+            raise ConnectionError('Push server is down')
+
+        dispatcher = self.create_dispatcher(broken_deliver, max_retries=2)
+        event = self.create_event()
+        dispatcher.enqueue(event)
+        dispatcher.join()
+
+        metrics = dispatcher.metrics()
+        self.assertEqual(0, metrics['delivered'])
+        self.assertEqual(1, metrics['dead_lettered'])
+        self.assertEqual(1, metrics['dead_letter_depth'])
+        self.assertEqual((event, 'Push server is down'), dispatcher.dead_letters[0])
+
+    def test_skip_the_events_of_rolled_back_requests(self):
+        delivered = []
+        dispatcher = self.create_dispatcher(delivered.append)
+        try:
+            with transaction.atomic():
+                dispatcher.enqueue(self.create_event())
+                raise ValueError('The request failed')
+        except ValueError:
+            pass
+        dispatcher.enqueue(self.create_event())
+        dispatcher.join()
+
+        metrics = dispatcher.metrics()
+        self.assertEqual(1, len(delivered))
+        self.assertEqual(1, metrics['enqueued'])
+        self.assertEqual(1, metrics['delivered'])
+
+    def test_queue_depth(self):
+        backend = LocalQueueBackend()
+        dispatcher = self.create_dispatcher(lambda event: None, backend=backend)
+        for _ in range(3):
+            backend.put(self.create_event())
+
+        self.assertEqual(3, dispatcher.metrics()['queue_depth'])
+
+
+class TestDispatcherDelivery(APITestCase):
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(username="john", email_address="john@snow.com", password="you_know_nothing")
+        self.superuser_token = self.get_token(self.superuser)
+
+        self.member = User.objects.create_user(username="not_hey", email_address="not_kid@s.sss", password="want_some_cookies?")
+        self.member_token = self.get_token(self.member)
+
+        self.another_member = User.objects.create_user(username="mcdo", email_address="incense@s.sss", password="and_iron")
+
+        # Do not push to the notification server
+        UserSetting.objects.all().update(receive_notifications=False)
+
+        self.group = Group.objects.create_group(name="testing group", creator=self.superuser)
+        self.group.add_member(self.member)
+        self.group.add_member(self.another_member)
+
+    def get_token(self, user):
+        token = generate_token(user)
+        return 'Bearer {0}'.format(token.decode('utf-8'))
+
+    def test_deliver_fan_out_event(self):
+        dispatcher = NotificationDispatcher(is_async=False)
+        dispatcher.enqueue(FanOutEvent(
+            [self.member.id, self.another_member.id],
+            'A new announcement',
+            group_id=self.group.id,
+            action_user_id=self.superuser.id
+        ))
+
+        self.assertEqual(2, Notification.objects.filter(group=self.group, content='A new announcement').count())
+        self.assertEqual(1, NotificationUser.objects.get(user=self.member).number_of_unseen)
+        self.assertEqual(1, NotificationUser.objects.get(user=self.another_member).number_of_unseen)
+        self.assertEqual(0, NotificationUser.objects.get(user=self.superuser).number_of_unseen)
+        self.assertEqual(1, dispatcher.metrics()['delivered'])
+
+    def test_retry_only_the_failed_pushes(self):
+        UserSetting.objects.filter(user=self.member).update(receive_notifications=True)
+        push_client = FlakyPushClient(num_failures=1)
+        dispatcher = NotificationDispatcher(is_async=False, deliver=partial(deliver_fan_out_event, push_client=push_client))
+        dispatcher.enqueue(FanOutEvent(
+            [self.member.id, self.another_member.id],
+            'A new announcement',
+            group_id=self.group.id,
+            action_user_id=self.superuser.id
+        ))
+
+        # The notifications are created and counted once, and pushed again
+        self.assertEqual(2, Notification.objects.filter(group=self.group, content='A new announcement').count())
+        self.assertEqual(1, NotificationUser.objects.get(user=self.member).number_of_unseen)
+        self.assertEqual(2, len(push_client.pushes))
+        self.assertEqual(push_client.pushes[0], push_client.pushes[1])
+        self.assertEqual(1, len(push_client.pushes[1]))
+        self.assertEqual(1, dispatcher.metrics()['retried'])
+        self.assertEqual(1, dispatcher.metrics()['delivered'])
+
+    def test_create_notifications_with_duplicated_recipients(self):
+        notifications = create_notifications(
+            [self.member.id, self.member.id, self.another_member.id],
+            'A duplicated announcement',
+            self.group.id
+        )
+
+        self.assertEqual(2, len(notifications))
+        self.assertEqual(1, NotificationUser.objects.get(user=self.member).number_of_unseen)
+        self.assertEqual(1, NotificationUser.objects.get(user=self.another_member).number_of_unseen)
+
+    def test_create_notifications_in_constant_queries(self):
+        with self.assertNumQueries(4):
+            # SAVEPOINT, INSERT, UPDATE, RELEASE SAVEPOINT
+            create_notifications([self.member.id, self.another_member.id], 'Hello', self.group.id)
+
+    def test_get_notifications_to_push(self):
+        UserSetting.objects.filter(user=self.member).update(receive_notifications=True)
+        UserSetting.objects.filter(user=self.superuser).update(receive_notifications=True)
+        notifications = create_notifications(
+            [self.superuser.id, self.member.id, self.another_member.id],
+            'Hello',
+            self.group.id,
+            action_user_id=self.superuser.id
+        )
+
+        to_push = get_notifications_to_push(notifications, exclude_user_id=self.superuser.id)
+        self.assertEqual([self.member.id], [noti.user_id for noti in to_push])
+
+    def test_get_metrics(self):
+        response = self.client.get(url_prefix + '/notifications/metrics/', HTTP_AUTHORIZATION=self.superuser_token)
+        self.assertEqual(200, response.status_code)
+        self.assertIn('queue_depth', response.data['data'])
+        self.assertIn('dead_letter_depth', response.data['data'])
+
+    def test_get_metrics_by_non_superuser(self):
+        response = self.client.get(url_prefix + '/notifications/metrics/', HTTP_AUTHORIZATION=self.member_token)
+        self.assertEqual(403, response.status_code)
@@ -0,0 +1,80 @@
+from django.test import SimpleTestCase
+from kidsbook.notification.push import LatencyHistogram, PushClient, PushFailed
+from kidsbook.notification.stub import StubPushServer
+
+
+class TestPushClient(SimpleTestCase):
+    def setUp(self):
+        self.server = StubPushServer()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def create_client(self, **kargs):
+        client = PushClient(self.server.url, secret_key='secret', **kargs)
+        self.addCleanup(client.close)
+        return client
+
+    def create_notifications(self, count):
+        return [{'content': 'Notification {}'.format(index)} for index in range(count)]
+
+    def test_push_one_notification_per_request(self):
+        client = self.create_client(max_concurrency=2)
+        self.assertEqual(20, client.push_many(self.create_notifications(20)))
+
+        self.assertEqual(20, self.server.num_requests)
+        self.assertEqual(20, self.server.num_notifications)
+        # The connections are kept alive and reused
+        self.assertLessEqual(self.server.num_connections, 2)
+
+    def test_push_in_batches(self):
+        client = self.create_client(batch_format='batch', batch_size=8)
+        self.assertEqual(3, client.push_many(self.create_notifications(20)))
+
+        self.assertEqual(3, self.server.num_requests)
+        self.assertEqual(20, self.server.num_notifications)
+
+    def test_build_batch_payloads(self):
+        client = self.create_client(batch_format='batch', batch_size=2)
+        payloads = client.build_payloads(self.create_notifications(3))
+
+        self.assertEqual(2, len(payloads))
+        self.assertEqual('secret', payloads[0]['secretKey'])
+        self.assertEqual(2, len(payloads[0]['notifications']))
+        self.assertEqual(1, len(payloads[1]['notifications']))
+
+    def test_push_with_unknown_batch_format(self):
+        with self.assertRaises(ValueError):
+            PushClient(self.server.url, batch_format='zip')
+
+    def test_count_failed_requests(self):
+        client = PushClient('http://127.0.0.1:1/notify', timeout=0.5)
+        self.addCleanup(client.close)
+        self.assertEqual(0, client.push({'content': 'Lost notification'}))
+
+        metrics = client.metrics()
+        self.assertEqual(1, metrics['requests'])
+        self.assertEqual(1, metrics['failed_requests'])
+        self.assertEqual(1, metrics['latency']['count'])
+
+    def test_raise_failed_notifications(self):
+        client = PushClient('http://127.0.0.1:1/notify', batch_format='batch', batch_size=2, timeout=0.5)
+        self.addCleanup(client.close)
+        notifications = self.create_notifications(3)
+        with self.assertRaises(PushFailed) as context:
+            client.push_many(notifications, raise_on_failure=True)
+
+        self.assertEqual(notifications, context.exception.notifications)
+        self.assertEqual(2, client.metrics()['failed_requests'])
+
+    def test_do_not_raise_when_all_are_pushed(self):
+        client = self.create_client()
+        self.assertEqual(3, client.push_many(self.create_notifications(3), raise_on_failure=True))
+
+    def test_latency_histogram(self):
+        histogram = LatencyHistogram(buckets=(0.1, 1))
+        for seconds in (0.05, 0.1, 0.5, 3):
+            histogram.observe(seconds)
+
+        snapshot = histogram.snapshot()
+        self.assertEqual({'<=0.1': 2, '<=1': 3, '+Inf': 4}, snapshot['buckets'])
+        self.assertEqual(4, snapshot['count'])
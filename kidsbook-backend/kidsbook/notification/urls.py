@@ -2,5 +2,6 @@ from django.urls import path
 from kidsbook.notification import views
 
 urlpatterns = [
-    path('notifications/', views.notification)
+    path('notifications/', views.notification),
+    path('notifications/metrics/', views.notification_metrics)
 ]
@@ -7,6 +7,8 @@ from rest_framework import status, generics
 from kidsbook.serializers import *
 from kidsbook.models import *
 from kidsbook.permissions import *
+from kidsbook.notification.dispatcher import get_dispatcher
+from kidsbook.notification.push import get_push_client
 
 
 User = get_user_model()
@@ -61,3 +63,11 @@ def notification(request):
     if request.method in function_mappings:
         return function_mappings[request.method](request)
     return Response({'error': 'Bad request.'}, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['GET'])
+@permission_classes((IsAuthenticated, IsTokenValid, IsSuperUser))
+def notification_metrics(request):
+    """Return the queue depth and the delivery counters of the notification dispatcher, and the push latencies."""
+    metrics = get_dispatcher().metrics()
+    metrics['push'] = get_push_client().metrics()
+    return Response({'data': metrics})
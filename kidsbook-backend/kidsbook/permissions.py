@@ -1,16 +1,18 @@
 from rest_framework import permissions, status
 from kidsbook.models import *
 from kidsbook.serializers import *
+from kidsbook.revocation import get_revocation_cache
+from kidsbook.access import get_access_resolver
 from rest_framework.response import Response
 from django.contrib.auth import get_user
 
 class IsTokenValid(permissions.BasePermission):
     def has_permission(self, request, view):
-        user_id = request.user.id
         is_allowed_user = True
         try:
             token = request.META.get('HTTP_AUTHORIZATION')
-            if BlackListedToken.objects.filter(user=user_id, token=token).exist():
+            # Checked against the in-memory blacklist, without querying the DB
+            if token and get_revocation_cache().is_revoked(token):
                 is_allowed_user = False
         except Exception:
             pass
@@ -48,7 +50,7 @@ class IsInGroup(permissions.BasePermission):
         # group_id = view.kwargs.get('pk', None) or request.data['group_id']
         if group_id:
             try:
-                return request.user.user_groups.filter(id=group_id).exists()
+                return get_access_resolver(request).is_member(group_id)
             except Exception:
                 pass
         return False
@@ -58,8 +60,9 @@ class HasAccessToPost(permissions.BasePermission):
         #pk = post_id
         post_id = view.kwargs.get('pk', None)
         if post_id:
-            #return request.user in Post.objects.get(id=post_id).group.users.all()
-            return Post.objects.get(id=post_id).group.users.filter(id=request.user.id).exists()
+            # The post is kept by the resolver, for the view
+            resolver = get_access_resolver(request)
+            return resolver.is_member(resolver.get_post(post_id).group_id)
         return False
 
 class HasAccessToComment(permissions.BasePermission):
@@ -67,8 +70,8 @@ class HasAccessToComment(permissions.BasePermission):
         #pk = comment_id
         comment_id = view.kwargs.get('pk', None)
         if comment_id:
-            #return request.user in Comment.objects.get(id=comment_id).post.group.users.all()
-            return Comment.objects.get(id=comment_id).post.group.users.filter(id=request.user.id).exists()
+            resolver = get_access_resolver(request)
+            return resolver.is_member(resolver.get_comment(comment_id).post.group_id)
         return False
 
 class IsGroupCreator(permissions.BasePermission):
@@ -78,6 +81,6 @@ class IsGroupCreator(permissions.BasePermission):
         sender_id = request.user.id
 
         # If sender is not the Creator of group
-        if not sender_id or str(sender_id) != str(Group.objects.get(id=group_id).creator.id):
+        if not sender_id or str(sender_id) != str(get_access_resolver(request).get_group(group_id).creator_id):
             return False
         return True
@@ -1,10 +1,19 @@
 import json
 import os
+from io import StringIO
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import post_delete, pre_save
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase
-from kidsbook.models import Post, Group, Comment, UserLikePost, UserSharePost, UserFlagPost, UserLikeComment
+from kidsbook.access import AccessResolver
+from kidsbook.models import (Post, Group, GroupMember, Comment, UserLikePost, UserSharePost, UserFlagPost, UserLikeComment,
+    Notification, ScreenTime)
 from kidsbook.serializers import PostSerializer
 from kidsbook.user.views import generate_token
+from kidsbook.utils import ProfanityEngine
 
 User = get_user_model()
 
@@ -200,6 +209,141 @@ class TestPost(APITestCase):
             comments[0].get('content') == 'OKAY'
         )
 
+    def test_get_posts_in_group_paginated(self):
+        url = "{}/group/{}/posts/?limit=1".format(url_prefix, self.group_id)
+        response = self.client.get(url, HTTP_AUTHORIZATION=self.member_token)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, len(response.data['data']))
+        self.assertEqual(str(self.post2.id), response.data['data'][0]['id'])
+        self.assertIsNotNone(response.data['next_cursor'])
+
+        url = "{}/group/{}/posts/?limit=1&cursor={}".format(url_prefix, self.group_id, response.data['next_cursor'])
+        response = self.client.get(url, HTTP_AUTHORIZATION=self.member_token)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, len(response.data['data']))
+        self.assertEqual(str(self.post.id), response.data['data'][0]['id'])
+        self.assertEqual(2, len(response.data['data'][0]['comments']))
+        self.assertIsNone(response.data['next_cursor'])
+
+    def test_get_posts_in_group_paginated_with_invalid_cursor(self):
+        url = "{}/group/{}/posts/?cursor=not_a_cursor".format(url_prefix, self.group_id)
+        response = self.client.get(url, HTTP_AUTHORIZATION=self.member_token)
+        self.assertEqual(400, response.status_code)
+
+    def test_get_posts_in_group_paginated_constant_queries(self):
+        UserLikePost.objects.create(user=self.creator, post=self.post)
+        UserLikeComment.objects.create(user=self.creator, comment=self.comment, like_or_dislike=True)
+
+        url = "{}/group/{}/posts/?limit=50".format(url_prefix, self.group_id)
+        # Cache the group IDs of the member
+        self.client.get(url, HTTP_AUTHORIZATION=self.member_token)
+        with CaptureQueriesContext(connection) as small_feed:
+            self.client.get(url, HTTP_AUTHORIZATION=self.member_token)
+
+        # Add more posts, comments and likes to the feed
+        group = Group.objects.get(id=self.group_id)
+        for index in range(5):
+            post = Post.objects.create_post(content='Post {}'.format(index), creator=self.creator, group=group)
+            for comment_index in range(4):
+                comment = Comment.objects.create_comment(content='Comment {}'.format(comment_index), post=post, creator=self.creator)
+                UserLikeComment.objects.create(user=self.creator, comment=comment, like_or_dislike=True)
+            UserLikePost.objects.create(user=self.creator, post=post)
+
+        with CaptureQueriesContext(connection) as big_feed:
+            response = self.client.get(url, HTTP_AUTHORIZATION=self.member_token)
+
+        self.assertEqual(7, len(response.data['data']))
+        self.assertEqual(3, len(response.data['data'][0]['comments']))
+        self.assertEqual(len(small_feed), len(big_feed))
+
+    def test_get_posts_in_group_counts_only(self):
+        UserLikePost.objects.create(user=self.creator, post=self.post)
+
+        url = "{}/group/{}/posts/?counts_only=true".format(url_prefix, self.group_id)
+        response = self.client.get(url, HTTP_AUTHORIZATION=self.member_token)
+
+        self.assertEqual(200, response.status_code)
+        post = next(post for post in response.data['data'] if post['id'] == str(self.post.id))
+        self.assertEqual(1, post['like_count'])
+        self.assertEqual(2, post['comment_count'])
+        self.assertNotIn('likes', post)
+        self.assertNotIn('likes_list', post)
+        self.assertNotIn('flags', post)
+
+    def test_like_counters(self):
+        like = UserLikePost.objects.create(user=self.creator, post=self.post)
+        self.post.refresh_from_db()
+        self.assertEqual((1, 0), (self.post.like_count, self.post.dislike_count))
+
+        # Change the like to a dislike
+        like = UserLikePost.objects.get(id=like.id)
+        like.like_or_dislike = False
+        like.save()
+        self.post.refresh_from_db()
+        self.assertEqual((0, 1), (self.post.like_count, self.post.dislike_count))
+
+        like.delete()
+        self.post.refresh_from_db()
+        self.assertEqual((0, 0), (self.post.like_count, self.post.dislike_count))
+
+    def test_comment_and_flag_counters(self):
+        UserFlagPost.objects.create(user=self.creator, post=self.post, comment=self.comment, status='Rude')
+        self.comment.refresh_from_db()
+        self.assertEqual(1, self.comment.flag_count)
+
+        # Delete a comment
+        url = "{}/comment/{}/".format(url_prefix, self.comment.id)
+        self.client.delete(url, HTTP_AUTHORIZATION=self.creator_token)
+        self.post.refresh_from_db()
+        self.assertEqual(1, self.post.comment_count)
+        self.assertEqual(1, self.post.flag_count)
+
+    def test_save_with_deferred_fields(self):
+        comment = Comment.objects.only('id', 'content').get(id=self.comment.id)
+        comment.content = 'Edited comment'
+        comment.save()
+        self.post.refresh_from_db()
+        self.assertEqual(2, self.post.comment_count)
+
+        comment = Comment.objects.defer('is_deleted').get(id=self.comment.id)
+        comment.is_deleted = True
+        comment.save()
+        self.post.refresh_from_db()
+        self.assertEqual(1, self.post.comment_count)
+
+    def test_counters_receivers_of_counted_models_only(self):
+        for model in (Post, Comment, UserLikePost, UserSharePost, UserFlagPost, UserLikeComment):
+            self.assertTrue(post_delete.has_listeners(model))
+        # The other models keep their fast deletes
+        for model in (ScreenTime, Notification):
+            self.assertFalse(pre_save.has_listeners(model))
+            self.assertFalse(post_delete.has_listeners(model))
+
+    def test_soft_delete_a_comment_by_update(self):
+        url = "{}/comment/{}/".format(url_prefix, self.comment.id)
+        response = self.client.post(url, {"is_deleted": True}, HTTP_AUTHORIZATION=self.creator_token)
+        self.assertEqual(202, response.status_code)
+        self.post.refresh_from_db()
+        self.assertEqual(1, self.post.comment_count)
+
+    def test_update_the_counters(self):
+        url = "{}/post/{}/".format(url_prefix, self.post.id)
+        response = self.client.post(url, {"like_count": 100}, HTTP_AUTHORIZATION=self.creator_token)
+        self.assertEqual(400, response.status_code)
+        self.post.refresh_from_db()
+        self.assertEqual(0, self.post.like_count)
+
+    def test_refresh_counters(self):
+        UserLikePost.objects.create(user=self.creator, post=self.post)
+        Post.objects.update(like_count=0, comment_count=0)
+
+        call_command('refresh_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(1, self.post.like_count)
+        self.assertEqual(2, self.post.comment_count)
+
     def test_get_all_posts_in_group_exclude_deleted_with_all(self):
         # Delete a post
         url = "{}/post/{}/".format(url_prefix, self.post2.id)
@@ -242,6 +386,25 @@ class TestPost(APITestCase):
 
         self.assertEqual(200, response.status_code)
 
+    def test_get_post_detail_after_leaving_group(self):
+        url = "{}/post/{}/".format(url_prefix, self.post.id)
+        response = self.client.get(url, HTTP_AUTHORIZATION=self.member_token)
+        self.assertEqual(200, response.status_code)
+
+        # The cached group IDs of the member are cleared
+        GroupMember.objects.filter(group_id=self.group_id).exclude(user=self.creator).delete()
+        response = self.client.get(url, HTTP_AUTHORIZATION=self.member_token)
+        self.assertEqual(403, response.status_code)
+
+    def test_resolve_post_and_comment_once(self):
+        resolver = AccessResolver(self.creator)
+        with self.assertNumQueries(2):
+            comment = resolver.get_comment(self.comment.id)
+            self.assertEqual(comment.post, resolver.get_post(str(self.post.id)))
+            self.assertTrue(resolver.is_member(comment.post.group_id))
+            self.assertTrue(resolver.is_member(str(self.group_id)))
+            resolver.get_comment(self.comment.id)
+
     def test_update_post_detail_with_id(self):
         url = "{}/post/{}/".format(url_prefix, self.post.id)
         prev_state = self.client.get(url, HTTP_AUTHORIZATION=self.creator_token).data.get('data', {})
@@ -765,6 +928,30 @@ class TestCensorship(APITestCase):
         self.assertEqual(405, response.status_code)
 
 
+class TestProfanityEngine(SimpleTestCase):
+    def setUp(self):
+        self.engine = ProfanityEngine(['shit', 'ass', 'hand job'])
+
+    def test_censor_look_alike_characters(self):
+        self.assertEqual('Stop talking ****, ****!', self.engine.censor('Stop talking SH1t, $h17!'))
+
+    def test_censor_whole_words_only(self):
+        self.assertEqual('The assassin class has an ****', self.engine.censor('The assassin class has an ass'))
+
+    def test_censor_multiple_words(self):
+        self.assertEqual('No **** here', self.engine.censor('No hand job here'))
+        self.assertEqual('No **** here', self.engine.censor('No handjob here'))
+
+    def test_contains_profanity(self):
+        self.assertTrue(self.engine.contains_profanity('What a sh1t'))
+        self.assertFalse(self.engine.contains_profanity('What a shirt'))
+
+    def test_cache_censored_text(self):
+        self.engine.censor('Cached shit')
+        self.engine.censor('Cached shit')
+        self.assertEqual(1, self.engine.censor.cache_info().hits)
+
+
 class TestPostGroupSetting(APITestCase):
     def setUp(self):
         # Creator
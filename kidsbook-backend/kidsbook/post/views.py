@@ -1,19 +1,106 @@
+import base64
 import copy
+from uuid import UUID
 from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from django.db.models import Case, Count, IntegerField, Sum, When, F
+from django.db import connection
+from django.db.models import Case, Count, IntegerField, Sum, When, F, Q
+from django.utils.dateparse import parse_datetime
 from django.contrib.auth import get_user_model
 
 from kidsbook.utils import *
 from kidsbook.models import *
 from kidsbook.serializers import *
 from kidsbook.permissions import *
+from kidsbook.notification.dispatcher import dispatch_notification
+from kidsbook.access import get_access_resolver
 
 
 User = get_user_model()
 
+FEED_DEFAULT_PAGE_SIZE = 20
+FEED_MAX_PAGE_SIZE = 50
+FEED_COMMENTS_PER_POST = 3
+
+# The fields a request may edit; the counters are only updated by `CountedModel`
+POST_EDITABLE_FIELDS = ('content', 'picture', 'link', 'ogp', 'is_deleted', 'is_sponsored', 'is_random', 'is_announcement')
+COMMENT_EDITABLE_FIELDS = ('content', 'is_deleted')
+
+def update_editable_fields(instance, data, editable_fields):
+    """
+    Set the fields of the instance from the request's data, and save these fields only,
+    so the counter signals see the changes and the counters in memory are not written back.
+    """
+    for field_name in data:
+        if field_name not in editable_fields:
+            raise ValueError("Field '{}' cannot be edited.".format(field_name))
+
+    update_fields = [field_name for field_name in editable_fields if field_name in data]
+    for field_name in update_fields:
+        setattr(instance, field_name, instance._meta.get_field(field_name).to_python(data[field_name]))
+    if update_fields:
+        instance.save(update_fields=update_fields)
+    return instance
+
+def get_feed_page_size(limit):
+    if limit is None or str(limit).strip() == '':
+        return FEED_DEFAULT_PAGE_SIZE
+    if not str(limit).isdigit() or int(limit) <= 0:
+        raise ValueError("Param 'limit' must be a positive integer.")
+    return min(int(limit), FEED_MAX_PAGE_SIZE)
+
+def encode_feed_cursor(post):
+    """Encode the keyset `(created_at, id)` of the last post of a page."""
+    raw_cursor = '{}|{}'.format(post.created_at.isoformat(), post.id)
+    return base64.urlsafe_b64encode(raw_cursor.encode('utf-8')).decode('ascii')
+
+def decode_feed_cursor(cursor: str):
+    try:
+        raw_cursor = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, post_id = raw_cursor.split('|')
+        created_at = parse_datetime(created_at)
+        post_id = UUID(post_id)
+    except Exception:
+        raise ValueError('Invalid cursor.')
+
+    if created_at is None:
+        raise ValueError('Invalid cursor.')
+    return created_at, post_id
+
+def is_counts_only(request):
+    """Whether the lists of likes, flags and shares are replaced by their counts."""
+    return str(request.query_params.get('counts_only', 'false')).strip().lower() == 'true'
+
+def get_top_comments_of_posts(post_ids, num_comments):
+    """
+    Return the serialized top `num_comments` comments (most liked, then newest) of each post.
+    The ranking is done by the database with a single windowed query, on the comments' counters.
+    """
+    if not post_ids:
+        return []
+
+    ranking_query = '''
+        SELECT ranked.id, ranked.comment_rank FROM (
+            SELECT comment.id, ROW_NUMBER() OVER (
+                PARTITION BY comment.post_id
+                ORDER BY comment.like_count + comment.dislike_count DESC, comment.created_at DESC
+            ) AS comment_rank
+            FROM {comment_table} AS comment
+            WHERE comment.post_id IN %s AND NOT comment.is_deleted
+        ) AS ranked
+        WHERE ranked.comment_rank <= %s
+    '''.format(comment_table=Comment._meta.db_table)
+
+    with connection.cursor() as cursor:
+        cursor.execute(ranking_query, [tuple(UUID(str(post_id)) for post_id in post_ids), num_comments])
+        comment_ranks = {comment_id: rank for comment_id, rank in cursor.fetchall()}
+
+    comment_queryset = Comment.objects.filter(id__in=comment_ranks.keys()).select_related('creator')
+    comments = sorted(comment_queryset, key=lambda comment: comment_ranks[comment.id])
+    return CommentSerializer(comments, many=True, context={'counts_only': True}).data
+
 class GroupPostList(generics.ListCreateAPIView):
     queryset = Post.objects.all()
     permission_classes = (IsAuthenticated, IsTokenValid, IsInGroup)
@@ -38,43 +125,64 @@ class GroupPostList(generics.ListCreateAPIView):
             else:
                 post_queryset = post_queryset.exclude(is_deleted=True)
 
-            post_queryset = post_queryset.order_by('-created_at')
+            post_queryset = post_queryset.order_by('-created_at', '-id')
         except Exception as e:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
         # Change the Serializer depends on the role of requester
         if user_role_id <= 1:
-            post_queryset = PostSuperuserSerializer.setup_eager_loading(post_queryset)
-            serializer = PostSuperuserSerializer(post_queryset, many=True)
+            serializer_class = PostSuperuserSerializer
         else:
-            post_queryset = PostSerializer.setup_eager_loading(post_queryset)
-            serializer = PostSerializer(post_queryset, many=True)
-
+            serializer_class = PostSerializer
+        counts_only = is_counts_only(request)
+        post_queryset = serializer_class.setup_eager_loading(post_queryset, counts_only=counts_only)
+
+        # Paginated feed mode, enabled by either `limit` or `cursor`
+        is_paginated = 'limit' in request.query_params or 'cursor' in request.query_params
+        next_cursor = None
+        if is_paginated:
+            try:
+                limit = get_feed_page_size(request.query_params.get('limit', None))
+                cursor = request.query_params.get('cursor', None)
+                if cursor:
+                    created_at, post_id = decode_feed_cursor(cursor)
+                    post_queryset = post_queryset.filter(
+                        Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=post_id)
+                    )
+            except ValueError as exc:
+                return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Fetch one extra post to know whether there is a next page
+            post_queryset = list(post_queryset[:limit + 1])
+            if len(post_queryset) > limit:
+                post_queryset = post_queryset[:limit]
+                next_cursor = encode_feed_cursor(post_queryset[-1])
+
+        serializer = serializer_class(post_queryset, many=True, context={'counts_only': counts_only})
         response_data = serializer.data
-
-        comment_queryset = Comment.objects.filter(post__in=post_queryset).exclude(is_deleted=True)
-        comment_queryset.query.group_by = ['id']
-        comment_queryset = comment_queryset.annotate(
-            like_count=Count('likes')
-        ).order_by('-like_count', '-created_at')
-
-        comment_queryset = CommentSerializer.setup_eager_loading(comment_queryset)
-        comments_serializer_data = CommentSerializer(comment_queryset, many=True).data
-
-        likes_queryset = UserLikePost.objects.filter(post__in=post_queryset).exclude(like_or_dislike=False)
-        likes_queryset = PostLikeSerializer.setup_eager_loading(likes_queryset)
-        likes_queryset_data = PostLikeSerializer(likes_queryset, many=True).data
+        post_ids = [post['id'] for post in response_data]
+
+        # Top 3 comments of every post, in a single windowed query
+        comments_by_post = {}
+        for comment in get_top_comments_of_posts(post_ids, FEED_COMMENTS_PER_POST):
+            comment['creator'] = {'id': comment['creator']['id'], 'username': comment['creator']['username']}
+            comments_by_post.setdefault(str(comment['post']), []).append(comment)
+
+        # Likes grouped by post in one pass
+        likes_by_post = {}
+        if not counts_only:
+            likes_queryset = UserLikePost.objects.filter(post__in=post_ids).exclude(like_or_dislike=False)
+            likes_queryset = PostLikeSerializer.setup_eager_loading(likes_queryset)
+            for like in PostLikeSerializer(likes_queryset, many=True).data:
+                likes_by_post.setdefault(str(like['post']['id']), []).append(like)
 
         for post in iter(response_data):
-            post['likes_list'] = list(filter(lambda like: like['post']['id'] == post['id'], copy.deepcopy(likes_queryset_data)))
-            comments_data = list(filter(lambda comment: str(comment['post']) == post['id'], copy.deepcopy(comments_serializer_data)))[:3]
-
-            for comment in comments_data:
-                comment['creator'] = {'id':comment['creator']['id'], 'username': comment['creator']['username']}
-            # comment_data = clean_data_iterative(comments_data, 'post')
-            post['comments'] = comments_data
-            post['comments'] = clean_data_iterative(post['comments'], 'likes')
+            if not counts_only:
+                post['likes_list'] = likes_by_post.get(post['id'], [])
+            post['comments'] = comments_by_post.get(post['id'], [])
 
+        if is_paginated:
+            return Response({'data': response_data, 'next_cursor': next_cursor})
         return Response({'data': response_data})
 
     def post(self, request, *args, **kwargs):
@@ -89,29 +197,14 @@ class GroupPostList(generics.ListCreateAPIView):
             # Create a notification for all users in group
             action_user = request.user
             group = Group.objects.get(id=kwargs.get('pk'))
-            payload = {
-                'post': Post.objects.get(id=created_post.get('id', '')),
-                'action_user': action_user,
-                'group': group ,
-                'content': "{} created a new post in group {}".format(action_user.username, group.name)
-            }
-
-            users_in_group = GroupMember.objects.filter(group_id=group.id)
-
-            for user in iter(users_in_group):
-                if user.user.id != request.user.id:
-                    payload['user'] = User.objects.get(id=user.user.id)
-                    noti = Notification.objects.create(**payload)
-
-                    # Increase notification count by 1
-                    noti_user = NotificationUser.objects.get(user_id=user.user.id)
-                    noti_user.number_of_unseen += 1
-                    noti_user.save()
-
-                    # Push the notification to all users in group
-                    if UserSetting.objects.get(user_id=user.user.id).receive_notifications:
-                        noti_serializer = NotificationSerializer(noti).data
-                        push_notification(noti_serializer)
+            users_in_group = GroupMember.objects.filter(group_id=group.id).exclude(user_id=action_user.id).values_list('user_id', flat=True)
+            dispatch_notification(
+                users_in_group,
+                "{} created a new post in group {}".format(action_user.username, group.name),
+                group,
+                post=Post.objects.get(id=created_post.get('id', '')),
+                action_user=action_user
+            )
 
             return Response({'data': created_post}, status=status.HTTP_202_ACCEPTED)
         except Exception as exc:
@@ -157,7 +250,7 @@ class PostLike(generics.ListCreateAPIView):
 
     def list(self, request, **kwargs):
         try:
-            queryset = self.get_queryset().filter(post = Post.objects.get(id=kwargs['pk'])).filter(like_or_dislike=True)
+            queryset = self.get_queryset().filter(post = get_access_resolver(request).get_post(kwargs['pk'])).filter(like_or_dislike=True)
         except Exception as exc:
             return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         serializer = self.get_serializer(data=queryset, many=True)
@@ -169,7 +262,7 @@ class PostLike(generics.ListCreateAPIView):
             liked_post = self.create(request, *args, **kwargs).data
 
             # Do not push notifications if the post is deleted
-            post = Post.objects.get(id=kwargs.get('pk', ''))
+            post = get_access_resolver(request).get_post(kwargs.get('pk', ''))
             if post.is_deleted:
                 return Response({'data': liked_post}, status=status.HTTP_202_ACCEPTED)
 
@@ -177,35 +270,20 @@ class PostLike(generics.ListCreateAPIView):
             action_user = request.user
 
             if request.user.id != post.creator:
-                group = Group.objects.get(id=post.group.id)
+                group = post.group
                 action = request.data.get('like_or_dislike', None)
                 if not action or str(action).lower() == 'true':
                     action = 'likes'
                 else:
                     action = 'dislikes'
 
-                payload = {
-                    'post': post,
-                    'action_user': action_user,
-                    'group': group,
-                    'content': "{} {} your post".format(action_user.username, action)
-                }
-
-                user = User.objects.get(id=post.creator.id)
-                user_id = user.id
-
-                payload['user'] = user
-                noti = Notification.objects.create(**payload)
-
-                # Increase notification count by 1
-                noti_user = NotificationUser.objects.get(user_id=user_id)
-                noti_user.number_of_unseen += 1
-                noti_user.save()
-
-                # Push the notification to the creator
-                if UserSetting.objects.get(user_id=user_id).receive_notifications:
-                    noti_serializer = NotificationSerializer(noti).data
-                    push_notification(noti_serializer)
+                dispatch_notification(
+                    [post.creator_id],
+                    "{} {} your post".format(action_user.username, action),
+                    group,
+                    post=post,
+                    action_user=action_user
+                )
 
             return Response({'data': liked_post}, status=status.HTTP_202_ACCEPTED)
 
@@ -222,7 +300,7 @@ class CommentLike(generics.ListCreateAPIView):
 
     def list(self, request, **kwargs):
         try:
-            queryset = self.get_queryset().filter(comment = Comment.objects.get(id=kwargs['pk']))
+            queryset = self.get_queryset().filter(comment = get_access_resolver(request).get_comment(kwargs['pk']))
         except Exception as exc:
             return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         serializer = self.get_serializer(data=queryset, many=True)
@@ -250,28 +328,14 @@ class CommentLike(generics.ListCreateAPIView):
                 else:
                     action = 'dislikes'
 
-                payload = {
-                    'post': post,
-                    'action_user': action_user,
-                    'group': group,
-                    'comment': comment,
-                    'content': "{} {} your comment".format(action_user.username, action)
-                }
-
-                user = User.objects.get(id=comment.creator.id)
-
-                payload['user'] = user
-                noti = Notification.objects.create(**payload)
-
-                # Increase notification count by 1
-                noti_user = NotificationUser.objects.get(user_id=user.id)
-                noti_user.number_of_unseen += 1
-                noti_user.save()
-
-                # Push the notification to the user
-                if UserSetting.objects.get(user_id=user.id).receive_notifications:
-                    noti_serializer = NotificationSerializer(noti).data
-                    push_notification(noti_serializer)
+                dispatch_notification(
+                    [comment.creator_id],
+                    "{} {} your comment".format(action_user.username, action),
+                    group,
+                    post=post,
+                    comment=comment,
+                    action_user=action_user
+                )
             return Response({'data': comment_data}, status=status.HTTP_202_ACCEPTED)
 
         except PermissionError as exc:
@@ -286,7 +350,7 @@ class PostFlag(generics.ListCreateAPIView):
 
     def list(self, request, **kwargs):
         try:
-            queryset = self.get_queryset().filter(post = Post.objects.get(id=kwargs['pk']))
+            queryset = self.get_queryset().filter(post = get_access_resolver(request).get_post(kwargs['pk']))
         except Exception  as exc:
             return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         serializer = self.get_serializer(data=queryset, many=True)
@@ -308,7 +372,7 @@ class CommentFlag(generics.ListCreateAPIView):
 
     def list(self, request, **kwargs):
         try:
-            queryset = self.get_queryset().filter(comment = Comment.objects.get(id=kwargs['pk']))
+            queryset = self.get_queryset().filter(comment = get_access_resolver(request).get_comment(kwargs['pk']))
         except Exception as exc:
             return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         serializer = self.get_serializer(data=queryset, many=True)
@@ -330,7 +394,7 @@ class PostShare(generics.ListCreateAPIView):
 
     def list(self, request, **kwargs):
         try:
-            queryset = self.get_queryset().filter(post = Post.objects.get(id=kwargs['pk']))
+            queryset = self.get_queryset().filter(post = get_access_resolver(request).get_post(kwargs['pk']))
         except Exception as exc:
             return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         serializer = self.get_serializer(data=queryset, many=True)
@@ -358,12 +422,13 @@ class PostDetail(generics.RetrieveUpdateDestroyAPIView):
     def get(self, request, *args, **kwargs):
         post_id = kwargs.get('pk', None)
 
-        if not post_id or not Post.objects.filter(id=post_id).exists():
+        # The post was fetched by the permission `HasAccessToPost`
+        if not post_id:
             return Response({'error': 'Post not found'}, status=status.HTTP_404_NOT_FOUND)
 
         try:
             requester = request.user
-            post = Post.objects.get(id=post_id)
+            post = get_access_resolver(request).get_post(post_id)
             if post.is_deleted and not requester.is_superuser:
                 return Response({'error': 'Post not found'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -373,23 +438,26 @@ class PostDetail(generics.RetrieveUpdateDestroyAPIView):
                 serializer = PostSerializer(post)
 
             user_role_id = request.user.role.id
+            counts_only = is_counts_only(request)
+            context = {'counts_only': counts_only}
 
             # Change the Serializer depends on the role of requester
             if user_role_id <= 1:
-                serializer = PostSuperuserSerializer(post)
+                serializer = PostSuperuserSerializer(post, context=context)
             else:
-                serializer = PostSerializer(post)
+                serializer = PostSerializer(post, context=context)
 
             response_data = serializer.data
 
             comment_queryset = Comment.objects.filter(post=post).exclude(is_deleted=True)
-            comment_queryset = CommentSerializer.setup_eager_loading(comment_queryset)
-            comments_serializer_data = CommentSerializer(comment_queryset, many=True).data
-
-            likes_queryset = UserLikePost.objects.filter(post=post).exclude(like_or_dislike=False)
-            likes_queryset = PostLikeSerializer.setup_eager_loading(likes_queryset)
-            likes_queryset_data = PostLikeSerializer(likes_queryset, many=True).data
-            response_data['likes_list'] = list(filter(lambda like: like['post']['id'] == response_data['id'], copy.deepcopy(likes_queryset_data)))
+            comment_queryset = CommentSerializer.setup_eager_loading(comment_queryset, counts_only=counts_only)
+            comments_serializer_data = CommentSerializer(comment_queryset, many=True, context=context).data
+
+            if not counts_only:
+                likes_queryset = UserLikePost.objects.filter(post=post).exclude(like_or_dislike=False)
+                likes_queryset = PostLikeSerializer.setup_eager_loading(likes_queryset)
+                likes_queryset_data = PostLikeSerializer(likes_queryset, many=True).data
+                response_data['likes_list'] = list(filter(lambda like: like['post']['id'] == response_data['id'], copy.deepcopy(likes_queryset_data)))
             comments_data = list(filter(lambda comment: str(comment['post']) == response_data['id'], copy.deepcopy(comments_serializer_data)))[:3]
             for comment in comments_data:
                 comment['creator'] = {'id':comment['creator']['id'], 'username': comment['creator']['username']}
@@ -404,17 +472,17 @@ class PostDetail(generics.RetrieveUpdateDestroyAPIView):
     def post(self, request, *args, **kwargs):
         update_data = request.data.dict()
         try:
-            Post.objects.filter(id=kwargs.get('pk', None)).update(**update_data)
-            return Response({'data': PostSerializer(Post.objects.get(id=kwargs.get('pk', None))).data}, status=status.HTTP_202_ACCEPTED)
+            post = update_editable_fields(Post.objects.get(id=kwargs.get('pk', None)), update_data, POST_EDITABLE_FIELDS)
+            return Response({'data': PostSerializer(post).data}, status=status.HTTP_202_ACCEPTED)
         except Exception as exc:
             return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, *args, **kwargs):
         try:
             post_id = kwargs.get('pk', '')
-            post_to_delete = Post.objects.get(id=post_id)
+            post_to_delete = get_access_resolver(request).get_post(post_id)
             post_to_delete.is_deleted = True
-            post_to_delete.save()
+            post_to_delete.save(update_fields=['is_deleted'])
             return Response({}, status=status.HTTP_202_ACCEPTED)
         except Exception as exc:
             return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
@@ -430,11 +498,16 @@ class PostCommentList(generics.ListCreateAPIView):
       else:
           return CommentSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['counts_only'] = is_counts_only(self.request)
+        return context
+
 
     def list(self, request, **kwargs):
         try:
             # Get all comments in the post
-            queryset = self.get_queryset().filter(post=Post.objects.get(id=kwargs['pk']))
+            queryset = self.get_queryset().filter(post=get_access_resolver(request).get_post(kwargs['pk']))
         except Exception as exc:
             return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -448,14 +521,19 @@ class PostCommentList(generics.ListCreateAPIView):
                 queryset = queryset.exclude(is_deleted=True)
 
             queryset = queryset.order_by('-created_at')
+            counts_only = is_counts_only(request)
+            if counts_only:
+                queryset = queryset.select_related('creator')
+            else:
+                queryset = queryset.prefetch_related('likes')
             serializer = self.get_serializer(data=queryset, many=True)
             serializer.is_valid()
         except Exception as exc:
             return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
-        for comment in serializer.data:
-            comment['like_count'] = len(comment['likes'])
-            comment['likers'] = [x for x in comment['likes']]
+        if not counts_only:
+            for comment in serializer.data:
+                comment['likers'] = [x for x in comment['likes']]
         response_data = clean_data_iterative(serializer.data, 'likes')
         return Response({'data': serializer.data})
 
@@ -466,54 +544,33 @@ class PostCommentList(generics.ListCreateAPIView):
 
             # Create a notification for the post's owner
             action_user = request.user
-            post = Post.objects.get(id=comment.post.id)
+            post = get_access_resolver(request).get_post(kwargs['pk'])
 
             # Do not push notifications if the post is deleted
             if post.is_deleted:
                 return Response({'data': comment_data}, status=status.HTTP_202_ACCEPTED)
 
-            # Initial for notifications
-            action_user_id = action_user.id
-            group = Group.objects.get(id=comment.post.group.id)
-            payload = {
-                'post': post,
-                'action_user': action_user,
-                'group': group,
-                'comment': comment
-            }
-
-            post_owner = User.objects.get(id=comment.post.creator.id)
-            payload['user'] = post_owner
-            payload['content'] = "{} commented on your post".format(action_user.username)
-            noti = Notification.objects.create(**payload)
-            noti_user = NotificationUser.objects.get(user_id=post_owner.id)
-            noti_user.number_of_unseen += 1
-            noti_user.save()
-
-            # Push the notification to the post's owner
-            if action_user_id != post_owner.id and UserSetting.objects.get(user_id=post_owner.id).receive_notifications:
-                noti_serializer = NotificationSerializer(noti).data
-                push_notification(noti_serializer)
-
-            # Create a notification for all users commented in the post
-            all_comments_creators = Comment.objects.filter(post_id=post.id).distinct().values_list('creator', flat=True)
-            users_commented = User.objects.filter(id__in=all_comments_creators)
-
-            for user in iter(users_commented):
-                if user.id != action_user_id:
-                    payload['user'] = User.objects.get(id=user.id)
-                    payload['content'] = "{} commented on a post that you also commented".format(action_user.username)
-                    noti = Notification.objects.create(**payload)
-
-                    # Increase notification count by 1
-                    noti_user = NotificationUser.objects.get(user_id=user.id)
-                    noti_user.number_of_unseen += 1
-                    noti_user.save()
-
-                    # Push the notification to all users commented in the post
-                    if UserSetting.objects.get(user_id=user.id).receive_notifications:
-                        noti_serializer = NotificationSerializer(noti).data
-                        push_notification(noti_serializer)
+            # Notify the post's owner
+            group = post.group
+            dispatch_notification(
+                [post.creator_id],
+                "{} commented on your post".format(action_user.username),
+                group,
+                post=post,
+                comment=comment,
+                action_user=action_user
+            )
+
+            # Notify all users commented in the post
+            users_commented = Comment.objects.filter(post_id=post.id).exclude(creator_id=action_user.id).order_by().distinct().values_list('creator_id', flat=True)
+            dispatch_notification(
+                users_commented,
+                "{} commented on a post that you also commented".format(action_user.username),
+                group,
+                post=post,
+                comment=comment,
+                action_user=action_user
+            )
 
             return Response({'data': comment_data}, status=status.HTTP_202_ACCEPTED)
         except PermissionError as exc:
@@ -529,11 +586,12 @@ class CommentDetail(generics.RetrieveUpdateDestroyAPIView):
     def get(self, request, *args, **kwargs):
         comment_id = kwargs.get('pk', None)
 
-        if comment_id and not Comment.objects.filter(id=comment_id).exists():
+        # The comment was fetched by the permission `HasAccessToComment`
+        if not comment_id:
             return Response({'error': 'Comment not found'}, status=status.HTTP_404_NOT_FOUND)
 
         try:
-            comment = Comment.objects.get(id=comment_id)
+            comment = get_access_resolver(request).get_comment(comment_id)
             if comment.is_deleted and not request.user.is_superuser:
                 return Response({'error': 'Comment not found'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -545,8 +603,8 @@ class CommentDetail(generics.RetrieveUpdateDestroyAPIView):
     def post(self, request, *args, **kwargs):
         update_data = request.data.dict()
         try:
-            Comment.objects.filter(id=kwargs.get('pk', None)).update(**update_data)
-            return Response({'data': CommentSerializer(Comment.objects.get(id=kwargs.get('pk', None))).data}, status=status.HTTP_202_ACCEPTED)
+            comment = update_editable_fields(Comment.objects.get(id=kwargs.get('pk', None)), update_data, COMMENT_EDITABLE_FIELDS)
+            return Response({'data': CommentSerializer(comment).data}, status=status.HTTP_202_ACCEPTED)
         except PermissionError as exc:
             return Response({'error': str(exc)}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
         except Exception as exc:
@@ -555,9 +613,9 @@ class CommentDetail(generics.RetrieveUpdateDestroyAPIView):
     def delete(self, request, *args, **kwargs):
         try:
             comment_id = kwargs.get('pk', '')
-            comment_to_delete = Comment.objects.get(id=comment_id)
+            comment_to_delete = get_access_resolver(request).get_comment(comment_id)
             comment_to_delete.is_deleted = True
-            comment_to_delete.save()
+            comment_to_delete.save(update_fields=['is_deleted'])
             return Response({}, status=status.HTTP_202_ACCEPTED)
         except Exception as exc:
             return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,104 @@
+import datetime
+import hashlib
+import threading
+
+import jwt
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from kidsbook.models import BlackListedToken
+
+
+VERSION_KEY = 'kidsbook:token_revocation:version'
+
+def token_fingerprint(token: str):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def get_token_expiration(token: str):
+    """Return the expiration time of the JWT in an Authorization header, or None if it has none."""
+    try:
+        payload = jwt.decode(token.split()[-1], verify=False)
+        return datetime.datetime.fromtimestamp(int(payload['exp']), tz=datetime.timezone.utc)
+    except Exception:
+        return None
+
+
+class TokenRevocationCache:
+    """
+    Keep the fingerprints of the blacklisted tokens in process memory.
+
+    Every revocation increases a version counter in the shared cache `cache_alias`,
+    and the other processes reload the blacklist when they see a new version.
+    With a cache shared by all processes (e.g. Redis), checking a token costs one cache read,
+    without any DB query.
+    """
+
+    def __init__(self, cache_alias='default'):
+        self.cache_alias = cache_alias
+        self._fingerprints = set()
+        self._version = None
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def is_revoked(self, token: str):
+        self._sync()
+        return token_fingerprint(token) in self._fingerprints
+
+    def revoke(self, token: str, user):
+        BlackListedToken.objects.get_or_create(
+            token=token,
+            user=user,
+            defaults={'expires_at': get_token_expiration(token)}
+        )
+        with self._lock:
+            self._fingerprints.add(token_fingerprint(token))
+
+        version = self._increase_version()
+        with self._lock:
+            # Skip the reload if no other process revoked a token meanwhile
+            if self._version is not None and version == self._version + 1:
+                self._version = version
+
+    def reload(self):
+        version = self._get_version()
+        tokens = BlackListedToken.objects.exclude(expires_at__lt=timezone.now()).values_list('token', flat=True)
+        fingerprints = {token_fingerprint(token) for token in tokens}
+        with self._lock:
+            self._fingerprints = fingerprints
+            self._version = version
+
+    def _get_version(self):
+        version = self.cache.get(VERSION_KEY)
+        if version is None:
+            # The cache was cleared: start again from a new version
+            self.cache.add(VERSION_KEY, 0, timeout=None)
+            version = self.cache.get(VERSION_KEY)
+        return version
+
+    def _increase_version(self):
+        self.cache.add(VERSION_KEY, 0, timeout=None)
+        try:
+            return self.cache.incr(VERSION_KEY)
+        except ValueError:
+            # The key was evicted between `add` and `incr`
+            self.cache.set(VERSION_KEY, 1, timeout=None)
+            return 1
+
+    def _sync(self):
+        if self._get_version() != self._version:
+            self.reload()
+
+
+_revocation_cache = None
+_revocation_cache_lock = threading.Lock()
+
+def get_revocation_cache():
+    global _revocation_cache
+    with _revocation_cache_lock:
+        if _revocation_cache is None:
+            _revocation_cache = TokenRevocationCache(getattr(settings, 'TOKEN_REVOCATION_CACHE', 'default'))
+    return _revocation_cache
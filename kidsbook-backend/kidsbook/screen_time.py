@@ -0,0 +1,235 @@
+import atexit
+import datetime
+import threading
+import uuid
+from collections import defaultdict
+
+import pytz
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from kidsbook.models import ScreenTime, User, forget_users
+
+
+DEFAULT_SCREEN_TIME_SETTINGS = {
+    'BUFFERED': False,          # accumulate the heartbeats in memory, and write them in batches
+    'FLUSH_INTERVAL': 10,       # seconds between two writes of the buffer
+    'MAX_PENDING': 1000,        # (user, date) pairs buffered before an early write
+}
+
+# Seconds between two heartbeats of a client
+HEARTBEAT_INTERVAL = 30
+
+# Seconds the last active time of a buffered user is cached for, after its last heartbeat
+LAST_ACTIVE_TIME_CACHE_TIMEOUT = 4 * HEARTBEAT_INTERVAL
+
+
+def get_today():
+    """Return the date of the screen times."""
+    return datetime.datetime.now(pytz.timezone('Asia/Singapore')).date()
+
+
+def get_last_active_time_cache_key(user_id):
+    return 'kidsbook:last_active_time:{}'.format(user_id)
+
+
+def get_elapsed_time(last_active_time, timestamp, interval=HEARTBEAT_INTERVAL):
+    """Return the screen time since the last heartbeat, or 0 if the client was inactive."""
+    time_elapsed = timestamp - last_active_time
+    if time_elapsed > 2 * interval or time_elapsed < 0:
+        return 0
+    return time_elapsed
+
+
+def upsert_screen_times(deltas):
+    """
+    Add the times of `deltas` ({(user_id, date): time}) to the screen times, creating the missing ones,
+    with a single `INSERT ... ON CONFLICT DO UPDATE`.
+    Return the new total times, keyed by (user_id, date).
+    """
+    if not deltas:
+        return {}
+
+    table = connection.ops.quote_name(ScreenTime._meta.db_table)
+    values = []
+    params = []
+    for (user_id, date), time in deltas.items():
+        values.append('(%s, %s, %s, %s)')
+        params.extend([uuid.uuid4(), user_id, date, time])
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {table} (id, user_id, date, total_time) VALUES {values} '
+            'ON CONFLICT (user_id, date) DO UPDATE SET total_time = {table}.total_time + EXCLUDED.total_time '
+            'RETURNING user_id, date, total_time'.format(table=table, values=', '.join(values)),
+            params
+        )
+        return {(str(user_id), date): total_time for user_id, date, total_time in cursor.fetchall()}
+
+
+def update_last_active_times(last_active_times):
+    """
+    Set the last active time of the users of `last_active_times` ({user_id: timestamp}) with a single `UPDATE`,
+    and expire the cached users.
+    """
+    if not last_active_times:
+        return
+
+    table = connection.ops.quote_name(User._meta.db_table)
+    values = []
+    params = []
+    for user_id, timestamp in last_active_times.items():
+        values.append('(%s::uuid, %s::integer)')
+        params.extend([str(user_id), timestamp])
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'UPDATE {table} SET last_active_time = heartbeat.last_active_time '
+            'FROM (VALUES {values}) AS heartbeat (id, last_active_time) '
+            'WHERE {table}.id = heartbeat.id AND {table}.last_active_time < heartbeat.last_active_time'.format(
+                table=table, values=', '.join(values)
+            ),
+            params
+        )
+    forget_users(last_active_times)
+
+
+def set_last_active_time(user_id, timestamp):
+    """Set the last active time of the user (expiring the cached one), and return the previous one, with a single `UPDATE`."""
+    table = connection.ops.quote_name(User._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'UPDATE {table} SET last_active_time = %s FROM {table} AS previous '
+            'WHERE {table}.id = %s AND previous.id = {table}.id '
+            'RETURNING previous.last_active_time'.format(table=table),
+            [timestamp, user_id]
+        )
+        row = cursor.fetchone()
+    forget_users([user_id])
+    return row[0] if row else 0
+
+
+def record_heartbeat(user, timestamp, date):
+    """
+    Write the screen time of a heartbeat right away. Return the new total time of the day.
+    The last active time is read from the DB, as the authenticated user may come from the cache.
+    """
+    with transaction.atomic():
+        time = get_elapsed_time(set_last_active_time(user.id, timestamp), timestamp)
+        total_times = upsert_screen_times({(str(user.id), date): time})
+    user.last_active_time = timestamp
+    return total_times[(str(user.id), date)]
+
+
+class ScreenTimeBuffer:
+    """
+    Accumulate the screen time of the heartbeats in process memory, keyed by (user, date).
+
+    The last active times are shared by the processes through the cache, so the heartbeats of a user
+    are counted whichever process they reach.
+    The buffer is written every `flush_interval` seconds by a background thread,
+    or as soon as `max_pending` (user, date) pairs are pending,
+    with one upsert of the screen times and one update of the last active times.
+    """
+
+    def __init__(self, flush_interval=10, max_pending=1000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._deltas = defaultdict(float)
+        # The last active times to write, of the users with a heartbeat since the last write
+        self._last_active_times = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_settings(cls):
+        options = dict(DEFAULT_SCREEN_TIME_SETTINGS, **getattr(settings, 'SCREEN_TIME_INGESTION', {}))
+        return cls(flush_interval=options['FLUSH_INTERVAL'], max_pending=options['MAX_PENDING'])
+
+    def record(self, user, timestamp, date):
+        """Buffer the screen time of a heartbeat. Return the time added."""
+        user_id = str(user.id)
+        # The user may have been active on another process since the last write
+        cache_key = get_last_active_time_cache_key(user_id)
+        last_active_time = max(cache.get(cache_key, 0), user.last_active_time)
+        time = get_elapsed_time(last_active_time, timestamp)
+        # Expired once the user is inactive for longer than a break (by the time of the server, not the client's)
+        cache.set(cache_key, max(last_active_time, timestamp), LAST_ACTIVE_TIME_CACHE_TIMEOUT)
+
+        with self._lock:
+            self._deltas[(user_id, date)] += time
+            self._last_active_times[user_id] = max(self._last_active_times.get(user_id, 0), timestamp)
+            is_full = len(self._deltas) >= self.max_pending
+
+        if is_full:
+            self.flush()
+        return time
+
+    def pending(self):
+        with self._lock:
+            return len(self._deltas)
+
+    def flush(self):
+        """Write the buffered screen times. Return the number of (user, date) pairs written."""
+        with self._lock:
+            deltas = self._deltas
+            last_active_times = self._last_active_times
+            self._deltas = defaultdict(float)
+            self._last_active_times = {}
+
+        if not deltas:
+            return 0
+
+        try:
+            with transaction.atomic():
+                upsert_screen_times(deltas)
+                update_last_active_times(last_active_times)
+        except Exception:
+            # Keep the screen times and the last active times for the next write
+            with self._lock:
+                for key, time in deltas.items():
+                    self._deltas[key] += time
+                for user_id, timestamp in last_active_times.items():
+                    self._last_active_times[user_id] = max(self._last_active_times.get(user_id, 0), timestamp)
+            raise
+        return len(deltas)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='screen-time-flusher', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                pass
+            finally:
+                connection.close()
+
+
+_screen_time_buffer = None
+_screen_time_buffer_lock = threading.Lock()
+
+def is_screen_time_buffered():
+    options = dict(DEFAULT_SCREEN_TIME_SETTINGS, **getattr(settings, 'SCREEN_TIME_INGESTION', {}))
+    return bool(options['BUFFERED'])
+
+def get_screen_time_buffer():
+    global _screen_time_buffer
+    with _screen_time_buffer_lock:
+        if _screen_time_buffer is None:
+            _screen_time_buffer = ScreenTimeBuffer.from_settings()
+            _screen_time_buffer.start()
+            atexit.register(_screen_time_buffer.stop)
+    return _screen_time_buffer
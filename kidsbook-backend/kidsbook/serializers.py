@@ -9,20 +9,80 @@ from kidsbook.utils import censor
 
 User = get_user_model()
 
+def get_fields_param(request):
+    """Return the field names of the param `fields` (e.g. `?fields=id,username`), or None to keep all the fields."""
+    fields = request.query_params.get('fields', None)
+    if fields is None or fields.strip() == '':
+        return None
+    return set(field.strip() for field in fields.split(',') if field.strip())
+
+class SparseFieldsMixin:
+    """With `fields` in the context, only keep these fields (and always `id`)."""
+
+    def get_field_names(self, declared_fields, info):
+        field_names = super().get_field_names(declared_fields, info)
+        fields = self.context.get('fields', None)
+        if fields:
+            field_names = [field_name for field_name in field_names if field_name in fields or field_name == 'id']
+        return field_names
+
 # This is for private profile
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """ Perform necessary eager loading of data. """
+        return queryset.select_related('role').prefetch_related(
+            'user_posts__likes', 'user_posts__shares', 'user_posts__flags', 'user_groups__users'
+        )
+
     class Meta:
         model = User
         fields = ('id', 'sls_id', 'username', 'email_address', 'is_active', 'profile_photo', 'is_superuser', 'description', "realname", 'user_posts', 'role', 'created_at', 'last_active_time', 'user_groups')
         depth = 1
 
 # This class is for public profile
-class UserPublicSerializer(serializers.ModelSerializer):
+class UserPublicSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """ Perform necessary eager loading of data. """
+        return queryset.prefetch_related(
+            'user_posts__likes', 'user_posts__shares', 'user_posts__flags', 'user_groups__users'
+        )
+
     class Meta:
         model = User
         fields = ('id', 'sls_id', 'is_active', 'is_superuser', 'profile_photo', 'username', 'description', 'user_posts', 'user_groups')
         depth = 1
 
+# Private profile with the groups, but without the posts, for the lists of users and the SLS logins
+class UserSummarySerializer(UserSerializer):
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """ Perform necessary eager loading of data. """
+        return queryset.select_related('role').prefetch_related('user_groups__users')
+
+    class Meta:
+        model = User
+        fields = ('id', 'sls_id', 'username', 'email_address', 'is_active', 'profile_photo', 'is_superuser', 'description', "realname", 'role', 'created_at', 'last_active_time', 'user_groups')
+        depth = 1
+
+# Public profile without the posts, for the lists of users
+class UserPublicSummarySerializer(UserPublicSerializer):
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """ Perform necessary eager loading of data. """
+        return queryset.prefetch_related('user_groups__users')
+
+    class Meta:
+        model = User
+        fields = ('id', 'sls_id', 'is_active', 'is_superuser', 'profile_photo', 'username', 'description', 'user_groups')
+        depth = 1
+
+class UserImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserImportJob
+        fields = ('id', 'status', 'num_rows', 'num_processed', 'created_users', 'errors', 'created_at', 'updated_at')
+
 class UserSettingSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserSetting
@@ -34,7 +94,21 @@ class NestedUserSerializer(serializers.ModelSerializer):
         model = User
         fields = ('id', 'username', 'email_address', 'is_active', 'profile_photo', 'is_superuser', 'description', "realname", 'role', 'created_at', 'last_active_time')
 
-class PostSerializer(serializers.ModelSerializer):
+class CountsOnlyMixin:
+    """
+    With `counts_only` in the context, leave out the lists of the users who like, flag or share,
+    and only keep the counters.
+    """
+
+    LIST_FIELDS = ('likes', 'flags', 'shares')
+
+    def get_field_names(self, declared_fields, info):
+        field_names = super().get_field_names(declared_fields, info)
+        if self.context.get('counts_only', False):
+            field_names = [field_name for field_name in field_names if field_name not in self.LIST_FIELDS]
+        return field_names
+
+class PostSerializer(CountsOnlyMixin, serializers.ModelSerializer):
     creator = NestedUserSerializer(read_only=True)
     content = serializers.SerializerMethodField()
 
@@ -59,14 +133,17 @@ class PostSerializer(serializers.ModelSerializer):
             is_announcement=(data.get("is_announcement", 'false').strip().lower()=='true')
         )
 
-    def setup_eager_loading(queryset):
+    def setup_eager_loading(queryset, counts_only=False):
         queryset = queryset.select_related('creator', 'group')
-        queryset = queryset.prefetch_related('flags', 'likes', 'group__users')
+        if counts_only:
+            return queryset.prefetch_related('group__users')
+        queryset = queryset.prefetch_related('flags', 'likes', 'shares', 'group__users')
         return queryset
 
     class Meta:
         model = Post
-        fields = ('id', 'created_at', 'content', 'creator', 'group', 'picture', 'link', 'ogp', 'likes', 'flags', 'shares', 'is_sponsored', 'is_random', 'is_announcement')
+        fields = ('id', 'created_at', 'content', 'creator', 'group', 'picture', 'link', 'ogp', 'likes', 'flags', 'shares', 'is_sponsored', 'is_random', 'is_announcement',
+            'like_count', 'dislike_count', 'comment_count', 'share_count', 'flag_count')
         #depth = 1
 
 class NotificationSerializer(serializers.ModelSerializer):
@@ -84,13 +161,15 @@ class NotificationUserSerializer(serializers.ModelSerializer):
         fields = ('id', 'user', 'number_of_unseen')
         #depth = 1
 
-class PostSuperuserSerializer(serializers.ModelSerializer):
+class PostSuperuserSerializer(CountsOnlyMixin, serializers.ModelSerializer):
     creator = NestedUserSerializer(read_only=True)
     filtered_content = serializers.SerializerMethodField()
 
-    def setup_eager_loading(queryset):
+    def setup_eager_loading(queryset, counts_only=False):
         """ Perform necessary eager loading of data. """
         queryset = queryset.select_related('creator', 'group')
+        if counts_only:
+            return queryset.prefetch_related('group__users')
         queryset = queryset.prefetch_related('flags', 'likes', 'group__users')
         return queryset
 
@@ -117,18 +196,21 @@ class PostSuperuserSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Post
-        fields = ('id', 'created_at', 'content', 'creator', 'group', 'picture', 'link', 'ogp', 'likes', 'flags', 'filtered_content', 'is_deleted', 'is_sponsored', 'is_random', 'is_announcement')
+        fields = ('id', 'created_at', 'content', 'creator', 'group', 'picture', 'link', 'ogp', 'likes', 'flags', 'filtered_content', 'is_deleted', 'is_sponsored', 'is_random', 'is_announcement',
+            'like_count', 'dislike_count', 'comment_count', 'share_count', 'flag_count')
         #depth = 1
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(CountsOnlyMixin, serializers.ModelSerializer):
 
     creator = NestedUserSerializer(read_only=True)
     content = serializers.SerializerMethodField()
 
-    def setup_eager_loading(queryset):
+    def setup_eager_loading(queryset, counts_only=False):
         """ Perform necessary eager loading of data. """
         queryset = queryset.select_related('creator', 'post')
+        if counts_only:
+            return queryset
         queryset = queryset.prefetch_related('likes', 'post__creator', 'post__group', 'post__likes', 'post__shares', 'post__flags')
         return queryset
 
@@ -137,7 +219,7 @@ class CommentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Comment
-        fields = ('id', 'content', 'created_at', 'post', 'creator' , 'likes')
+        fields = ('id', 'content', 'created_at', 'post', 'creator' , 'likes', 'like_count', 'dislike_count', 'flag_count')
         #depth = 1
 
     def create(self, data):
@@ -150,7 +232,7 @@ class CommentSerializer(serializers.ModelSerializer):
         else:
             raise PermissionError('Commenting is disabled for this group')
 
-class CommentSuperuserSerializer(serializers.ModelSerializer):
+class CommentSuperuserSerializer(CountsOnlyMixin, serializers.ModelSerializer):
 
     creator = NestedUserSerializer(read_only=True)
     filtered_content = serializers.SerializerMethodField()
@@ -170,7 +252,7 @@ class CommentSuperuserSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Comment
-        fields = ('id', 'content', 'created_at', 'post', 'creator', 'filtered_content', 'is_deleted', 'likes')
+        fields = ('id', 'content', 'created_at', 'post', 'creator', 'filtered_content', 'is_deleted', 'likes', 'like_count', 'dislike_count', 'flag_count')
         #depth = 1
 
 
@@ -181,7 +263,7 @@ class PostLikeSerializer(serializers.ModelSerializer):
     def setup_eager_loading(queryset):
         """ Perform necessary eager loading of data. """
         queryset = queryset.select_related('user', 'post')
-        queryset = queryset.prefetch_related('post__creator', 'post__group', 'post__likes', 'post__shares', 'post__flags')
+        queryset = queryset.prefetch_related('user__groups', 'user__user_permissions', 'post__creator', 'post__group', 'post__likes', 'post__shares', 'post__flags')
         return queryset
 
     class Meta:
@@ -1,6 +1,11 @@
+import threading
+
 from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase
 from rest_framework.test import APITestCase
 
+from kidsbook.integration.sls import SLSClient
+from kidsbook.integration.stub import FakeSLSServer
 from kidsbook.user.views import generate_token
 from json import loads, dumps
 
@@ -10,6 +15,16 @@ url_prefix = "/api/v1"
 
 class TestSLS(APITestCase):
     def setUp(self):
+        self.sls_server = FakeSLSServer()
+        self.sls_server.start()
+        self.addCleanup(self.sls_server.stop)
+        sls_settings = self.settings(SLS_CLIENT={
+            'TOKEN_URL': self.sls_server.token_url,
+            'GRAPHQL_URL': self.sls_server.graphql_url,
+        })
+        sls_settings.enable()
+        self.addCleanup(sls_settings.disable)
+
         self.url = url_prefix + "/group/"
         self.username = "john"
         self.email = "john@snow.com"
@@ -121,6 +136,12 @@ class TestSLS(APITestCase):
         ]
         self.assertTrue(set(expected_group_names) == set(return_group_names))
 
+    def test_login_an_unknown_sls_user(self):
+        url = "{}/sls/login/".format(url_prefix)
+        response = self.client.post(url, {"user-id": "00000000-0000-0000-0000-000000000000"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(User.objects.all()), 3)
+
     def test_login_already_existing_sls_student(self):
         url = "{}/sls/login/".format(url_prefix)
         body = {"user-id": self.sls_user_id}
@@ -150,3 +171,115 @@ class TestSLS(APITestCase):
         self.assertTrue("user" in response.json().get("data", {}))
         self.assertTrue("token" in response.json().get("data", {}))
         self.assertEqual(len(User.objects.all()), 4)
+        # The second login is answered from the cache of the client
+        self.assertEqual(self.sls_server.num_queries, 1)
+
+
+class TestSLSClient(SimpleTestCase):
+    def setUp(self):
+        self.server = FakeSLSServer()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.student_id = "04dd6d77-1121-4a74-9499-f22fa924f3ce"
+        self.teacher_id = "e37a72e6-bfcc-4d7f-9a41-e556ccf67348"
+
+    def get_client(self, **kwargs):
+        client = SLSClient(token_url=self.server.token_url, graphql_url=self.server.graphql_url, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_token_is_reused_until_it_expires(self):
+        client = self.get_client()
+        self.assertEqual(client.get_user_data(self.student_id)["data"]["user"]["name"], "TESTER 107")
+        self.assertEqual(client.get_user_data(self.teacher_id)["data"]["user"]["name"], "TESTER 118")
+        self.assertEqual(self.server.num_tokens, 1)
+        self.assertEqual(self.server.num_queries, 2)
+        # A single kept-alive connection is used
+        self.assertEqual(self.server.num_connections, 1)
+
+    def test_token_is_refreshed_before_it_expires(self):
+        self.server.token_ttl = 30
+        client = self.get_client(refresh_margin=60)
+        client.get_user_data(self.student_id)
+        client.get_user_data(self.teacher_id)
+        self.assertEqual(self.server.num_tokens, 2)
+
+    def test_rejected_token_is_refreshed(self):
+        client = self.get_client()
+        client.get_user_data(self.student_id)
+        self.server.revoke_tokens()
+        self.assertEqual(client.get_user_data(self.teacher_id)["data"]["user"]["name"], "TESTER 118")
+        self.assertEqual(self.server.num_tokens, 2)
+
+    def test_rejected_token_does_not_open_the_circuit(self):
+        client = self.get_client(failure_threshold=1)
+        client.get_user_data(self.student_id)
+        self.server.revoke_tokens()
+        self.assertIsNotNone(client.get_user_data(self.teacher_id))
+        self.assertFalse(client.circuit_breaker.is_open)
+
+    def test_cached_users_are_bounded(self):
+        client = self.get_client(max_cached_users=1)
+        client.get_user_data(self.student_id)
+        client.get_user_data(self.teacher_id)
+        client.get_user_data(self.teacher_id)
+        self.assertEqual(self.server.num_queries, 2)
+
+        # The least recently used user was dropped
+        client.get_user_data(self.student_id)
+        self.assertEqual(self.server.num_queries, 3)
+
+    def test_user_locks_are_dropped(self):
+        client = self.get_client()
+        for index in range(10):
+            client.get_user_data("00000000-0000-0000-0000-00000000000{}".format(index))
+        self.assertEqual({}, client._user_locks)
+
+    def test_concurrent_logins_of_a_user_query_sls_once(self):
+        self.server.delay = 0.05
+        client = self.get_client()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(client.get_user_data(self.student_id)))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(result["data"]["user"]["name"] == "TESTER 107" for result in results))
+        self.assertEqual(self.server.num_tokens, 1)
+        self.assertEqual(self.server.num_queries, 1)
+
+    def test_cached_user_expires(self):
+        client = self.get_client(user_cache_timeout=0)
+        client.get_user_data(self.student_id)
+        client.get_user_data(self.student_id)
+        self.assertEqual(self.server.num_queries, 2)
+
+    def test_unknown_user_is_not_cached(self):
+        client = self.get_client()
+        user_id = "00000000-0000-0000-0000-000000000000"
+        self.assertIn("errors", client.get_user_data(user_id))
+        self.assertIn("errors", client.get_user_data(user_id))
+        self.assertEqual(self.server.num_queries, 2)
+
+    def test_circuit_opens_after_failures(self):
+        self.server.failing = True
+        client = self.get_client(failure_threshold=2, recovery_timeout=60)
+        for _ in range(4):
+            self.assertIsNone(client.get_user_data(self.student_id))
+        self.assertTrue(client.circuit_breaker.is_open)
+        self.assertEqual(self.server.num_requests, 2)
+
+    def test_circuit_closes_after_recovery(self):
+        self.server.failing = True
+        client = self.get_client(failure_threshold=1, recovery_timeout=0)
+        self.assertIsNone(client.get_user_data(self.student_id))
+        self.assertTrue(client.circuit_breaker.is_open)
+
+        self.server.failing = False
+        self.assertEqual(client.get_user_data(self.student_id)["data"]["user"]["name"], "TESTER 107")
+        self.assertFalse(client.circuit_breaker.is_open)
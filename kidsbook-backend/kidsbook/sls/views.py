@@ -89,7 +89,7 @@ def login(request):
         # Create all the groups that the user is in
         create_and_add_sls_user_to_his_groups(user, groups)
 
-        serializer = UserSerializer(user)
+        serializer = UserSummarySerializer(user)
         return Response({"data": {"user": serializer.data, "token": token}})
 
     if (
@@ -110,7 +110,7 @@ def login(request):
         # Create all the groups that the user is in
         create_and_add_sls_user_to_his_groups(user, groups)
 
-        serializer = UserSerializer(user)
+        serializer = UserSummarySerializer(user)
         return Response({"data": {"user": serializer.data, "token": token}})
 
     # Create an account if the user has not registed under ClassBuzz
@@ -126,7 +126,7 @@ def login(request):
     # Create all the groups that the user is in
     create_and_add_sls_user_to_his_groups(user, groups)
 
-    serializer = UserSerializer(user)
+    serializer = UserSummarySerializer(user)
     return Response(
         {"data": {"user": serializer.data, "token": token}}, status=status.HTTP_200_OK
     )
@@ -0,0 +1,54 @@
+import copy
+
+from django.db.models.expressions import RawSQL
+
+
+def zero_counters(stats):
+    """Return a copy of the stats with every counter set to 0."""
+    if isinstance(stats, dict):
+        return {key: zero_counters(value) for key, value in stats.items()}
+    if isinstance(stats, list):
+        return [zero_counters(value) for value in stats]
+    return 0
+
+
+def iter_counters(stats, path=()):
+    """Yield (path, value) for every counter of the stats, `path` being the keys (as strings) leading to it."""
+    if isinstance(stats, dict):
+        items = stats.items()
+    elif isinstance(stats, list):
+        items = enumerate(stats)
+    else:
+        yield path, stats
+        return
+    for key, value in items:
+        yield from iter_counters(value, path + (str(key),))
+
+
+def get_stats_counter(instance):
+    """
+    Return a copy of the instance (a Survey or a Game) with zeroed stats.
+    The functions updating the stats in place count the changes on it, to be added by `save_stats_counter`.
+    """
+    counter = copy.copy(instance)
+    counter.stats = zero_counters(instance.stats)
+    return counter
+
+
+def save_stats_counter(counter):
+    """
+    Add the changes counted on `counter.stats` to the stats of the instance in the DB,
+    with a single `UPDATE` of `jsonb_set` increments, so concurrent changes are never lost.
+    The stats of the instances in memory are left as they were.
+    """
+    expression = 'stats'
+    params = []
+    for path, delta in iter_counters(counter.stats):
+        if delta == 0:
+            continue
+        expression = 'jsonb_set({}, %s::text[], to_jsonb(COALESCE((stats #>> %s::text[])::integer, 0) + %s))'.format(expression)
+        params.extend([list(path), list(path), delta])
+
+    if not params:
+        return 0
+    return type(counter).objects.filter(pk=counter.pk).update(stats=RawSQL(expression, params))
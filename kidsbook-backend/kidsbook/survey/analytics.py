@@ -0,0 +1,131 @@
+from csv import writer
+from itertools import accumulate
+
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+from kidsbook.models import GroupMember, SurveyAnswer
+
+
+EXPORT_CHUNK_SIZE = 500
+
+
+def parse_options(answer, question_index):
+    """
+    Return the indexes of the options chosen by an answer ('3', 3 or '[1, 2]'),
+    or None for a text answer.
+    """
+    if isinstance(answer, int):
+        return [answer]
+    answer = answer.strip() if answer else ''
+    if answer.isdigit():
+        return [int(answer)]
+    if not (answer.startswith('[') and answer.endswith(']')):
+        return None
+
+    options = []
+    for option in answer[1:-1].split(','):
+        option = option.strip()
+        if option.isdigit():
+            options.append(int(option))
+        elif option != '':
+            raise ValueError('Value of {} in question number {} must be an integer.'.format(option, question_index))
+    return options
+
+
+def get_question_answers(survey_id, question_index):
+    """Return the answers of the users to a question ({user_id: answer}), indexed by the DB."""
+    answers = SurveyAnswer.objects.filter(survey_id=survey_id).values_list(
+        'user_id', 'answers__{}'.format(question_index)
+    )
+    return {str(user_id): answer for user_id, answer in answers.iterator()}
+
+
+def get_responses_by_day(survey_id):
+    """Return the number of responses by day, and the total number of responses at the end of each day."""
+    counts = SurveyAnswer.objects.filter(survey_id=survey_id).annotate(
+        day=TruncDate('created_at')
+    ).order_by('day').values_list('day').annotate(count=Count('id'))
+    counts = list(counts)
+    totals = accumulate(count for _, count in counts)
+    return [
+        {'date': str(day), 'count': count, 'total': total}
+        for (day, count), total in zip(counts, totals)
+    ]
+
+
+def get_survey_analytics(survey):
+    """
+    Compute the analytics of the answers of the survey, in a single pass over the raw answers:
+    - the number of answers and the histogram of the options of every question,
+    - the number of times every two options are chosen together, for the multiple-choice questions,
+    - the response rate of the members of the group, and the responses by day.
+    """
+    questions = survey.questions_answers
+    num_options = [len(question.get('options', [])) for question in questions]
+    histograms = [[0] * count for count in num_options]
+    co_occurrences = [[[0] * count for _ in range(count)] for count in num_options]
+    is_multiple_choice = [False for _ in questions]
+    num_answers = [0 for _ in questions]
+
+    num_responses = 0
+    answers = SurveyAnswer.objects.filter(survey_id=survey.id).values_list('answers', flat=True)
+    for response in answers.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        num_responses += 1
+        for index, answer in enumerate(response[:len(questions)]):
+            if answer is None or str(answer).strip() in ('', '[]'):
+                continue
+            num_answers[index] += 1
+            if num_options[index] == 0:
+                continue
+
+            try:
+                options = parse_options(answer, index)
+            except ValueError:
+                continue
+            options = sorted(set(option for option in options or [] if option < num_options[index]))
+            is_multiple_choice[index] = is_multiple_choice[index] or str(answer).strip().startswith('[')
+            for option in options:
+                histograms[index][option] += 1
+                for other_option in options:
+                    co_occurrences[index][option][other_option] += 1
+
+    num_members = GroupMember.objects.filter(group_id=survey.group_id).count()
+    return {
+        'num_of_responses': num_responses,
+        'num_of_members': num_members,
+        'response_rate': num_responses / num_members if num_members else 0,
+        'responses_by_day': get_responses_by_day(survey.id),
+        'questions': [
+            {
+                'num_of_answers': num_answers[index],
+                'histogram': histograms[index],
+                'co_occurrence': co_occurrences[index] if is_multiple_choice[index] else None,
+            }
+            for index in range(len(questions))
+        ],
+    }
+
+
+class Echo:
+    """A file-like object returning what is written to it, for `csv.writer` to stream its rows."""
+
+    def write(self, value):
+        return value
+
+
+def iter_survey_csv(survey):
+    """
+    Stream the responses of the survey as CSV lines: one row per user, with a column per question.
+    The answers are read from the DB by chunks, so the whole export is never in memory.
+    """
+    csv_writer = writer(Echo())
+    yield csv_writer.writerow(
+        ['user_id', 'username', 'submitted_at'] + [question.get('question', '') for question in survey.questions_answers]
+    )
+
+    answers = SurveyAnswer.objects.filter(survey_id=survey.id).order_by('created_at').values_list(
+        'user_id', 'user__username', 'created_at', 'answers'
+    )
+    for user_id, username, created_at, response in answers.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield csv_writer.writerow([user_id, username, created_at.isoformat()] + list(response))
@@ -1,8 +1,13 @@
+from csv import reader
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase
 from kidsbook.models import Survey, SurveyAnswer, Group
 from kidsbook.user.views import generate_token
 from kidsbook.serializers import SurveyAnswerSerializer
+from kidsbook.stats import get_stats_counter, save_stats_counter
+from kidsbook.survey.views import update_survey_stats
 
 User = get_user_model()
 url_prefix = '/api/v1'
@@ -425,6 +430,15 @@ class TestUpdateSurvey(APITestCase):
         }
         self.assertEqual(response.data.get('data', {}), expected_response)
 
+    def test_update_survey_info_without_writing_stats(self):
+        # The stats are left to the answers submitted meanwhile
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'title': 'new_title', 'is_pinned': 'true'}, HTTP_AUTHORIZATION=self.superuser_token)
+        self.assertEqual(202, response.status_code)
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE "kidsbook_survey"')]
+        self.assertEqual(1, len(updates))
+        self.assertNotIn('"stats"', updates[0])
+
     def test_update_group_of_survey(self):
         # Create a new group
         response = self.client.post(url_prefix + '/group/', {"name": "testing group2"}, HTTP_AUTHORIZATION=self.superuser_token)
@@ -980,3 +994,74 @@ class TestSurveyAnswer(APITestCase):
             Survey.objects.get(id=self.survey['id']).stats,
             expected_stats
         )
+
+    def test_stats_counter_keeps_concurrent_answers(self):
+        # Both answers are counted on a survey read before the other answer was submitted
+        survey = Survey.objects.get(id=self.survey['id'])
+        self.client.post(
+            '{}user/{}/'.format(self.url, self.another_user.id),
+            {'answers': [0, '[0, 1]', 'Cats.']},
+            HTTP_AUTHORIZATION=self.another_token
+        )
+
+        survey_stats = get_stats_counter(survey)
+        update_survey_stats(['1', '2', 'Dogs.'], survey_stats)
+        survey_stats.stats['num_of_responses'] += 1
+        save_stats_counter(survey_stats)
+
+        self.assertEqual(
+            Survey.objects.get(id=self.survey['id']).stats,
+            {'answers': {'0': [1, 1, 0], '1': [1, 1, 1], '2': []}, 'num_of_responses': 2}
+        )
+
+    def test_get_survey_analytics(self):
+        self.group.add_member(self.user)
+        self.group.add_member(self.another_user)
+        self.client.post(
+            '{}user/{}/'.format(self.url, self.user.id),
+            {'answers': [1, '[0, 2]', 'Cause I like dogs.']},
+            HTTP_AUTHORIZATION=self.user_token
+        )
+        self.client.post(
+            '{}user/{}/'.format(self.url, self.another_user.id),
+            {'answers': [1, '[0, 1, 2]', '']},
+            HTTP_AUTHORIZATION=self.another_token
+        )
+
+        response = self.client.get('{}analytics/'.format(self.url), HTTP_AUTHORIZATION=self.superuser_token)
+        self.assertEqual(200, response.status_code)
+        analytics = response.data['data']
+        self.assertEqual(2, analytics['num_of_responses'])
+        self.assertEqual(2 / analytics['num_of_members'], analytics['response_rate'])
+        self.assertEqual(2, analytics['responses_by_day'][-1]['total'])
+        self.assertEqual(
+            {'num_of_answers': 2, 'histogram': [0, 2, 0], 'co_occurrence': None},
+            analytics['questions'][0]
+        )
+        self.assertEqual(
+            {'num_of_answers': 2, 'histogram': [2, 1, 2], 'co_occurrence': [[2, 1, 2], [1, 1, 1], [2, 1, 2]]},
+            analytics['questions'][1]
+        )
+        self.assertEqual(1, analytics['questions'][2]['num_of_answers'])
+
+        # Only superusers
+        response = self.client.get('{}analytics/'.format(self.url), HTTP_AUTHORIZATION=self.user_token)
+        self.assertEqual(403, response.status_code)
+
+    def test_export_survey_answers(self):
+        self.client.post(
+            '{}user/{}/'.format(self.url, self.user.id),
+            {'answers': [1, '[0, 2]', 'Cause I like dogs, "really".']},
+            HTTP_AUTHORIZATION=self.user_token
+        )
+
+        response = self.client.get('{}export/'.format(self.url), HTTP_AUTHORIZATION=self.superuser_token)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('text/csv', response['Content-Type'])
+        rows = list(reader(b''.join(response.streaming_content).decode('utf-8').splitlines()))
+        self.assertEqual(['user_id', 'username', 'submitted_at', 'Do you like cats ?', 'Do you like dogs ?', 'Why ?'], rows[0])
+        self.assertEqual(
+            [str(self.user.id), self.user.username, '1', '[0, 2]', 'Cause I like dogs, "really".'],
+            rows[1][:2] + rows[1][3:]
+        )
+        self.assertEqual(2, len(rows))
@@ -12,5 +12,11 @@ urlpatterns = [
     path('<uuid:survey_id>/user/<uuid:user_id>/', views.survey_answer),
 
     # Get / Delete all answers of a survey
-    path('<uuid:survey_id>/answers/', views.get_delete_survey_answers)
+    path('<uuid:survey_id>/answers/', views.get_delete_survey_answers),
+
+    # Get the analytics of the answers of a survey
+    path('<uuid:survey_id>/analytics/', views.survey_analytics),
+
+    # Export all answers of a survey as CSV
+    path('<uuid:survey_id>/export/', views.survey_export)
 ]
@@ -1,4 +1,6 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
@@ -9,6 +11,8 @@ from kidsbook.serializers import *
 from kidsbook.models import *
 from kidsbook.permissions import *
 from kidsbook.utils import *
+from kidsbook.stats import get_stats_counter, save_stats_counter
+from kidsbook.survey.analytics import get_question_answers, get_survey_analytics, iter_survey_csv, parse_options
 
 
 User = get_user_model()
@@ -120,13 +124,7 @@ def get_survey_info(request, kargs):
                 )
 
             # Process the answers
-            survey_answers = SurveyAnswer.objects.filter(survey__id=survey_id)
-            survey_answers_data = SurveyAnswerSerializer(survey_answers, many=True).data
-            answers = {
-                    str(survey_answer['user']): survey_answer['answers'][question_index]
-                    for survey_answer in iter(survey_answers_data)
-            }
-            serializer_data['answers'] = answers
+            serializer_data['answers'] = get_question_answers(survey_id, question_index)
 
             # Process the stats
             serializer_data['stats']['answers'] = serializer_data['stats']['answers'][str(question_index)]
@@ -175,6 +173,9 @@ def update_survey(request, kargs):
 
             survey.questions_answers = questions
             survey.stats = new_stats
+            updated_fields = ['questions_answers', 'stats']
+        else:
+            updated_fields = []
 
         survey_fields = set(Survey.__dict__.keys())
         for attr, value in iter(request.data.dict().items()):
@@ -185,8 +186,13 @@ def update_survey(request, kargs):
                     setattr(survey, attr, str(value).lower()=='true')
                 elif attr != 'questions_answers' and attr != 'stats':
                     setattr(survey, attr, value)
+                else:
+                    continue
+                updated_fields.append(attr)
 
-        survey.save()
+        # Only the edited fields are written, not to overwrite the stats of the answers submitted meanwhile
+        field_names = {field.name for field in Survey._meta.concrete_fields}
+        survey.save(update_fields=[attr for attr in updated_fields if attr in field_names])
         serializer = SurveySuperuserSerializer(survey)
         return Response({'data': serializer.data}, status=status.HTTP_202_ACCEPTED)
     except Exception as exc:
@@ -247,28 +253,13 @@ def update_survey_stats(answers, survey, value=1):
         if str(questions[index].get('required', 'false')).lower() == 'true' and (not ans or ans.strip() == ''):
             raise ValueError('Missing value for question number {}, which is required.'.format(index))
 
-        # If the answer is a dropdown/option type
-        if (len(questions[index].get('options',[])) > 0 and ans.strip() != '' and ans
-                and ans[0] == '[' and ans[-1] == ']'):
-            for option in iter(ans[1:-1].split(',')):
-                option = option.strip()
-                if option.isdigit():
-                    survey_stats['answers'][str(index)][int(option)] += value
-                elif option != '':
-                    raise ValueError('Value of {} in question number {} must be an integer.'.format(option, index))
-            continue
-
-        # If the answer is an integer
-        elif isinstance(ans, str):
-            # If not text-based input, increase the stats count
-            if ans.isdigit() and len(questions[index].get('options',[])) > 0:
-                survey_stats['answers'][str(index)][int(ans)] += value
-            continue
-        elif isinstance(ans, int):
-            survey_stats['answers'][str(index)][ans] += value
-            continue
-
-        raise ValueError('The answer must either be an integer in string format, string or array, but not {}'.format(type(ans)))
+        if not isinstance(ans, (str, int)):
+            raise ValueError('The answer must either be an integer in string format, string or array, but not {}'.format(type(ans)))
+
+        # If the answer is a dropdown/option type, increase the stats count of the options
+        if len(questions[index].get('options', [])) > 0:
+            for option in parse_options(ans, index) or []:
+                survey_stats['answers'][str(index)][option] += value
 
 def update_survey_answer(request, kargs):
     try:
@@ -291,23 +282,25 @@ def update_survey_answer(request, kargs):
     if len(answers) != len(questions):
         raise ValueError('There are {} questions in the survey, but {} answers are provided.'.format(len(questions), len(answers)))
 
-    if SurveyAnswer.objects.filter(user=user, survey=survey).exists():
-        old_answers = SurveyAnswer.objects.get(user=user, survey=survey).answers
-        update_survey_stats(old_answers, survey, -1)
-        update_survey_stats(answers, survey)
-        survey.save()
-        survey_answer = SurveyAnswer.objects.get(user=user, survey=survey)
-        survey_answer.answers = answers
-        survey_answer.save()
-    else:
-        update_survey_stats(answers, survey)
-        survey.stats['num_of_responses'] += 1
-        survey.save()
-        survey_answer = SurveyAnswer.objects.create(
-            user=User.objects.get(id=kargs.get('user_id', '')),
-            survey=survey,
-            answers=answers
-        )
+    with transaction.atomic():
+        # Lock the previous answer, so that it is removed from the stats only once
+        survey_stats = get_stats_counter(survey)
+        survey_answer = SurveyAnswer.objects.select_for_update().filter(user=user, survey=survey).first()
+        if survey_answer is not None:
+            update_survey_stats(survey_answer.answers, survey_stats, -1)
+            update_survey_stats(answers, survey_stats)
+            survey_answer.answers = answers
+            survey_answer.save()
+        else:
+            update_survey_stats(answers, survey_stats)
+            survey_stats.stats['num_of_responses'] += 1
+            survey_answer = SurveyAnswer.objects.create(
+                user=user,
+                survey=survey,
+                answers=answers
+            )
+        save_stats_counter(survey_stats)
+
     serializer = SurveyAnswerSerializer(survey_answer)
     return Response({'data': serializer.data}, status=status.HTTP_202_ACCEPTED)
 
@@ -336,12 +329,15 @@ def delete_survey_answer(request, kargs):
         )
 
     # Remove the answers from this survey_answer from survey's stats
-    answers = survey_answer.answers
-    update_survey_stats(answers, survey, -1)
-    survey.stats['num_of_responses'] -= 1
-    survey.save()
-
-    survey_answer.delete()
+    with transaction.atomic():
+        # Lock the answer, so that it is removed from the stats only once
+        survey_answer = SurveyAnswer.objects.select_for_update().filter(id=survey_answer.id).first()
+        if survey_answer is not None:
+            survey_stats = get_stats_counter(survey)
+            update_survey_stats(survey_answer.answers, survey_stats, -1)
+            survey_stats.stats['num_of_responses'] -= 1
+            save_stats_counter(survey_stats)
+            survey_answer.delete()
     return Response({}, status=status.HTTP_202_ACCEPTED)
 
 
@@ -418,3 +414,43 @@ def get_delete_survey_answers(request, **kargs):
     except Exception as exc:
         return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
     return Response({'error': 'Bad request.'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+#================================================================================================
+# Analytics and export of the answers of a survey
+
+def get_survey_analytics_request(request, kargs):
+    try:
+        survey = Survey.objects.get(id=kargs.get('survey_id', ''))
+    except Survey.DoesNotExist:
+        return Response(
+            {'error': "Requested survey doesn't exist."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    return Response({'data': get_survey_analytics(survey)})
+
+def export_survey_answers_request(request, kargs):
+    try:
+        survey = Survey.objects.get(id=kargs.get('survey_id', ''))
+    except Survey.DoesNotExist:
+        return Response(
+            {'error': "Requested survey doesn't exist."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    response = StreamingHttpResponse(iter_survey_csv(survey), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="survey_{}.csv"'.format(survey.id)
+    return response
+
+@api_view(['GET'])
+@permission_classes((IsAuthenticated, IsTokenValid, IsSuperUser))
+def survey_analytics(request, **kargs):
+    """Get the histograms, co-occurrences of options and response rate of the answers of a survey."""
+    return get_survey_analytics_request(request, kargs)
+
+@api_view(['GET'])
+@permission_classes((IsAuthenticated, IsTokenValid, IsSuperUser))
+def survey_export(request, **kargs):
+    """Stream all answers of a survey as a CSV file."""
+    return export_survey_answers_request(request, kargs)
@@ -1,7 +1,19 @@
 import os
+from datetime import timedelta
+from io import StringIO
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.test import APITestCase
-from kidsbook.models import Group, Post
+from rest_framework_jwt.utils import jwt_payload_handler
+from kidsbook.authentication import CachedJSONWebTokenAuthentication
+from kidsbook.checks import check_shared_cache
+from kidsbook.models import BlackListedToken, Comment, Group, Post, Role, ScreenTime, UserGroupStats, UserLikeComment, UserLikePost
+from kidsbook.revocation import TokenRevocationCache
+from kidsbook.screen_time import ScreenTimeBuffer, record_heartbeat
 from kidsbook.serializers import UserSerializer
 from kidsbook.user.views import generate_token
 
@@ -27,12 +39,84 @@ class TestUser(APITestCase):
         response = self.client.post(url, data={'email_address': self.email, 'password': self.password})
         self.assertEqual(200, response.status_code)
 
+    def test_login_upgrades_placeholder_password(self):
+        user = User.objects.create_user(username="hey", email_address="kid@s.sss")
+        self.assertTrue(user.password.startswith('pbkdf2_placeholder$'))
+
+        response = self.client.post(self.url + 'login/', data={'email_address': user.email_address, 'password': '12345'})
+        self.assertEqual(200, response.status_code)
+
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('bcrypt_sha256$'))
+        self.assertTrue(user.check_password('12345'))
+
+    def test_get_role_without_query(self):
+        # The roles are seeded once by `migrate`
+        self.assertEqual({1: 'teacher', 2: 'student', 3: 'Virtual student'}, dict(Role.objects.values_list('id', 'name')))
+
+        user = User.objects.get(id=self.user.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(1, user.role.id)
+            self.assertEqual('teacher', user.role.name)
+
+    def test_authenticate_from_cache(self):
+        authentication = CachedJSONWebTokenAuthentication()
+        payload = jwt_payload_handler(self.user)
+        self.assertEqual(self.user, authentication.authenticate_credentials(payload))
+
+        with self.assertNumQueries(0):
+            user = authentication.authenticate_credentials(payload)
+            self.assertEqual(1, user.role.id)
+        # The password hash is not cached
+        self.assertIn('password', user.get_deferred_fields())
+
+        # A heartbeat expires the cached user
+        record_heartbeat(user, 1000, timezone.now().date())
+        self.assertEqual(1000, authentication.authenticate_credentials(payload).last_active_time)
+
+        # Saving the user expires the cached one
+        self.user.realname = "Jon"
+        self.user.save()
+        self.assertEqual("Jon", authentication.authenticate_credentials(payload).realname)
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            authentication.authenticate_credentials(payload)
+
     def get_token(self, user):
         token_response = self.client.post(self.url + 'login/', data={'email_address': user.email_address, 'password': self.password})
         token = token_response.data.get('data', {}).get('token', b'')
         token = 'Bearer {0}'.format(token.decode('utf-8'))
         return token
 
+    def test_logout_revokes_token(self):
+        token = self.get_token(self.user)
+        response = self.client.post(self.url + 'logout/', HTTP_AUTHORIZATION=token)
+        self.assertEqual(202, response.status_code)
+        self.assertIsNotNone(BlackListedToken.objects.get(token=token).expires_at)
+
+        response = self.client.get("{}{}/".format(self.url, self.user.id), HTTP_AUTHORIZATION=token)
+        self.assertEqual(403, response.status_code)
+
+    def test_check_revoked_token_without_query(self):
+        token = 'Bearer {0}'.format(generate_token(self.user).decode('utf-8'))
+        revocation_cache = TokenRevocationCache()
+        revocation_cache.reload()
+        revocation_cache.revoke(token, self.user)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(revocation_cache.is_revoked(token))
+            self.assertFalse(revocation_cache.is_revoked(token + 'a'))
+
+    def test_prune_expired_blacklisted_tokens(self):
+        token = 'Bearer {0}'.format(generate_token(self.user).decode('utf-8'))
+        BlackListedToken.objects.create(token=token, user=self.user)
+        BlackListedToken.objects.create(token='Bearer expired', user=self.user, expires_at=timezone.now() - timedelta(days=1))
+
+        call_command('prune_blacklisted_tokens', stdout=StringIO())
+        self.assertEqual([token], list(BlackListedToken.objects.values_list('token', flat=True)))
+
 
     def test_get_self_user_profile_with_token(self):
         token = self.get_token(self.user)
@@ -95,6 +179,135 @@ class TestUser(APITestCase):
         }
         self.assertEqual(expected_stats, response.data.get('data', {}).get('stats', {}))
 
+    def test_user_group_stats(self):
+        user = User.objects.create_user(username="hey", email_address="kid@s.sss", password=self.password)
+        group = Group.objects.create_group(name="testing group", creator=self.user)
+        group.add_member(user)
+
+        post = Post.objects.create_post(content="testing content", creator=user, group=group)
+        UserLikePost.objects.create(user=self.user, post=post)
+        UserLikePost.objects.create(user=user, post=post)
+        comment = Comment.objects.create_comment(content="testing comment", post=post, creator=self.user)
+        Comment.objects.create_comment(content="another comment", post=post, creator=user)
+        UserLikeComment.objects.create(user=user, comment=comment, like_or_dislike=True)
+
+        stats = UserGroupStats.objects.get(user=user, group=group)
+        self.assertEqual(
+            (1, 1, 2, 2),
+            (stats.num_posts, stats.num_comments, stats.num_likes_given, stats.num_likes_received)
+        )
+
+        # The backfill gives the same stats
+        UserGroupStats.objects.all().delete()
+        call_command('backfill_user_group_stats', stdout=StringIO())
+        stats = UserGroupStats.objects.get(user=user, group=group)
+        self.assertEqual(
+            (1, 1, 2, 2),
+            (stats.num_posts, stats.num_comments, stats.num_likes_given, stats.num_likes_received)
+        )
+
+        token = self.get_token(user)
+        response = self.client.get("{}{}/".format(self.url, user.id), HTTP_AUTHORIZATION=token)
+        self.assertEqual(
+            {'num_comments': 1, 'num_likes_given': 2, 'num_likes_received': 2},
+            response.data['data']['stats'][str(group.id)]
+        )
+
+        # Deleting the post removes its likes and comments from the stats
+        post.delete()
+        stats = UserGroupStats.objects.get(user=user, group=group)
+        self.assertEqual(
+            (0, 0, 0, 0),
+            (stats.num_posts, stats.num_comments, stats.num_likes_given, stats.num_likes_received)
+        )
+
+    def test_record_time(self):
+        token = self.get_token(self.user)
+        url = self.url + 'record_time/'
+        timestamp = self.user.last_active_time + 1000
+
+        # The first heartbeat after a break adds no screen time
+        response = self.client.post(url, {'timestamp': timestamp}, HTTP_AUTHORIZATION=token)
+        self.assertEqual(202, response.status_code)
+        self.assertEqual(0, response.data['new_time'])
+
+        response = self.client.post(url, {'timestamp': timestamp + 30}, HTTP_AUTHORIZATION=token)
+        self.assertEqual(30, response.data['new_time'])
+        self.assertEqual(1, ScreenTime.objects.filter(user=self.user).count())
+        self.assertEqual(timestamp + 30, User.objects.get(id=self.user.id).last_active_time)
+
+    def test_record_time_buffered(self):
+        another_user = User.objects.create_user(username="hey", email_address="kid@s.sss", password=self.password)
+        buffer = ScreenTimeBuffer(max_pending=10)
+        date = timezone.now().date()
+
+        for user in (self.user, another_user):
+            for seconds in (0, 30, 55, 85):
+                buffer.record(user, 1000 + seconds, date)
+        self.assertEqual(2, buffer.pending())
+        self.assertFalse(ScreenTime.objects.exists())
+
+        self.assertEqual(2, buffer.flush())
+        self.assertEqual(0, buffer.pending())
+        for user in (self.user, another_user):
+            self.assertEqual(85, ScreenTime.objects.get(user=user, date=date).total_time)
+            self.assertEqual(1085, User.objects.get(id=user.id).last_active_time)
+
+        # The next writes are added to the stored screen time
+        buffer.record(User.objects.get(id=self.user.id), 1100, date)
+        buffer.flush()
+        self.assertEqual(100, ScreenTime.objects.get(user=self.user, date=date).total_time)
+
+    def test_merge_screen_times(self):
+        # A database created before the screen times were unique (the constraint is restored by the test's rollback)
+        table = ScreenTime._meta.db_table
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+            for name, constraint in constraints.items():
+                if constraint['unique'] and constraint['columns'] == ['user_id', 'date']:
+                    cursor.execute('ALTER TABLE {} DROP CONSTRAINT {}'.format(
+                        connection.ops.quote_name(table), connection.ops.quote_name(name)
+                    ))
+
+        date = timezone.now().date()
+        for total_time in (30, 60, 90):
+            ScreenTime.objects.create(user=self.user, date=date, total_time=total_time)
+        ScreenTime.objects.create(user=self.user, date=date - timedelta(days=1), total_time=10)
+
+        stdout = StringIO()
+        call_command('merge_screen_times', stdout=stdout)
+        self.assertIn('Merged 2 duplicated screen times.', stdout.getvalue())
+        self.assertEqual(180, ScreenTime.objects.get(user=self.user, date=date).total_time)
+        self.assertEqual(10, ScreenTime.objects.get(user=self.user, date=date - timedelta(days=1)).total_time)
+
+    def test_record_time_buffered_on_several_processes(self):
+        buffers = [ScreenTimeBuffer(), ScreenTimeBuffer()]
+        date = timezone.now().date()
+
+        # The heartbeats reach each process in turn, with the same (cached) user
+        for index, seconds in enumerate((0, 30, 60, 90)):
+            buffers[index % 2].record(self.user, 1000 + seconds, date)
+        for buffer in buffers:
+            buffer.flush()
+        self.assertEqual(90, ScreenTime.objects.get(user=self.user, date=date).total_time)
+        self.assertEqual(1090, User.objects.get(id=self.user.id).last_active_time)
+
+    def test_record_time_buffered_after_failed_flush(self):
+        buffer = ScreenTimeBuffer()
+        date = timezone.now().date()
+        buffer.record(self.user, 1000, date)
+        buffer.record(self.user, 1030, date)
+        # A screen time without a date fails the write
+        buffer.record(self.user, 1060, None)
+        with self.assertRaises(IntegrityError):
+            buffer.flush()
+        self.assertEqual(2, buffer.pending())
+
+        del buffer._deltas[(str(self.user.id), None)]
+        self.assertEqual(1, buffer.flush())
+        self.assertEqual(30, ScreenTime.objects.get(user=self.user, date=date).total_time)
+        self.assertEqual(1060, User.objects.get(id=self.user.id).last_active_time)
+
     def test_get_user_info_without_token(self):
         # Create an user
         username = "hey"
@@ -285,6 +498,19 @@ class TestUser(APITestCase):
         self.assertEqual(200, response.status_code)
         self.assertEqual(3, len(response.data.get('data', [])))
 
+class TestSharedCacheCheck(SimpleTestCase):
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_per_process_cache(self):
+        self.assertEqual(['kidsbook.E001'], [error.id for error in check_shared_cache(None)])
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+    }})
+    def test_shared_cache(self):
+        self.assertEqual([], check_shared_cache(None))
+
+
 class TestUserUpdate(APITestCase):
     def setUp(self):
         # Superuser
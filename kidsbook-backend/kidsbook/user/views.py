@@ -24,6 +24,8 @@ from kidsbook.models import *
 from kidsbook.serializers import *
 from kidsbook.permissions import *
 from kidsbook.utils import *
+from kidsbook.revocation import get_revocation_cache
+from kidsbook.screen_time import get_screen_time_buffer, get_today, is_screen_time_buffered, record_heartbeat
 import pdb
 
 # import settings
@@ -259,7 +261,7 @@ class LogOut(generics.ListAPIView):
     def post(self, request):
         try:
             token = request.META.get('HTTP_AUTHORIZATION')
-            BlackListedToken.objects.create(token=token, user=request.user)
+            get_revocation_cache().revoke(token, request.user)
             return Response({}, status=status.HTTP_202_ACCEPTED)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -267,35 +269,22 @@ class LogOut(generics.ListAPIView):
 class RecordTime(APIView):
     permission_classes = (IsAuthenticated, IsTokenValid)
     def post(self, request, **kargs):
-        interval = 30
-        user_id = request.user.id
-        user = User.objects.get(id=user_id)
-        tz = pytz.timezone('Asia/Singapore')
-        date = datetime.now(tz).date()
-        time_elapsed = int(float(request.data['timestamp'])) - user.last_active_time
-        if(time_elapsed > 2*interval or time_elapsed < 0):
-            new_time = 0
-        else:
-            new_time = time_elapsed
+        date = get_today()
+        timestamp = int(float(request.data['timestamp']))
 
-        if(ScreenTime.objects.filter(user=user, date=date).exists()):
-            obj = ScreenTime.objects.get(user=user, date=date)
-            setattr(obj, 'total_time', obj.total_time + new_time)
-            obj.save()
+        if is_screen_time_buffered():
+            # The screen time is written later, with the heartbeats of the other users
+            get_screen_time_buffer().record(request.user, timestamp, date)
+            total_time = None
         else:
-            obj = ScreenTime.objects.create(user=user, date=date, total_time=new_time)
-
-        setattr(user, 'last_active_time', int(float(request.data['timestamp'])))
-        user.save()
-        return Response({'data': user.last_active_time, 'new_time': obj.total_time, 'date': date}, status=status.HTTP_202_ACCEPTED)
+            total_time = record_heartbeat(request.user, timestamp, date)
+        return Response({'data': timestamp, 'new_time': total_time, 'date': date}, status=status.HTTP_202_ACCEPTED)
 
 class GetInfoUser(generics.ListAPIView):
     serializer_class = UserSerializer
     permission_classes = (IsAuthenticated, IsTokenValid)
 
     def list(self, request, **kargs):
-        # This method may be able to be more optimized
-
         try:
             user_id = kargs.get('pk', None)
             if user_id:
@@ -308,7 +297,7 @@ class GetInfoUser(generics.ListAPIView):
                         num_days = request.data['num_days']
                     else:
                         num_days = 0
-                    time_arr = usage_time(user, num_days)
+                    time_arr = usage_time(user, num_days, request.data.get('period', 'day'))
                 else:
                     self.serializer_class = UserPublicSerializer
                     time_arr = []
@@ -321,31 +310,18 @@ class GetInfoUser(generics.ListAPIView):
                 groups = response_data['user_groups']
                 group_ids = list(map(lambda group: group['id'], groups))
 
-                posts = Post.objects.filter(group__in=group_ids)
-                post_data = PostSerializer(posts, many=True).data
-
-                comments = Comment.objects.filter(post__in=posts)
-                comment_data = CommentSerializer(comments, many=True).data
-
-                post_like = UserLikePost.objects.filter(post__in=posts)
-                post_like_data = PostLikeSerializer(post_like, many=True).data
-
-                comment_like = UserLikeComment.objects.filter(comment__in=comments)
-                comment_like_data = CommentLikeSerializer(comment_like, many=True).data
+                # The stats are kept up to date in `UserGroupStats` on every post, comment and like
+                stats_by_group = {
+                    str(stats.group_id): stats
+                    for stats in UserGroupStats.objects.filter(user_id=user.id, group_id__in=group_ids)
+                }
 
                 response_data['stats'] = {}
-                user_id = response_data['id']
-
                 for group_id in group_ids:
-                    post_ids, user_post_ids = self.get_post_ids_and_user_post_ids_of_user_in_group(post_data, user_id, group_id)
-                    comment_ids, user_comment_ids = self.get_comment_ids_and_user_comment_ids_of_user_in_posts(comment_data, user_id, post_ids)
-
-                    likes_post_given, likes_post_received = self.get_post_likes_given_and_received(post_like_data, post_ids, user_post_ids, user_id)
-                    likes_comment_given, likes_comment_received = self.get_comment_likes_given_and_received(comment_like_data, comment_ids, user_comment_ids, user_id)
-
-                    response_data['stats'][group_id] = {'num_comments': len(user_comment_ids),
-                                                           'num_likes_given': likes_post_given + likes_comment_given,
-                                                           'num_likes_received': likes_post_received + likes_comment_received}
+                    stats = stats_by_group.get(str(group_id), UserGroupStats())
+                    response_data['stats'][group_id] = {'num_comments': stats.num_comments,
+                                                           'num_likes_given': stats.num_likes_given,
+                                                           'num_likes_received': stats.num_likes_received}
 
                 if len(time_arr) > 0:
                     response_data['time_history'] = time_arr
@@ -354,59 +330,6 @@ class GetInfoUser(generics.ListAPIView):
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         return Response({'error' : 'Bad request.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    def get_post_ids_and_user_post_ids_of_user_in_group(self, post_data, user_id, group_id):
-        post_ids = set()
-        user_post_ids = set()
-
-        for post in iter(post_data):
-            if str(post['group']) == group_id:
-                post_id = str(post['id'])
-                post_ids.add(post_id)
-
-                if str(post['creator']['id']) == user_id:
-                    user_post_ids.add(post_id)
-
-        return post_ids, user_post_ids
-
-    def get_comment_ids_and_user_comment_ids_of_user_in_posts(self, comment_data, user_id, post_ids):
-        comment_ids = set()
-        user_comment_ids = set()
-
-        for comment in iter(comment_data):
-            if str(comment['post']) in post_ids:
-                comment_id = str(comment['id'])
-                comment_ids.add(comment_id)
-
-                if comment['creator']['id'] == user_id:
-                    user_comment_ids.add(comment_id)
-        return comment_ids, user_comment_ids
-
-    def get_post_likes_given_and_received(self, post_like_data, post_ids, user_post_ids, user_id):
-        num_likes_given = 0
-        nums_like_received = 0
-
-        for like in iter(post_like_data):
-            post_id = str(like['post']['id'])
-            if post_id in user_post_ids:
-                nums_like_received += 1
-
-            if post_id in post_ids and str(like['user']['id']) == user_id:
-                num_likes_given += 1
-        return num_likes_given, nums_like_received
-
-    def get_comment_likes_given_and_received(self, comment_like_data, comment_ids, user_comment_ids, user_id):
-        num_likes_given = 0
-        nums_like_received = 0
-
-        for like in iter(comment_like_data):
-            comment_id = str(like['comment']['id'])
-            if comment_id in user_comment_ids:
-                nums_like_received += 1
-
-            if comment_id in comment_ids and str(like['user']['id']) == user_id:
-                num_likes_given += 1
-        return num_likes_given, nums_like_received
-
 
 class GetPost(generics.ListAPIView):
     queryset = ''
@@ -423,13 +346,13 @@ class GetPost(generics.ListAPIView):
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 class GetVirtualUsers(generics.ListAPIView):
-    serializer_class = UserSerializer
+    serializer_class = UserSummarySerializer
     permission_classes = (IsAuthenticated, IsSuperUser, IsTokenValid)
     def list(self, request):
         try:
             current_user = request.user
-            virtual_users = User.objects.filter(teacher=current_user, role=3)
-            serializer = self.serializer_class(virtual_users, many=True)
+            virtual_users = self.serializer_class.setup_eager_loading(User.objects.filter(teacher=current_user, role=3))
+            serializer = self.serializer_class(virtual_users, many=True, context={'fields': get_fields_param(request)})
             return Response({'data': serializer.data})
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -1,7 +1,10 @@
+import datetime
+import pytz
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
-from kidsbook.models import Group, GroupMember
+from kidsbook.models import Group, GroupMember, ScreenTime
 from kidsbook.user.views import generate_token
+from kidsbook.utils import get_period_start, usage_times
 
 
 User = get_user_model()
@@ -115,3 +118,75 @@ class TestUsers(APITestCase):
     def test_get_discoverable_users_without_token(self):
         response = self.client.get("{}/users/".format(url_prefix))
         self.assertTrue(403, response.status_code)
+
+    def test_get_discoverable_users_filtered_and_paginated(self):
+        lonely_user = User.objects.create_user(username="lonely", email_address="lonely@go.ooo", password="password")
+        hidden_user = User.objects.create_user(username="hidden", email_address="hidden@go.ooo", password="password")
+        Group.objects.create_group(name="another group", creator=hidden_user)
+        url = "{}/users/".format(url_prefix)
+
+        response = self.client.get(url, HTTP_AUTHORIZATION=self.creator_token)
+        returned_user_ids = [user['id'] for user in response.data['data']]
+        self.assertEqual(
+            sorted([str(self.user.id), str(self.member.id), str(lonely_user.id)]),
+            sorted(returned_user_ids)
+        )
+
+        response = self.client.get(url, {'name': 'LON'}, HTTP_AUTHORIZATION=self.creator_token)
+        self.assertEqual([str(lonely_user.id)], [user['id'] for user in response.data['data']])
+
+        response = self.client.get(url, {'role': 1}, HTTP_AUTHORIZATION=self.creator_token)
+        self.assertEqual([], response.data['data'])
+
+        response = self.client.get(url, {'role': 'teacher'}, HTTP_AUTHORIZATION=self.creator_token)
+        self.assertEqual(400, response.status_code)
+
+        # Newest first, 2 users per page
+        response = self.client.get(url, {'limit': 2}, HTTP_AUTHORIZATION=self.creator_token)
+        self.assertEqual([str(lonely_user.id), str(self.member.id)], [user['id'] for user in response.data['data']])
+        self.assertEqual(2, response.data['next_offset'])
+
+        response = self.client.get(url, {'limit': 2, 'offset': 2}, HTTP_AUTHORIZATION=self.creator_token)
+        self.assertEqual([str(self.user.id)], [user['id'] for user in response.data['data']])
+        self.assertNotIn('next_offset', response.data)
+
+    def test_get_discoverable_users_with_sparse_fields(self):
+        response = self.client.get(self.url, {'fields': 'username'}, HTTP_AUTHORIZATION=self.creator_token)
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(all(set(user) == {'id', 'username', 'time_history'} for user in response.data['data']))
+
+    def test_get_users_not_in_groups(self):
+        lonely_user = User.objects.create_user(username="lonely", email_address="lonely@go.ooo", password="password")
+        response = self.client.get(self.url + 'non_group/', HTTP_AUTHORIZATION=self.creator_token)
+        self.assertEqual([str(lonely_user.id), str(self.user.id)], [user['id'] for user in response.data['data']])
+
+    def test_usage_times_in_one_query(self):
+        today = datetime.datetime.now(pytz.timezone('Asia/Singapore')).date()
+        for days_ago, total_time in ((0, 10), (2, 20), (3, 5), (40, 100)):
+            ScreenTime.objects.create(user=self.user, date=today - datetime.timedelta(days=days_ago), total_time=total_time)
+        ScreenTime.objects.create(user=self.member, date=today - datetime.timedelta(days=1), total_time=7)
+
+        with self.assertNumQueries(1):
+            history = usage_times([self.user.id, self.member.id, self.creator.id], 4)
+
+        self.assertEqual([10, 0, 20, 5], history[str(self.user.id)])
+        self.assertEqual([0, 7, 0, 0], history[str(self.member.id)])
+        self.assertEqual([0, 0, 0, 0], history[str(self.creator.id)])
+
+    def test_usage_times_by_week_and_month(self):
+        today = datetime.datetime.now(pytz.timezone('Asia/Singapore')).date()
+        days = [today - datetime.timedelta(days=days_ago) for days_ago in range(60)]
+        for day in days:
+            ScreenTime.objects.create(user=self.user, date=day, total_time=1)
+
+        for period in ('week', 'month'):
+            period_starts = sorted(set(get_period_start(day, period) for day in days), reverse=True)
+            expected = [
+                len([day for day in days if get_period_start(day, period) == period_start])
+                for period_start in period_starts
+            ]
+            self.assertEqual(expected, usage_times([self.user.id], 60, period)[str(self.user.id)])
+
+    def test_usage_times_with_unknown_period(self):
+        with self.assertRaises(ValueError):
+            usage_times([self.user.id], 7, 'year')
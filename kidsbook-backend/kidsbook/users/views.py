@@ -4,30 +4,43 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, BasePermission
 from rest_framework import status, generics
 from uuid import UUID
-from itertools import chain
 
 #from kidsbook.group.serializers import GroupSerializer
 from kidsbook.serializers import *
 from kidsbook.models import *
 from kidsbook.permissions import *
 from kidsbook.utils import *
+from kidsbook.discovery import filter_users, get_discoverable_users, get_users_not_in_any_groups, get_users_page
 
 User = get_user_model()
 
 ## GROUP ##
 
+def list_users(request, users):
+    """
+    Filter the users by the params `role` and `name`, and sort them (newest first) in the database.
+    Return the users and the offset of the next page, in the paginated mode (either `limit` or `offset`).
+    """
+    users = filter_users(users, request.query_params.get('role', None), request.query_params.get('name', None))
+    users = UserSummarySerializer.setup_eager_loading(users)
+    if 'limit' in request.query_params or 'offset' in request.query_params:
+        return get_users_page(users, request.query_params.get('limit', None), request.query_params.get('offset', None))
+    return list(users.order_by('-created_at', '-id')), None
+
+def serialize_users(request, users):
+    return UserSummarySerializer(users, many=True, context={'fields': get_fields_param(request)})
+
 def get_users_not_in_groups(request):
-    """Return all created groups."""
+    """Return all users who are not in any groups."""
 
     try:
-        all_users = iter(User.objects.all())
-        users_not_in_any_groups = list(filter(
-            lambda user: not GroupMember.objects.filter(user_id=user.id).exists(), all_users
-        ))
-    except Exception:
-        return Response(status=status.HTTP_400_BAD_REQUEST)
-
-    serializer = UserSerializer(users_not_in_any_groups, many=True)
+        users, next_offset = list_users(request, get_users_not_in_any_groups())
+    except Exception as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = serialize_users(request, users)
+    if next_offset is not None:
+        return Response({'data': serializer.data, 'next_offset': next_offset})
     return Response({'data': serializer.data})
 
 @api_view(['GET'])
@@ -49,37 +62,20 @@ def users_allowed_to_be_discovered(request):
     """Return all superusers, all users in the same group or have no groups or created by the requester."""
 
     try:
-        # USERS HAVE NO GROUPS
-        all_users = iter(User.objects.all())
-        users_not_in_any_groups = list(filter(
-            lambda user: not GroupMember.objects.filter(user_id=user.id).exists(), all_users
-        ))
-
-        # ALL SUPER USERS
-        all_superusers = User.objects.filter(role=1).exclude(id=request.user.id)
-
-        # ALL USERS IN SAME GROUPS
-        group_ids = GroupMember.objects.filter(user_id=request.user.id).distinct().values_list('group_id', flat=True)
-        user_ids_in_same_groups = GroupMember.objects.filter(group_id__in=group_ids).distinct().values_list('user_id', flat=True)
-        all_users_in_same_groups = User.objects.filter(id__in=user_ids_in_same_groups).distinct().exclude(id=request.user.id)
-
-        # CREATED BY REQUESTER
-        users_created_by_requester = User.objects.filter(teacher=request.user)
-
-        # Merge and serializer
-        result_list = list(set(chain(users_not_in_any_groups, all_superusers, all_users_in_same_groups, users_created_by_requester)))
-        result_list = sorted(result_list, key=lambda instance: instance.created_at, reverse=True)
-        serializer = UserSerializer(result_list, many=True)
-
-        if('num_days' in request.data):
-            num_days = request.data['num_days']
-        else:
-            num_days = 0
-        for user in serializer.data:
-            user['time_history'] = usage_time(User.objects.get(id=user['id']), num_days)
-
-        return Response({'data': serializer.data})
+        users, next_offset = list_users(request, get_discoverable_users(request.user))
+        serializer = serialize_users(request, users)
+
+        num_days = request.data.get('num_days', 0)
+        period = request.data.get('period', 'day')
+        users_data = serializer.data
+        time_histories = usage_times([user['id'] for user in users_data], num_days, period)
+        for user in users_data:
+            user['time_history'] = time_histories[str(user['id'])]
+
+        if next_offset is not None:
+            return Response({'data': users_data, 'next_offset': next_offset})
+        return Response({'data': users_data})
     except Exception as exc:
-        Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
     return Response(status=status.HTTP_400_BAD_REQUEST)
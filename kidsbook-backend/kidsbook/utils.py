@@ -1,17 +1,97 @@
 from django.conf import settings
 import requests
 import json
+import os
+import re
+from functools import lru_cache
 from uuid import UUID
 import datetime
 import pytz
 # from profanity import profanity
-from better_profanity import profanity
+import better_profanity
 from kidsbook.models import *
 
 
-# profanity.set_censor_characters("*")
+class ProfanityEngine:
+    """
+    Censor the swear words of a word list with a single compiled regex.
+
+    The words are merged into a trie, so the text is scanned once whatever the size of the list.
+    Like `better_profanity`, every swear word is replaced by 4 censor characters,
+    and some letters also match their look-alikes ('@' for 'a', '1' for 'i', ...).
+    The censored texts are kept in an LRU cache.
+    """
+
+    CHARS_MAPPING = {
+        'a': ('a', '@', '*', '4'),
+        'i': ('i', '*', 'l', '1'),
+        'o': ('o', '*', '0', '@'),
+        'u': ('u', '*', 'v'),
+        'v': ('v', '*', 'u'),
+        'l': ('l', '1'),
+        'e': ('e', '*', '3'),
+        's': ('s', '$', '5'),
+        't': ('t', '7'),
+    }
+    # The characters a word is made of, as in `better_profanity`
+    WORD_CHARACTER = r'(?:[^\W_]|[@$*"\'])'
+
+    def __init__(self, words, censor_char='*', cache_size=4096):
+        self.replacement = censor_char * 4
+        self.regex = self.compile(words)
+        self.censor = lru_cache(maxsize=cache_size)(self._censor)
+
+    @classmethod
+    def from_better_profanity(cls, **kargs):
+        """Load the default word list of `better_profanity`."""
+        filename = os.path.join(os.path.dirname(better_profanity.__file__), 'profanity_wordlist.txt')
+        with open(filename, encoding='utf-8') as wordlist_file:
+            words = [row.strip() for row in wordlist_file if row.strip()]
+        return cls(words, **kargs)
+
+    def compile(self, words):
+        trie = {}
+        for word in words:
+            node = trie
+            for char in word.lower():
+                node = node.setdefault(char, {})
+            node[''] = True     # The end of a word
+
+        pattern = '(?<!{0})(?:{1})(?!{0})'.format(self.WORD_CHARACTER, self._trie_to_pattern(trie))
+        return re.compile(pattern, re.IGNORECASE)
+
+    def contains_profanity(self, text):
+        return self.regex.search(str(text)) is not None
+
+    def _censor(self, text):
+        return self.regex.sub(self.replacement, str(text))
+
+    def _char_to_pattern(self, char):
+        if char == ' ':
+            return r'\s*'
+        variants = self.CHARS_MAPPING.get(char, (char,))
+        if len(variants) == 1:
+            return re.escape(char)
+        return '[{}]'.format(''.join(re.escape(variant) for variant in variants))
+
+    def _trie_to_pattern(self, node):
+        alternatives = [
+            self._char_to_pattern(char) + self._trie_to_pattern(child)
+            for char, child in sorted(node.items())
+            if char != ''
+        ]
+        if not alternatives:
+            return ''
+
+        pattern = alternatives[0] if len(alternatives) == 1 else '(?:{})'.format('|'.join(alternatives))
+        if '' in node:
+            # A shorter word ends here: the rest is optional
+            return '(?:{})?'.format(pattern)
+        return pattern
+
+
 # Pre-load the censor words
-profanity.load_censor_words()
+profanity = ProfanityEngine.from_better_profanity()
 
 class UUIDEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -32,22 +112,9 @@ def clean_data_iterative(data, *args):
     return data
 
 def push_notification(send_data: dict):
-    send_data['secretKey'] = getattr(settings, "NOTIFICATION_SECRET_KEY", None)
-    url = getattr(settings, "NOTIFICATION_ENDPOINT", None)
-    headers = {
-        'Content-type': 'application/json',
-        'Connection': 'close'
-    }
-
-    try:
-        response = requests.post(
-                        url,
-                        data=json.dumps(send_data, cls=UUIDEncoder),
-                        headers=headers,
-                        timeout=2       # 2 seconds
-                    )
-    except Exception:
-        pass
+    # Imported here, as the push client depends on this module
+    from kidsbook.notification.push import get_push_client
+    get_push_client().push(send_data)
 
 def censor(text: str):
     return profanity.censor(text)
@@ -55,14 +122,42 @@ def censor(text: str):
 def contains_profanity(text: str):
     return profanity.contains_profanity(text)
 
-def usage_time(user, num_days):
-  arr = []
-  tz = pytz.timezone('Asia/Singapore')
-  for i in range(num_days):
-    day = (datetime.datetime.now(tz) - datetime.timedelta(days=i)).date()
-    if(ScreenTime.objects.filter(user=user, date=day)):
-      time = ScreenTime.objects.get(user=user, date=day).total_time
-    else:
-      time = 0
-    arr.append(time)
-  return arr
+SCREEN_TIME_PERIODS = ('day', 'week', 'month')
+
+def get_period_start(day, period='day'):
+    """Return the first day of the day, week (starting on Monday) or month of `day`."""
+    if period == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+def usage_times(user_ids, num_days, period='day'):
+    """
+    Return the screen time of the users over the last `num_days` days, keyed by user ID.
+
+    The screen times are summed by day, week or month (`period`), the most recent first,
+    and the periods without any screen time are 0.
+    All the users are fetched with a single query.
+    """
+    if period not in SCREEN_TIME_PERIODS:
+        raise ValueError("Param 'period' must be one of: {}.".format(', '.join(SCREEN_TIME_PERIODS)))
+
+    tz = pytz.timezone('Asia/Singapore')
+    today = datetime.datetime.now(tz).date()
+    days = [today - datetime.timedelta(days=i) for i in range(int(num_days))]
+    period_starts = list(dict.fromkeys(get_period_start(day, period) for day in days))
+
+    history = {str(user_id): dict.fromkeys(period_starts, 0) for user_id in user_ids}
+    if days and history:
+        screen_times = ScreenTime.objects.filter(
+            user_id__in=list(history),
+            date__range=(days[-1], today)
+        ).values_list('user_id', 'date', 'total_time')
+        for user_id, date, total_time in screen_times:
+            history[str(user_id)][get_period_start(date, period)] += total_time
+
+    return {user_id: list(totals.values()) for user_id, totals in history.items()}
+
+def usage_time(user, num_days, period='day'):
+    return usage_times([user.id], num_days, period)[str(user.id)]